@@ -0,0 +1,685 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+效能測試腳本
+Benchmark Script for Bulk File Renamer
+
+用法:
+    python benchmark.py run --count 100000 --distribution camera --output base.json
+    python benchmark.py compare base.json new.json --threshold 0.1
+    python benchmark.py media_date --count 50000
+    python benchmark.py natural_sort --count 1000000
+    python benchmark.py deep_path --count 20000 --depth 40
+    python benchmark.py live_preview --count 100000
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import struct
+import threading
+import shutil
+import platform
+import argparse
+import tempfile
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+# 添加源碼路徑
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from file_renamer import FileRenamer, RenameRule
+from instrumentation import Instrumentation, OsCallCounter, read_io_syscalls
+from media_date import read_media_dates
+from sorting import sort_files
+import executor
+from executor import DIR_FD_SUPPORTED
+from utils import gc_paused
+from gui.preview_panel import build_preview_rows
+
+# 合成檔名分布
+NAME_DISTRIBUTIONS = ['sequential', 'camera', 'random', 'unicode']
+
+def make_bench_dir() -> str:
+    """在 tmpfs（若有）上建立測試目錄"""
+    base_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+    return tempfile.mkdtemp(prefix="bulk_renamer_bench_", dir=base_dir)
+
+@contextmanager
+def isolated_cwd():
+    """
+    在暫時的工作目錄中執行
+
+    FileRenamer 從目前目錄讀取 settings.json，執行與復原時寫入 history.json，
+    效能測試不應讀取或覆寫使用者的設定與歷史記錄。
+    """
+    work_dir = tempfile.mkdtemp(prefix="bulk_renamer_work_")
+    original_cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        yield work_dir
+    finally:
+        os.chdir(original_cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def generate_names(count: int, distribution: str, seed: int = 42):
+    """依分布產生不重複的合成檔名"""
+    rng = random.Random(seed)
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    cjk = '照片影片文件資料報告會議旅行家庭'
+
+    for i in range(count):
+        if distribution == 'sequential':
+            yield f"file_{i:07d}.txt"
+        elif distribution == 'camera':
+            prefix = rng.choice(["IMG_", "DSC", "PXL_", "MVI_"])
+            ext = rng.choice([".JPG", ".jpg", ".png", ".HEIC", ".mp4"])
+            yield f"{prefix}{i}{ext}"
+        elif distribution == 'random':
+            word = ''.join(rng.choice(letters) for _ in range(rng.randint(5, 40)))
+            yield f"{word}_{i}.{rng.choice(['txt', 'dat', 'log', 'csv'])}"
+        elif distribution == 'unicode':
+            word = ''.join(rng.choice(cjk) for _ in range(rng.randint(2, 8)))
+            yield f"{word}_{i}_{rng.choice(letters)}.{rng.choice(['jpg', 'pdf', 'docx'])}"
+        else:
+            raise ValueError(f"未知的檔名分布: {distribution}")
+
+def create_files(directory: str, count: int, distribution: str):
+    """建立空的合成檔案"""
+    for name in generate_names(count, distribution):
+        with open(os.path.join(directory, name), 'wb'):
+            pass
+
+def peak_rss_kb() -> int:
+    """行程的最高常駐記憶體（KB，無法取得時返回 0）"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS 以位元組為單位
+        return peak // 1024 if sys.platform == 'darwin' else peak
+    except ImportError:
+        return 0
+
+def measure_stage(name: str, func, trace_memory: bool = False,
+                  instrumentation: Instrumentation = None) -> dict:
+    """
+    執行單一階段並記錄時間、記憶體與呼叫次數
+
+    ru_maxrss 是整個行程至今的最高 RSS，無法得知單一階段的峰值；這裡只記錄此階段讓它
+    增加了多少（rss_growth_kb，0 表示未超過先前的峰值）。單一階段實際配置的峰值請用
+    trace_memory 的 traced_peak_kb，行程的最高 RSS 在整次執行結束時記錄一次。
+    """
+    if instrumentation is not None:
+        instrumentation.reset()
+    if trace_memory:
+        tracemalloc.start()
+    io_before = read_io_syscalls()
+    rss_before = peak_rss_kb()
+
+    with OsCallCounter() as counter:
+        start = time.perf_counter()
+        items = func()
+        elapsed = time.perf_counter() - start
+
+    result = {
+        'seconds': elapsed,
+        'items': items,
+        'items_per_second': items / elapsed if elapsed > 0 else 0.0,
+        'os_calls': dict(counter.counts),
+        'io_syscalls': read_io_syscalls() - io_before,
+        'rss_growth_kb': peak_rss_kb() - rss_before
+    }
+    if instrumentation is not None:
+        # FileRenamer 內部各子階段的耗時
+        result['breakdown'] = {stage_name: stage.to_dict()
+                               for stage_name, stage in instrumentation.stages.items()}
+    if trace_memory:
+        result['traced_peak_kb'] = tracemalloc.get_traced_memory()[1] // 1024
+        tracemalloc.stop()
+
+    print(f"  {name:<8} {elapsed:8.3f} 秒  {items:>9} 項  "
+          f"os 呼叫 {sum(counter.counts.values()):>9}  RSS 峰值 +{result['rss_growth_kb']} KB")
+    return result
+
+def bench_core(count: int, distribution: str, trace_memory: bool = False) -> dict:
+    """依序測試 FileRenamer 的各個階段"""
+    print("=" * 50)
+    print(f"核心流程 - {count} 個檔案（{distribution}）")
+    print("=" * 50)
+
+    test_dir = make_bench_dir()
+
+    try:
+        create_files(test_dir, count, distribution)
+        # 在獨立的工作目錄執行，避免覆寫使用者的 settings.json 與 history.json
+        with isolated_cwd():
+            renamer = FileRenamer()
+            renamer.instrumentation = Instrumentation()
+            stages = {}
+
+            def scan():
+                renamer.set_source_directory(test_dir)
+                return len(renamer.files_list)
+
+            def apply_filter():
+                extensions = {os.path.splitext(name)[1].lower()
+                              for name in generate_names(min(count, 100), distribution)}
+                renamer.set_file_filters(sorted(extensions)[:2])
+                return len(renamer.filtered_files)
+
+            preview_results = []
+
+            def preview():
+                renamer.set_file_filters([])
+                rule = RenameRule()
+                rule.rule_type = "prefix"
+                rule.prefix = "bench_"
+                renamer.add_rename_rule(rule)
+                preview_results[:] = renamer.preview_rename()
+                return len(preview_results)
+
+            def execute():
+                success_count, error_count, errors = renamer.execute_rename(preview_results)
+                return success_count
+
+            def undo():
+                success_count, error_count, errors = renamer.undo_operation(len(renamer.history) - 1)
+                return success_count
+
+            for name, func in [('scan', scan), ('filter', apply_filter), ('preview', preview),
+                               ('execute', execute), ('undo', undo)]:
+                stages[name] = measure_stage(name, func, trace_memory, renamer.instrumentation)
+
+            return stages
+
+    finally:
+        shutil.rmtree(test_dir, ignore_errors=True)
+
+def run_benchmarks(counts, distribution: str, output: str, trace_memory: bool = False):
+    """執行核心流程效能測試並寫出 JSON 結果"""
+    results = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'distribution': distribution,
+            'trace_memory': trace_memory
+        },
+        'runs': {}
+    }
+
+    for count in counts:
+        results['runs'][str(count)] = bench_core(count, distribution, trace_memory)
+
+    # 整個行程的最高 RSS（包含所有檔案數量的執行），只記錄一次
+    results['meta']['peak_rss_kb'] = peak_rss_kb()
+    print(f"\n行程最高 RSS: {results['meta']['peak_rss_kb']} KB")
+
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\n結果已寫入: {output}")
+
+def compare_results(baseline_file: str, current_file: str, threshold: float) -> int:
+    """
+    比較兩次效能測試結果
+
+    Returns:
+        int: 發現退步時返回 1，否則返回 0
+    """
+    with open(baseline_file, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(current_file, 'r', encoding='utf-8') as f:
+        current = json.load(f)
+
+    regressions = 0
+    print(f"{'檔案數':>8} {'階段':<8} {'基準(秒)':>10} {'目前(秒)':>10} {'變化':>8}")
+
+    for count, stages in current['runs'].items():
+        base_stages = baseline['runs'].get(count)
+        if base_stages is None:
+            continue
+
+        for stage, result in stages.items():
+            base_result = base_stages.get(stage)
+            if base_result is None or base_result['seconds'] <= 0:
+                continue
+
+            change = result['seconds'] / base_result['seconds'] - 1
+            flag = ""
+            if change > threshold:
+                flag = "  ⚠️ 退步"
+                regressions += 1
+            print(f"{count:>8} {stage:<8} {base_result['seconds']:>10.3f} "
+                  f"{result['seconds']:>10.3f} {change:>+8.1%}{flag}")
+
+    if regressions:
+        print(f"\n發現 {regressions} 項超過 {threshold:.0%} 的退步")
+        return 1
+
+    print("\n沒有超過門檻的退步")
+    return 0
+
+def make_exif_jpeg(capture_time: datetime, payload_size: int = 16384) -> bytes:
+    """產生含 EXIF DateTimeOriginal 的合成 JPEG"""
+    date_bytes = capture_time.strftime("%Y:%m:%d %H:%M:%S").encode('ascii') + b'\x00'
+
+    # TIFF 標頭 + IFD0（僅 ExifIFD 指標）+ Exif IFD（DateTimeOriginal）+ 日期字串
+    ifd0_offset = 8
+    exif_ifd_offset = ifd0_offset + 2 + 12 + 4
+    date_offset = exif_ifd_offset + 2 + 12 + 4
+    tiff = b'II*\x00' + struct.pack('<I', ifd0_offset)
+    tiff += struct.pack('<H', 1) + struct.pack('<HHII', 0x8769, 4, 1, exif_ifd_offset) + b'\x00' * 4
+    tiff += struct.pack('<H', 1) + struct.pack('<HHII', 0x9003, 2, len(date_bytes), date_offset) + b'\x00' * 4
+    tiff += date_bytes
+
+    app1 = b'Exif\x00\x00' + tiff
+    jfif = b'JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00'
+
+    data = b'\xff\xd8'
+    data += b'\xff\xe0' + struct.pack('>H', len(jfif) + 2) + jfif
+    data += b'\xff\xe1' + struct.pack('>H', len(app1) + 2) + app1
+    data += b'\xff\xda' + struct.pack('>H', 8) + b'\x00' * 6
+    data += os.urandom(payload_size)
+    data += b'\xff\xd9'
+    return data
+
+def bench_media_date(count: int, payload_size: int, workers: int = None):
+    """拍攝日期解析效能測試"""
+    print("=" * 50)
+    print(f"拍攝日期解析 - {count} 個 JPEG")
+    print("=" * 50)
+
+    test_dir = make_bench_dir()
+
+    try:
+        start = datetime(2024, 1, 1)
+        files = []
+        for i in range(count):
+            filepath = os.path.join(test_dir, f"IMG_{i:06d}.jpg")
+            with open(filepath, 'wb') as f:
+                f.write(make_exif_jpeg(start + timedelta(minutes=i), payload_size))
+            files.append({'original_name': os.path.basename(filepath), 'full_path': filepath})
+
+        file_size = os.path.getsize(files[0]['full_path'])
+        dates, stats = read_media_dates(files, max_workers=workers)
+
+        print(f"檔案大小: {file_size} B")
+        print(f"找到日期: {stats['found']}/{stats['files']}")
+        print(f"每檔讀取: {stats['bytes_per_file']:.0f} B（{stats['bytes_per_file'] / file_size:.2%}）")
+        print(f"總時間: {stats['seconds']:.3f} 秒（{count / stats['seconds']:.0f} 檔/秒）")
+
+    finally:
+        shutil.rmtree(test_dir, ignore_errors=True)
+
+def bench_natural_sort(count: int):
+    """自然排序效能測試"""
+    print("=" * 50)
+    print(f"自然排序 - {count} 個檔名")
+    print("=" * 50)
+
+    rng = random.Random(42)
+    prefixes = ["IMG_", "DSC", "file", "Scan ", "clip-"]
+    files_list = [{
+        'original_name': f"{rng.choice(prefixes)}{rng.randint(1, 999999)}_{rng.randint(1, 99)}.jpg",
+        'size': rng.randint(1, 10 ** 7),
+        'modified': datetime(2024, 1, 1),
+        'mtime_ns': rng.randint(0, 10 ** 18)
+    } for _ in range(count)]
+
+    start = time.perf_counter()
+    files_list.sort(key=lambda x: x['original_name'].lower())
+    print(f"原本的 lower() 排序: {time.perf_counter() - start:.3f} 秒")
+
+    start = time.perf_counter()
+    sort_files(files_list, 'natural')
+    print(f"自然排序（首次，計算排序鍵）: {time.perf_counter() - start:.3f} 秒")
+
+    sort_files(files_list, 'size')
+    start = time.perf_counter()
+    sort_files(files_list, 'natural')
+    print(f"自然排序（重用快取排序鍵）: {time.perf_counter() - start:.3f} 秒")
+
+def bench_deep_path(count: int, depth: int, root: str = None):
+    """比較完整路徑與 dir_fd 相對操作在深層目錄中的耗時"""
+    print("=" * 50)
+    print(f"深層路徑 - {count} 個檔案, 深度 {depth}")
+    print("=" * 50)
+
+    if not DIR_FD_SUPPORTED:
+        print("此平台不支援 dir_fd，略過")
+        return
+
+    base_dir = tempfile.mkdtemp(prefix="bulk_renamer_deep_", dir=root or make_bench_dir())
+    try:
+        directory = base_dir
+        for level in range(depth):
+            directory = os.path.join(directory, f"level_{level:03d}_" + "x" * 24)
+        os.makedirs(directory)
+        print(f"路徑長度: {len(directory)} 字元")
+
+        names = [f"file_{i:07d}.dat" for i in range(count)]
+        for name in names:
+            open(os.path.join(directory, name), 'wb').close()
+        paths = [os.path.join(directory, name) for name in names]
+
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            def timed(func):
+                start = time.perf_counter()
+                func()
+                return time.perf_counter() - start
+
+            def scan(target):
+                with os.scandir(target) as entries:
+                    for entry in entries:
+                        entry.stat()
+
+            rows = [
+                ("stat", timed(lambda: [os.stat(path) for path in paths]),
+                 timed(lambda: [os.stat(name, dir_fd=fd) for name in names])),
+                ("scandir + stat", timed(lambda: scan(directory)), timed(lambda: scan(fd))),
+                ("rename", timed(lambda: [os.rename(path, path + ".a") for path in paths]),
+                 timed(lambda: [os.rename(name + ".a", name, src_dir_fd=fd, dst_dir_fd=fd)
+                                for name in names])),
+            ]
+        finally:
+            os.close(fd)
+
+        print(f"{'操作':<16}{'完整路徑(秒)':>14}{'dir_fd(秒)':>14}{'加速':>8}")
+        for label, absolute, relative in rows:
+            print(f"{label:<16}{absolute:>14.3f}{relative:>14.3f}{absolute / relative:>8.2f}x")
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+def bench_live_preview(count: int, target_ms: float = 150.0):
+    """即時預覽：每次輸入後重新過濾、套用規則並格式化資料列的延遲"""
+    print("=" * 50)
+    print(f"即時預覽 - {count} 個檔案, 目標 {target_ms:.0f} ms")
+    print("=" * 50)
+
+    test_dir = make_bench_dir()
+    try:
+        with isolated_cwd():
+            create_files(test_dir, count, 'camera')
+            renamer = FileRenamer()
+            renamer.set_source_directory(test_dir)
+
+            committed = RenameRule()
+            committed.rule_type = "case"
+            committed.case_option = "lower"
+            renamer.add_rename_rule(committed)
+
+            def update(label, rules, filters=None):
+                start = time.perf_counter()
+                if filters is not None:
+                    renamer.set_file_filters(filters)
+                preview_results = renamer.preview_rename(rules)
+                with gc_paused():
+                    build_preview_rows(preview_results)
+                elapsed = (time.perf_counter() - start) * 1000
+                mark = "✅" if elapsed <= target_ms else "⚠️"
+                print(f"{mark} {label:<28}{len(preview_results):>8} 筆 {elapsed:>8.1f} ms")
+
+            update("首次預覽", renamer.rename_rules)
+
+            # 在編輯中的替換規則輸入 "img"，每個按鍵只需重算最後一條規則
+            for typed in ("i", "im", "img"):
+                draft = RenameRule()
+                draft.rule_type = "replace"
+                draft.find_text = typed
+                draft.replace_text = "photo"
+                update(f"草稿規則: '{typed}'", [*renamer.rename_rules, draft])
+
+            update("過濾: .jpg", [*renamer.rename_rules, draft], ['.jpg'])
+            update("過濾: .jpg,.png", [*renamer.rename_rules, draft], ['.jpg', '.png'])
+            update("清除過濾", [*renamer.rename_rules, draft], [])
+
+    finally:
+        shutil.rmtree(test_dir, ignore_errors=True)
+
+class SlowStorage:
+    """
+    模擬共用 NAS 的中繼資料伺服器：同時進行的操作超過 capacity 時開始排隊，
+    每個重命名的延遲為 base_ms * max(1, 同時操作數 / capacity)
+    """
+
+    def __init__(self, base_ms: float, capacity: int):
+        self.base = base_ms / 1000
+        self.capacity = capacity
+        self.in_flight = 0
+        self.latencies = []
+        self._lock = threading.Lock()
+        self._original = executor.DirectoryHandles.rename
+
+    def __enter__(self):
+        storage = self
+        original = self._original
+
+        def rename(handles, src, dst, no_clobber=False):
+            with storage._lock:
+                storage.in_flight += 1
+                load = storage.in_flight / storage.capacity
+            start = time.perf_counter()
+            try:
+                time.sleep(storage.base * max(1.0, load))
+                original(handles, src, dst, no_clobber)
+            finally:
+                with storage._lock:
+                    storage.in_flight -= 1
+                    storage.latencies.append(time.perf_counter() - start)
+
+        executor.DirectoryHandles.rename = rename
+        return self
+
+    def __exit__(self, *exc_info):
+        executor.DirectoryHandles.rename = self._original
+
+    def p95_ms(self) -> float:
+        latencies = sorted(self.latencies)
+        return latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0
+
+
+def bench_throttle(count: int, base_ms: float, capacity: int, slo_ms: float, max_ops: float):
+    """節流：以注入延遲的模擬儲存裝置比較固定執行緒數、自適應同時操作數與每秒上限"""
+    print("=" * 50)
+    print(f"節流 - {count} 個檔案, 基本延遲 {base_ms} ms, 容量 {capacity}, 延遲目標 {slo_ms} ms")
+    print("=" * 50)
+
+    configs = [
+        ("固定 1 個執行緒", {'max_workers': 1}),
+        ("固定 32 個執行緒", {'max_workers': 32}),
+        (f"延遲目標 {slo_ms:g} ms", {'max_workers': 1, 'latency_slo_ms': slo_ms}),
+        (f"每秒 {max_ops:g} 個", {'max_workers': 32, 'max_ops_per_second': max_ops}),
+    ]
+    test_dir = make_bench_dir()
+    try:
+        with isolated_cwd():
+            for label, settings in configs:
+                create_files(test_dir, count, 'sequential')
+                renamer = FileRenamer()
+                renamer.set_source_directory(test_dir)
+                for key, value in settings.items():
+                    setattr(renamer, key, value)
+                rule = RenameRule()
+                rule.rule_type = "prefix"
+                rule.prefix = "t_"
+                renamer.add_rename_rule(rule)
+                preview_results = renamer.preview_rename()
+
+                with SlowStorage(base_ms, capacity) as storage:
+                    start = time.perf_counter()
+                    success_count, error_count, errors = renamer.execute_rename(preview_results)
+                    elapsed = time.perf_counter() - start
+
+                stats = renamer.last_throttle_stats
+                limit = f"  同時 {stats['limit']}" if 'limit' in stats else ""
+                print(f"{label:<20}{success_count / elapsed:>10.0f} 次/秒   p95 {storage.p95_ms():>7.2f} ms{limit}")
+                renamer.history = ()
+                shutil.rmtree(test_dir)
+                os.makedirs(test_dir)
+    finally:
+        shutil.rmtree(test_dir, ignore_errors=True)
+
+def drop_caches() -> bool:
+    """寫回並清除頁面快取（需要 root），失敗時返回 False"""
+    os.sync()
+    try:
+        with open('/proc/sys/vm/drop_caches', 'w') as f:
+            f.write('3\n')
+        return True
+    except OSError:
+        return False
+
+
+def bench_locality(count: int, root: str = None, repeat: int = 3):
+    """執行順序：顯示順序與依 inode 順序在冷快取下的重命名速度（兩者交替先執行）"""
+    print("=" * 50)
+    print(f"執行順序 - {count} 個檔案")
+    print("=" * 50)
+
+    # 預設放在磁碟上（tmpfs 沒有目錄區塊，看不出差異）；之後會切換工作目錄，使用絕對路徑
+    test_dir = os.path.abspath(tempfile.mkdtemp(prefix="bulk_renamer_bench_", dir=root))
+    print(f"檔案系統: {test_dir}")
+    cold = True
+    rates = {"顯示順序": [], "inode 順序": []}
+    try:
+        with isolated_cwd():
+            create_files(test_dir, count, 'random')
+            for attempt in range(repeat):
+                modes = [("顯示順序", False), ("inode 順序", True)]
+                for label, locality in (modes if attempt % 2 == 0 else modes[::-1]):
+                    renamer = FileRenamer()
+                    renamer.locality_order = locality
+                    renamer.set_source_directory(test_dir)
+                    rule = RenameRule()
+                    rule.rule_type = "prefix"
+                    rule.prefix = f"{attempt}{int(locality)}_"
+                    renamer.add_rename_rule(rule)
+                    preview_results = renamer.preview_rename()
+
+                    cold = drop_caches() and cold
+                    start = time.perf_counter()
+                    success_count, error_count, errors = renamer.execute_rename(preview_results)
+                    elapsed = time.perf_counter() - start
+                    rates[label].append(success_count / elapsed)
+                    print(f"{label:<10}{success_count / elapsed:>10.0f} 次/秒  ({elapsed:.2f} 秒)")
+                    renamer.history = ()
+            for label, values in rates.items():
+                print(f"{label} 中位數: {sorted(values)[len(values) // 2]:.0f} 次/秒")
+            if not cold:
+                print("⚠️ 無法清除頁面快取（需要 root），以上為熱快取的結果")
+    finally:
+        shutil.rmtree(test_dir, ignore_errors=True)
+
+def bench_durability(count: int, root: str = None, sync_every: int = 1000):
+    """耐久性模式：none、batch、strict 的重命名速度與 fsync 次數"""
+    print("=" * 50)
+    print(f"耐久性模式 - {count} 個檔案, batch 每 {sync_every} 個操作 fsync")
+    print("=" * 50)
+
+    # tmpfs 上 fsync 不做任何事，預設放在磁碟上；之後會切換工作目錄，使用絕對路徑
+    test_dir = os.path.abspath(tempfile.mkdtemp(prefix="bulk_renamer_bench_", dir=root))
+    print(f"檔案系統: {test_dir}")
+    try:
+        with isolated_cwd():
+            create_files(test_dir, count, 'sequential')
+            os.sync()
+            baseline = None
+            for mode in ('none', 'batch', 'strict'):
+                renamer = FileRenamer()
+                renamer.durability = mode
+                renamer.sync_every = sync_every
+                renamer.set_source_directory(test_dir)
+                rule = RenameRule()
+                rule.rule_type = "prefix"
+                rule.prefix = f"{mode}_"
+                renamer.add_rename_rule(rule)
+                preview_results = renamer.preview_rename()
+
+                start = time.perf_counter()
+                success_count, error_count, errors = renamer.execute_rename(preview_results)
+                elapsed = time.perf_counter() - start
+                rate = success_count / elapsed
+                baseline = baseline or rate
+                stats = renamer.last_sync_stats
+                print(f"{mode:<8}{rate:>10.0f} 次/秒  ({rate / baseline:>5.0%})  "
+                      f"fsync {stats['syncs']:>6} 次  committed={stats['committed']}")
+                renamer.history = ()
+                os.sync()
+    finally:
+        shutil.rmtree(test_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="批量檔案重命名工具效能測試")
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    run_parser = subparsers.add_parser('run', help="核心流程（掃描、過濾、預覽、執行、復原）")
+    run_parser.add_argument('--count', type=int, nargs='+', default=[10000])
+    run_parser.add_argument('--distribution', choices=NAME_DISTRIBUTIONS, default='sequential')
+    run_parser.add_argument('--output', default='benchmark_results.json')
+    run_parser.add_argument('--trace-memory', action='store_true',
+                            help="以 tracemalloc 記錄各階段的 Python 記憶體高峰（較慢）")
+
+    compare_parser = subparsers.add_parser('compare', help="比較兩次結果")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.1,
+                                help="視為退步的時間增加比例（預設 0.1 = 10%%）")
+
+    media_parser = subparsers.add_parser('media_date', help="拍攝日期解析")
+    media_parser.add_argument('--count', type=int, default=50000)
+    media_parser.add_argument('--payload-size', type=int, default=16384)
+    media_parser.add_argument('--workers', type=int, default=None)
+
+    sort_parser = subparsers.add_parser('natural_sort', help="自然排序")
+    sort_parser.add_argument('--count', type=int, default=1000000)
+
+    deep_parser = subparsers.add_parser('deep_path', help="深層目錄中的完整路徑與 dir_fd 操作")
+    deep_parser.add_argument('--count', type=int, default=20000)
+    deep_parser.add_argument('--depth', type=int, default=40)
+    deep_parser.add_argument('--root', default=None, help="測試目錄位置（例如 NFS 掛載點）")
+
+    live_parser = subparsers.add_parser('live_preview', help="即時預覽每次輸入後的更新延遲")
+    live_parser.add_argument('--count', type=int, default=100000)
+    live_parser.add_argument('--target-ms', type=float, default=150.0)
+
+    throttle_parser = subparsers.add_parser('throttle', help="節流與自適應同時操作數（模擬延遲）")
+    throttle_parser.add_argument('--count', type=int, default=3000)
+    throttle_parser.add_argument('--base-ms', type=float, default=2.0, help="單一操作的基本延遲")
+    throttle_parser.add_argument('--capacity', type=int, default=4, help="模擬儲存裝置可同時處理的操作數")
+    throttle_parser.add_argument('--slo-ms', type=float, default=5.0)
+    throttle_parser.add_argument('--max-ops', type=float, default=500.0)
+
+    locality_parser = subparsers.add_parser('locality', help="依 inode 順序執行與顯示順序的比較（冷快取）")
+    locality_parser.add_argument('--count', type=int, default=50000)
+    locality_parser.add_argument('--root', default=None, help="測試目錄位置（例如 ext4、XFS 或 NFS 掛載點）")
+    locality_parser.add_argument('--repeat', type=int, default=3)
+
+    durability_parser = subparsers.add_parser('durability', help="耐久性模式的吞吐量")
+    durability_parser.add_argument('--count', type=int, default=5000)
+    durability_parser.add_argument('--root', default=None, help="測試目錄位置（需為實體磁碟）")
+    durability_parser.add_argument('--sync-every', type=int, default=1000)
+
+    args = parser.parse_args()
+
+    if args.benchmark == 'run':
+        run_benchmarks(args.count, args.distribution, args.output, args.trace_memory)
+    elif args.benchmark == 'compare':
+        sys.exit(compare_results(args.baseline, args.current, args.threshold))
+    elif args.benchmark == 'media_date':
+        bench_media_date(args.count, args.payload_size, args.workers)
+    elif args.benchmark == 'natural_sort':
+        bench_natural_sort(args.count)
+    elif args.benchmark == 'deep_path':
+        bench_deep_path(args.count, args.depth, args.root)
+    elif args.benchmark == 'live_preview':
+        bench_live_preview(args.count, args.target_ms)
+    elif args.benchmark == 'throttle':
+        bench_throttle(args.count, args.base_ms, args.capacity, args.slo_ms, args.max_ops)
+    elif args.benchmark == 'locality':
+        bench_locality(args.count, args.root, args.repeat)
+    elif args.benchmark == 'durability':
+        bench_durability(args.count, args.root, args.sync_every)
@@ -8,21 +8,19 @@ Bulk File Renamer Tool
 支援多種重命名規則和預覽功能
 """
 
-import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
 import os
 import sys
-import json
-from datetime import datetime
 
 # 添加 src 目錄到 Python 路徑
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
-from file_renamer import FileRenamer
-from gui.main_window import MainWindow
-
 def main():
     """主程式入口點"""
+    # 介面相關模組只在啟動介面時匯入，無介面模式不需要 tkinter
+    import tkinter as tk
+    from tkinter import messagebox
+    from gui.main_window import MainWindow
+    
     try:
         # 創建主視窗
         root = tk.Tk()
@@ -44,4 +42,9 @@ def main():
         sys.exit(1)
 
 if __name__ == "__main__":
+    # 無介面模式: python main.py --headless DIRECTORY ...
+    if len(sys.argv) > 1 and sys.argv[1] == "--headless":
+        from cli import main as headless_main
+        sys.exit(headless_main(sys.argv[2:]))
+    
     main()
\ No newline at end of file
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+非同步介面
+asyncio facade for FileRenamer
+
+在 asyncio 服務中使用 FileRenamer：阻塞的掃描、預覽與重命名在執行緒中進行，
+事件迴圈不會被大目錄卡住。多個目錄各用一個 AsyncFileRenamer，並共用同一個
+Semaphore 限制同時進行的檔案系統操作數量。
+
+    limit = asyncio.Semaphore(4)
+    renamer = AsyncFileRenamer(semaphore=limit)
+    await renamer.scan("/data/inbox")
+    async for chunk in renamer.preview(rules):
+        ...
+    await renamer.execute()
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Executor, TimeoutError as FutureTimeoutError
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+try:
+    from .file_renamer import FileRenamer, RenameRule
+except ImportError:  # 以 src 目錄直接匯入時（test.py、main.py）
+    from file_renamer import FileRenamer, RenameRule
+
+
+class AsyncFileRenamer:
+    """
+    FileRenamer 的非同步包裝
+
+    同一個實例的操作依序進行（FileRenamer 的狀態不能同時被兩個執行緒修改）。
+    取消執行中的工作時，預覽會在下一個檢查點中止；掃描、重命名與復原無法中途停止，
+    會等它們在背景完成後才引發 CancelledError，之後的操作不會看到修改到一半的狀態。
+    """
+
+    def __init__(self, renamer: Optional[FileRenamer] = None,
+                 semaphore: Optional[asyncio.Semaphore] = None, max_blocking: int = 4,
+                 executor: Optional[Executor] = None):
+        """
+        Args:
+            renamer: 要包裝的 FileRenamer，None 表示建立新的
+            semaphore: 限制同時進行的阻塞操作，多個實例可共用
+            max_blocking: 未指定 semaphore 時的同時操作上限
+            executor: 執行阻塞操作的執行器，None 表示事件迴圈的預設執行器
+        """
+        self.renamer = renamer or FileRenamer()
+        self.semaphore = semaphore or asyncio.Semaphore(max_blocking)
+        self.executor = executor
+        self._lock = asyncio.Lock()
+
+    async def _run(self, func: Callable, *args, cancel_event: Optional[threading.Event] = None):
+        """在執行緒中執行阻塞操作"""
+        async with self._lock, self.semaphore:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self.executor, func, *args)
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if cancel_event is not None:
+                    cancel_event.set()
+                # 等背景執行緒結束再釋放鎖
+                await asyncio.wait([future])
+                raise
+
+    async def scan(self, directory: Optional[str] = None) -> bool:
+        """
+        掃描目錄
+
+        Args:
+            directory: 新的來源目錄，None 表示重新掃描目前的目錄
+
+        Returns:
+            bool: 目錄是否可讀取
+        """
+        if directory is None:
+            await self._run(self.renamer.refresh_files_list)
+            return True
+        return await self._run(self.renamer.set_source_directory, directory)
+
+    async def set_file_filters(self, filters: List[str]):
+        """設定檔案過濾器"""
+        await self._run(self.renamer.set_file_filters, filters)
+
+    async def preview(self, rules: Optional[List[RenameRule]] = None,
+                      chunk_size: int = 1000, max_pending: int = 2) -> AsyncIterator[List[Dict]]:
+        """
+        預覽重命名結果，分段產生
+
+        預覽在執行緒中計算，每比對完 chunk_size 筆就交給事件迴圈，不必等整個目錄完成。
+        最多 max_pending 段等待消費；消費者較慢時背景執行緒會暫停（背壓）。
+        取消或提前結束迭代會讓預覽在下一段中止。
+
+        Args:
+            rules: 要預覽的規則，None 表示目前的規則列表
+            chunk_size: 每段的筆數
+            max_pending: 尚未被消費的段數上限
+
+        Yields:
+            List[Dict]: 一段預覽結果
+        """
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue(maxsize=max_pending)
+        cancel_event = threading.Event()
+
+        def put(item):
+            # 在背景執行緒中呼叫：佇列已滿時等待消費者，消費者已離開時放棄
+            future = asyncio.run_coroutine_threadsafe(chunks.put(item), loop)
+            while True:
+                try:
+                    return future.result(timeout=0.1)
+                except FutureTimeoutError:
+                    if cancel_event.is_set():
+                        future.cancel()
+                        return
+
+        def run():
+            try:
+                self.renamer.preview_rename(rules, cancel_event.is_set,
+                                            on_chunk=lambda chunk: put(('chunk', chunk)),
+                                            chunk_size=chunk_size)
+            except Exception as e:
+                put(('error', e))
+            else:
+                put(('done', None))
+
+        async with self._lock, self.semaphore:
+            future = loop.run_in_executor(self.executor, run)
+            try:
+                while True:
+                    kind, value = await chunks.get()
+                    if kind == 'error':
+                        raise value
+                    if kind == 'done':
+                        break
+                    yield value
+            finally:
+                # 取消或提前結束時讓預覽中止，等背景執行緒結束再釋放鎖
+                cancel_event.set()
+                await asyncio.wait([future])
+
+    async def preview_all(self, rules: Optional[List[RenameRule]] = None) -> List[Dict]:
+        """預覽重命名結果，一次返回全部"""
+        preview_results = []
+        async for chunk in self.preview(rules):
+            preview_results.extend(chunk)
+        return preview_results
+
+    async def execute(self, preview_results: Optional[List[Dict]] = None
+                      ) -> Tuple[int, int, List[str]]:
+        """
+        執行重命名，預覽仍有效時重用最近一次預覽
+
+        Args:
+            preview_results: 要執行的預覽結果，None 表示最近一次預覽
+
+        Returns:
+            Tuple[int, int, List[str]]: (成功數量, 失敗數量, 失敗原因)
+        """
+        def execute():
+            plan = self.renamer.get_execution_plan(preview_results)
+            return self.renamer.execute_rename(plan)
+        return await self._run(execute)
+
+    async def undo(self, history_index: Optional[int] = None) -> Tuple[int, int, List[str]]:
+        """
+        復原歷史操作
+
+        Args:
+            history_index: 歷史索引，None 表示最近一次操作
+        """
+        if history_index is None:
+            history_index = len(self.renamer.history) - 1
+        if history_index < 0:
+            return 0, 0, []
+        return await self._run(self.renamer.undo_operation, history_index)
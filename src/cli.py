@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+無介面模式
+Headless command-line mode
+
+用法:
+    python main.py --headless DIRECTORY [規則...] [--execute] [--timings]
+    python main.py --headless DIRECTORY [規則...] --write-plan plan.jsonl
+    python main.py --headless --run-plan plan.jsonl
+    python main.py --headless --serve /tmp/renamer.sock
+    python main.py --headless DIRECTORY [規則...] --connect /tmp/renamer.sock [--execute]
+
+規則依命令列順序套用，例如:
+    python main.py --headless ./photos --sort natural --prefix trip_ --sequence 1 3
+"""
+
+import os
+import sys
+import argparse
+from typing import List, Optional
+
+try:
+    from .daemon import DaemonClient, DaemonError, serve
+    from .file_renamer import FileRenamer, RenameRule
+    from .metadata import compile_template
+    from .hashing import check_algorithm
+    from .instrumentation import Instrumentation
+    from .metrics import RenameMetrics, EXPORT_FORMATS
+    from .plan_file import execute_plan, load_progress, read_plan_header
+    from .sorting import SORT_ORDERS
+    from .executor import DURABILITY_MODES
+    from .utils import BACKUP_METHODS, format_backup_stats
+    from .validation import FILENAME_PROFILES
+except ImportError:  # 以 src 目錄直接匯入時（main.py）
+    from daemon import DaemonClient, DaemonError, serve
+    from file_renamer import FileRenamer, RenameRule
+    from metadata import compile_template
+    from hashing import check_algorithm
+    from instrumentation import Instrumentation
+    from metrics import RenameMetrics, EXPORT_FORMATS
+    from plan_file import execute_plan, load_progress, read_plan_header
+    from sorting import SORT_ORDERS
+    from executor import DURABILITY_MODES
+    from utils import BACKUP_METHODS, format_backup_stats
+    from validation import FILENAME_PROFILES
+
+
+class _RuleAction(argparse.Action):
+    """依命令列順序收集規則"""
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        rules = getattr(namespace, 'rules', None) or []
+        rule = RenameRule()
+        rule.rule_type = self.dest
+
+        if self.dest == "prefix":
+            rule.prefix = values
+        elif self.dest == "suffix":
+            rule.suffix = values
+        elif self.dest == "replace":
+            rule.find_text, rule.replace_text = values
+        elif self.dest == "sequence":
+            try:
+                rule.sequence_start, rule.sequence_digits = int(values[0]), int(values[1])
+            except ValueError:
+                parser.error(f"{option_string}: START 與 DIGITS 必須是整數")
+        elif self.dest == "case":
+            rule.case_option = values
+        elif self.dest == "template":
+            try:
+                compile_template(values)
+            except ValueError as e:
+                parser.error(f"{option_string}: {e}")
+            rule.template = values
+        elif self.dest == "hash":
+            algorithm, _, length = values.partition(':')
+            try:
+                rule.hash_algorithm = check_algorithm(algorithm)
+            except ValueError as e:
+                parser.error(f"{option_string}: {e}")
+            if length:
+                try:
+                    rule.hash_length = int(length)
+                except ValueError:
+                    parser.error(f"{option_string}: LENGTH 必須是整數")
+                if rule.hash_length < 0:
+                    parser.error(f"{option_string}: LENGTH 不可為負數")
+
+        rules.append(rule)
+        namespace.rules = rules
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """建立命令列參數解析器"""
+    parser = argparse.ArgumentParser(prog="main.py --headless",
+                                     description="批量檔案重命名工具 - 無介面模式")
+    parser.add_argument('directory', nargs='?', help="要處理的目錄（--run-plan、--serve 時不需要）")
+
+    rules = parser.add_argument_group("重命名規則（依順序套用）")
+    rules.add_argument('--prefix', action=_RuleAction, metavar='TEXT')
+    rules.add_argument('--suffix', action=_RuleAction, metavar='TEXT')
+    rules.add_argument('--replace', action=_RuleAction, nargs=2, metavar=('FIND', 'REPLACE'))
+    rules.add_argument('--sequence', action=_RuleAction, nargs=2, metavar=('START', 'DIGITS'))
+    rules.add_argument('--case', action=_RuleAction,
+                       choices=['upper', 'lower', 'title', 'capitalize'])
+    rules.add_argument('--template', action=_RuleAction, metavar='TEMPLATE')
+    rules.add_argument('--hash', action=_RuleAction, metavar='ALGORITHM[:LENGTH]')
+
+    parser.add_argument('--filter', default='', help="過濾條件，以逗號分隔，如 .jpg,.png")
+    parser.add_argument('--sort', choices=list(SORT_ORDERS), default=None, help="排序方式")
+    parser.add_argument('--reverse', action='store_true', help="反向排序")
+    parser.add_argument('--auto-resolve', action='store_true',
+                        help="重複的目標檔名自動加上 _1、_2…，而不是視為衝突")
+    parser.add_argument('--profile', choices=list(FILENAME_PROFILES), default=None,
+                        help="檔名驗證規則（預設使用設定檔，未設定時為 windows）")
+    parser.add_argument('--max-bytes', type=int, default=None,
+                        help="檔名的 UTF-8 位元組數上限")
+    parser.add_argument('--move-to', metavar='DIR',
+                        help="移到另一個目錄（可位於其他檔案系統，以複製後刪除來源的方式移動）")
+    parser.add_argument('--execute', action='store_true', help="執行重命名（預設只預覽）")
+    parser.add_argument('--allow-overwrite', action='store_true',
+                        help="允許覆蓋預覽後才出現的同名檔案（預設不覆蓋，設定檔的 no_clobber）")
+    parser.add_argument('--locality-order', action='store_true',
+                        help="依目錄與 inode 順序執行，而不是顯示順序（冷快取的大目錄、NFS）")
+    parser.add_argument('--durability', choices=DURABILITY_MODES, default=None,
+                        help="重命名寫入磁碟的保證：none 不 fsync、batch 每批 fsync 目錄、strict 每個操作")
+    parser.add_argument('--sync-every', type=int, default=None, metavar='N',
+                        help="batch 模式每 N 個操作 fsync 一次（0 表示只在結束時）")
+    parser.add_argument('--max-ops', type=float, default=None, metavar='N',
+                        help="每秒最多執行的重命名數（共用儲存裝置上避免影響其他使用者）")
+    parser.add_argument('--latency-slo', type=float, default=None, metavar='MS',
+                        help="重命名延遲目標（毫秒），依延遲自動調整同時執行的數量")
+    parser.add_argument('--backup', action='store_true', help="執行前建立快照備份")
+    parser.add_argument('--backup-dir', metavar='DIR', help="快照備份的上層目錄（預設為來源目錄）")
+    parser.add_argument('--backup-method', choices=BACKUP_METHODS, default='auto')
+    plans = parser.add_argument_group("計畫檔（預覽後寫出，稍後再執行）")
+    plans.add_argument('--write-plan', metavar='PATH', help="將預覽結果寫成計畫檔")
+    plans.add_argument('--run-plan', metavar='PATH', help="執行計畫檔，中斷後再次執行會從中斷處繼續")
+    plans.add_argument('--checkpoint-every', type=int, default=1000, metavar='N',
+                       help="每執行 N 個步驟記錄一次進度")
+    plans.add_argument('--max-steps', type=int, default=None, metavar='N',
+                       help="本次最多執行的步驟數")
+
+    daemon = parser.add_argument_group("常駐服務（保留掃描結果與規則快取）")
+    daemon.add_argument('--serve', metavar='SOCKET', help="在指定的 Unix socket 啟動常駐服務")
+    daemon.add_argument('--connect', metavar='SOCKET', help="將預覽與執行交給常駐服務處理")
+
+    parser.add_argument('--limit', type=int, default=20, help="顯示的預覽筆數")
+    parser.add_argument('--timings', action='store_true', help="顯示各階段耗時")
+    parser.add_argument('--metrics-file', metavar='PATH', help="執行後將統計指標寫入此檔案")
+    parser.add_argument('--metrics-format', choices=EXPORT_FORMATS, default='prometheus',
+                        help="統計指標格式（prometheus 覆寫、jsonl 附加）")
+    parser.set_defaults(rules=[])
+    return parser
+
+
+def parse_filters(text: str) -> List[str]:
+    """將以逗號分隔的過濾條件轉為副檔名列表"""
+    filters = [f.strip() for f in text.split(',') if f.strip()]
+    return [f if f.startswith('.') else f'.{f}' for f in filters]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    無介面模式進入點
+
+    Returns:
+        int: 結束碼，有衝突或錯誤時為 1
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    
+    if args.run_plan:
+        return run_plan(args)
+    if args.serve:
+        try:
+            serve(args.serve)
+        except OSError as e:
+            print(f"啟動常駐服務時發生錯誤: {e}")
+            return 1
+        return 0
+    if not args.directory:
+        parser.error("請指定要處理的目錄，或以 --run-plan 執行計畫檔")
+    if args.connect:
+        return run_remote(args)
+
+    renamer = FileRenamer()
+    if args.timings:
+        renamer.instrumentation = Instrumentation()
+    if args.metrics_file:
+        renamer.metrics = RenameMetrics()
+    if args.allow_overwrite:
+        renamer.no_clobber = False
+    if args.locality_order:
+        renamer.locality_order = True
+    if args.durability:
+        renamer.durability = args.durability
+    if args.sync_every is not None:
+        renamer.sync_every = args.sync_every
+    if args.max_ops:
+        renamer.max_ops_per_second = args.max_ops
+    if args.latency_slo:
+        renamer.latency_slo_ms = args.latency_slo
+    if args.backup:
+        renamer.backup_before_rename = True
+        renamer.backup_method = args.backup_method
+        if args.backup_dir:
+            renamer.backup_root = os.path.abspath(args.backup_dir)
+
+    if not renamer.set_source_directory(os.path.abspath(args.directory)):
+        print(f"無法讀取指定的目錄: {args.directory}")
+        return 1
+
+    if args.move_to and not renamer.set_target_directory(args.move_to):
+        print(f"無法使用指定的目標目錄: {args.move_to}")
+        return 1
+    renamer.auto_resolve_conflicts = args.auto_resolve
+    if args.profile or args.max_bytes:
+        renamer.set_filename_profile(args.profile or renamer.filename_profile,
+                                     args.max_bytes or renamer.filename_max_bytes)
+    if args.sort:
+        renamer.set_sort_order(args.sort, args.reverse)
+    if args.filter:
+        renamer.set_file_filters(parse_filters(args.filter))
+
+    for rule in args.rules:
+        renamer.add_rename_rule(rule)
+
+    preview_results = renamer.preview_rename()
+    changed = [r for r in preview_results if r['original_name'] != r['new_name']]
+    conflicts = [r for r in preview_results if r['conflict']]
+
+    for result in preview_results[:args.limit]:
+        status = f"  [衝突: {result['conflict_reason']}]" if result['conflict'] else ""
+        print(f"{result['original_name']} → {result['new_name']}{status}")
+    if len(preview_results) > args.limit:
+        print(f"... 以及其他 {len(preview_results) - args.limit} 個檔案")
+
+    print(f"\n總計: {len(preview_results)} | 將變更: {len(changed)} | 衝突: {len(conflicts)}")
+
+    exit_code = 1 if conflicts else 0
+    
+    if args.write_plan:
+        try:
+            stats = renamer.export_plan(args.write_plan, preview_results)
+            print(f"已寫入計畫檔 {args.write_plan}: {stats['operations']} 個操作, "
+                  f"{stats['steps']} 個步驟（略過 {stats['conflicts']} 個衝突）")
+        except OSError as e:
+            print(f"寫入計畫檔時發生錯誤: {e}")
+            exit_code = 1
+
+    if args.execute:
+        plan = renamer.get_execution_plan(preview_results)
+        if plan is not preview_results:
+            print(f"目錄在預覽後已變動，重新驗證了 {renamer.preview_plan.get('revalidated', 0)} 個項目")
+        success_count, error_count, errors = renamer.execute_rename(plan)
+        for error in errors:
+            print(f"錯誤: {error}")
+        if renamer.last_backup_stats:
+            print(f"{format_backup_stats(renamer.last_backup_stats)} → "
+                  f"{renamer.last_backup_stats['backup_dir']}")
+        print(f"重命名完成 - 成功: {success_count}, 失敗: {error_count}")
+        exit_code = 1 if error_count else 0
+        stats = renamer.last_throttle_stats
+        if stats:
+            line = f"節流等待 {stats['waited_seconds']:.2f} 秒"
+            if 'limit' in stats:
+                line += f"，同時執行數 {stats['limit']}（調整 {stats['adjustments']} 次）"
+            print(line)
+        
+        if renamer.metrics is not None:
+            try:
+                renamer.metrics.export(args.metrics_file, args.metrics_format)
+            except OSError as e:
+                print(f"寫入統計指標時發生錯誤: {e}")
+
+    if renamer.instrumentation is not None:
+        print("\n" + renamer.instrumentation.report())
+
+    return exit_code
+
+
+def run_remote(args) -> int:
+    """透過常駐服務預覽與執行"""
+    params = {
+        'directory': os.path.abspath(args.directory),
+        'rules': [vars(rule) for rule in args.rules],
+        'filters': parse_filters(args.filter),
+        'sort': args.sort,
+        'reverse': args.reverse,
+        'auto_resolve': args.auto_resolve,
+        'profile': args.profile,
+        'max_bytes': args.max_bytes,
+    }
+    try:
+        with DaemonClient(args.connect) as client:
+            summary = client.call('preview', limit=args.limit, **params)
+            for result in summary['results']:
+                status = f"  [衝突: {result['conflict_reason']}]" if result['conflict_reason'] else ""
+                print(f"{result['original_name']} → {result['new_name']}{status}")
+            if summary['total'] > args.limit:
+                print(f"... 以及其他 {summary['total'] - args.limit} 個檔案")
+            print(f"\n總計: {summary['total']} | 將變更: {summary['changed']} | "
+                  f"衝突: {summary['conflicts']}（{summary['seconds'] * 1000:.1f} ms）")
+            exit_code = 1 if summary['conflicts'] else 0
+            
+            if args.execute:
+                result = client.call('execute', **params)
+                for error in result['errors']:
+                    print(f"錯誤: {error}")
+                print(f"重命名完成 - 成功: {result['succeeded']}, 失敗: {result['failed']}")
+                exit_code = 1 if result['failed'] else 0
+    except (OSError, DaemonError) as e:
+        print(f"連線常駐服務時發生錯誤: {e}")
+        return 1
+    
+    return exit_code
+
+
+def run_plan(args) -> int:
+    """執行計畫檔"""
+    try:
+        header = read_plan_header(args.run_plan)
+    except (OSError, ValueError) as e:
+        print(f"讀取計畫檔時發生錯誤: {e}")
+        return 1
+    
+    print(f"計畫: {header['directory']} - {header['operations']} 個操作"
+          f"（建立於 {header['created']}）")
+    progress = load_progress(args.run_plan)
+    if progress is not None and not progress['completed']:
+        print(f"從第 {progress['steps'] + 1} 個步驟繼續")
+    
+    try:
+        result = execute_plan(args.run_plan, args.checkpoint_every,
+                              no_clobber=not args.allow_overwrite,
+                              max_steps=args.max_steps)
+    except KeyboardInterrupt:
+        print("已中斷，進度已儲存；再次執行相同指令即可繼續")
+        return 130
+    except (OSError, ValueError) as e:
+        print(f"執行計畫檔時發生錯誤: {e}")
+        return 1
+    
+    print(f"已執行 {result['steps']}/{result['total']} 個步驟 - 成功: {result['succeeded']}, "
+          f"失敗: {result['failed']}, 跳過: {result['skipped']}（{result['seconds']:.2f} 秒）")
+    if result['failed'] or result['skipped']:
+        print(f"失敗的步驟記錄於 {args.run_plan}.errors")
+    if not result['completed']:
+        print("尚未完成，再次執行相同指令即可繼續")
+    
+    return 1 if result['failed'] or result['skipped'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
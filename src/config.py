@@ -14,6 +14,7 @@ APP_DESCRIPTION = "功能豐富的桌面檔案重命名工具"
 # 檔案設定
 SETTINGS_FILE = "settings.json"
 HISTORY_FILE = "history.json"
+HASH_CACHE_FILE = "hash_cache.json"
 
 # 預設設定
 DEFAULT_SETTINGS = {
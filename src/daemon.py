@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+常駐服務
+Local rename daemon over a Unix-domain socket
+
+常駐程序為每個目錄保留一個 FileRenamer：掃描結果、規則快取與最近一次預覽都留在記憶體中，
+同一目錄的重複工作只在目錄 mtime 改變時才重新掃描。
+
+通訊協定為每行一個 JSON 物件（JSON-RPC 2.0 格式）:
+    → {"jsonrpc": "2.0", "id": 1, "method": "preview", "params": {"directory": "...", ...}}
+    ← {"jsonrpc": "2.0", "id": 1, "result": {...}}
+同一個連線可送出多個請求；不同目錄的請求可同時處理，同一目錄的請求依序處理。
+"""
+
+import os
+import json
+import time
+import socket
+import threading
+import socketserver
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+try:
+    from .file_renamer import FileRenamer, RenameRule
+    from .metadata import compile_template
+    from .hashing import check_algorithm
+except ImportError:  # 以 src 目錄直接匯入時（test.py、main.py）
+    from file_renamer import FileRenamer, RenameRule
+    from metadata import compile_template
+    from hashing import check_algorithm
+
+# JSON-RPC 錯誤碼
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+
+_RULE_FIELDS = frozenset(vars(RenameRule()))
+
+
+class DaemonError(Exception):
+    """常駐服務返回的錯誤"""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+
+
+def rule_from_dict(data: Dict) -> RenameRule:
+    """由 JSON 物件建立規則，未知的欄位視為錯誤"""
+    unknown = set(data) - _RULE_FIELDS
+    if unknown:
+        raise DaemonError(INVALID_PARAMS, f"未知的規則欄位: {', '.join(sorted(unknown))}")
+    rule = RenameRule()
+    for key, value in data.items():
+        setattr(rule, key, value)
+    if rule.rule_type == "template":
+        try:
+            compile_template(rule.template)
+        except ValueError as e:
+            raise DaemonError(INVALID_PARAMS, str(e))
+    elif rule.rule_type == "hash":
+        try:
+            check_algorithm(rule.hash_algorithm)
+        except ValueError as e:
+            raise DaemonError(INVALID_PARAMS, str(e))
+        if not isinstance(rule.hash_length, int) or rule.hash_length < 0:
+            raise DaemonError(INVALID_PARAMS, "hash_length 必須是非負整數")
+    return rule
+
+
+class _Session:
+    """一個目錄的常駐狀態"""
+
+    def __init__(self, renamer: FileRenamer):
+        self.renamer = renamer
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.last_used = time.monotonic()
+
+
+class RenameService:
+    """
+    處理請求的服務（不含通訊），可直接在同一程序中呼叫
+
+    所有目錄共用同一份操作歷史；執行與復原會寫入 history.json，因此在同一把鎖下進行，
+    並在開始前將共用的歷史交給該目錄的 FileRenamer、結束後取回（見 _shared_history）。
+    """
+
+    def __init__(self, max_sessions: int = 32):
+        self.max_sessions = max_sessions
+        self.sessions: Dict[str, _Session] = {}
+        self._sessions_lock = threading.Lock()
+        self._history_lock = threading.Lock()
+        self.started = time.time()
+        self.history = None  # 第一次建立目錄狀態時載入
+        self.shutdown_requested = threading.Event()
+
+    def _session(self, directory: str) -> _Session:
+        """取得目錄的常駐狀態，第一次使用時建立並掃描"""
+        if not isinstance(directory, str) or not directory:
+            raise DaemonError(INVALID_PARAMS, "請指定目錄")
+        directory = os.path.abspath(directory)
+
+        with self._sessions_lock:
+            session = self.sessions.get(directory)
+            if session is None:
+                renamer = FileRenamer()
+                if self.history is None:
+                    with self._history_lock:
+                        renamer.load_history()
+                        self.history = renamer.history
+                session = self.sessions[directory] = _Session(renamer)
+                self._evict()
+            session.last_used = time.monotonic()
+
+        with session.lock:
+            if session.renamer.source_directory != directory:
+                if not session.renamer.set_source_directory(directory):
+                    with self._sessions_lock:
+                        self.sessions.pop(directory, None)
+                    raise DaemonError(INVALID_PARAMS, f"無法讀取指定的目錄: {directory}")
+        return session
+
+    @contextmanager
+    def _shared_history(self, renamer: FileRenamer):
+        """在歷史鎖下以共用的歷史執行，結束後取回更新後的歷史"""
+        with self._history_lock:
+            renamer.history = self.history
+            try:
+                yield
+            finally:
+                self.history = renamer.history
+
+    def _evict(self):
+        # 超過上限時移除最久未使用、且沒有執行中請求的目錄
+        while len(self.sessions) > self.max_sessions:
+            idle = [(session.last_used, directory) for directory, session in self.sessions.items()
+                    if not session.lock.locked()]
+            if not idle:
+                break
+            del self.sessions[min(idle)[1]]
+
+    def _configure(self, renamer: FileRenamer, params: Dict):
+        """
+        套用請求中的設定，與目前狀態相同的設定不重新套用，以保留規則快取
+
+        目錄 mtime 與掃描時不同，或有檔案被就地改寫（大小、修改時間改變，目錄 mtime 不變）
+        時重新掃描，範本的 {size}、{mtime} 與雜湊快取才不會使用過期的資料。
+        """
+        if renamer.preview_token()[1] != renamer.scan_mtime_ns or renamer.files_changed():
+            renamer.refresh_files_list()
+
+        sort = params.get('sort')
+        reverse = bool(params.get('reverse', False))
+        if sort is not None and (sort, reverse) != (renamer.sort_order, renamer.sort_reverse):
+            try:
+                renamer.set_sort_order(sort, reverse)
+            except ValueError as e:
+                raise DaemonError(INVALID_PARAMS, str(e))
+
+        filters = tuple(params.get('filters', []))
+        if filters != renamer.file_filters:
+            renamer.set_file_filters(filters)
+
+        renamer.auto_resolve_conflicts = bool(params.get('auto_resolve', False))
+        profile = params.get('profile') or renamer.filename_profile
+        max_bytes = params.get('max_bytes')
+        if (profile, max_bytes) != (renamer.filename_profile, renamer.filename_max_bytes):
+            renamer.set_filename_profile(profile, max_bytes)
+
+        rules = params.get('rules', [])
+        if not isinstance(rules, list) or not all(isinstance(rule, dict) for rule in rules):
+            raise DaemonError(INVALID_PARAMS, "rules 必須是規則物件的列表")
+        renamer.rename_rules = [rule_from_dict(rule) for rule in rules]
+
+    def call(self, method: str, params: Optional[Dict] = None):
+        """
+        處理一個請求
+
+        Args:
+            method: preview、execute、undo、refresh、status 或 shutdown
+            params: 請求參數
+
+        Returns:
+            可序列化為 JSON 的結果
+        """
+        handler = getattr(self, f"rpc_{method}", None) if isinstance(method, str) else None
+        if handler is None:
+            raise DaemonError(METHOD_NOT_FOUND, f"未知的方法: {method}")
+        if params is None:
+            params = {}
+        if not isinstance(params, dict):
+            raise DaemonError(INVALID_PARAMS, "params 必須是物件")
+        return handler(params)
+
+    def rpc_preview(self, params: Dict) -> Dict:
+        """預覽，返回統計與前 limit 筆結果"""
+        session = self._session(params.get('directory'))
+        with session.lock:
+            session.requests += 1
+            renamer = session.renamer
+            self._configure(renamer, params)
+            start = time.perf_counter()
+            preview_results = renamer.preview_rename()
+            return self._summary(preview_results, params.get('limit', 20),
+                                 time.perf_counter() - start)
+
+    def rpc_execute(self, params: Dict) -> Dict:
+        """執行重命名；預覽仍有效時直接重用最近一次預覽"""
+        session = self._session(params.get('directory'))
+        with session.lock:
+            session.requests += 1
+            renamer = session.renamer
+            self._configure(renamer, params)
+            start = time.perf_counter()
+            plan = renamer.get_execution_plan()
+            revalidated = renamer.preview_plan.get('revalidated', 0)
+            with self._shared_history(renamer):
+                success_count, error_count, errors = renamer.execute_rename(plan)
+            return {
+                'succeeded': success_count,
+                'failed': error_count,
+                'errors': errors,
+                'revalidated': revalidated,
+                'seconds': time.perf_counter() - start,
+            }
+
+    def rpc_undo(self, params: Dict) -> Dict:
+        """復原此目錄最近一次的操作"""
+        session = self._session(params.get('directory'))
+        with session.lock, self._shared_history(session.renamer):
+            session.requests += 1
+            renamer = session.renamer
+            for index in range(len(renamer.history) - 1, -1, -1):
+                if renamer.history[index]['directory'] == renamer.source_directory:
+                    success_count, error_count, errors = renamer.undo_operation(index)
+                    return {'succeeded': success_count, 'failed': error_count, 'errors': errors}
+            raise DaemonError(INVALID_PARAMS, "此目錄沒有可復原的操作")
+
+    def rpc_refresh(self, params: Dict) -> Dict:
+        """強制重新掃描目錄"""
+        session = self._session(params.get('directory'))
+        with session.lock:
+            session.renamer.refresh_files_list()
+            return {'files': len(session.renamer.files_list)}
+
+    def rpc_status(self, params: Dict) -> Dict:
+        """常駐中的目錄與請求數"""
+        with self._sessions_lock:
+            directories = {directory: {'files': len(session.renamer.files_list),
+                                       'requests': session.requests}
+                           for directory, session in self.sessions.items()}
+        return {'uptime': time.time() - self.started, 'directories': directories}
+
+    def rpc_shutdown(self, params: Dict) -> Dict:
+        """結束常駐服務"""
+        self.shutdown_requested.set()
+        return {'stopping': True}
+
+    @staticmethod
+    def _summary(preview_results: List[Dict], limit: int, seconds: float) -> Dict:
+        return {
+            'total': len(preview_results),
+            'changed': sum(1 for r in preview_results if r['original_name'] != r['new_name']),
+            'conflicts': sum(1 for r in preview_results if r['conflict']),
+            'results': [{'original_name': r['original_name'], 'new_name': r['new_name'],
+                         'conflict_reason': r['conflict_reason']}
+                        for r in preview_results[:limit]],
+            'seconds': seconds,
+        }
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """逐行讀取請求並回覆，直到用戶端關閉連線"""
+
+    def handle(self):
+        service = self.server.service
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            request_id = None
+            try:
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    raise DaemonError(PARSE_ERROR, "無法解析的 JSON")
+                if not isinstance(request, dict):
+                    raise DaemonError(INVALID_REQUEST, "請求必須是物件")
+                request_id = request.get('id')
+                response = {'jsonrpc': '2.0', 'id': request_id,
+                            'result': service.call(request.get('method'), request.get('params'))}
+            except DaemonError as e:
+                response = {'jsonrpc': '2.0', 'id': request_id,
+                            'error': {'code': e.code, 'message': str(e)}}
+            except Exception as e:
+                response = {'jsonrpc': '2.0', 'id': request_id,
+                            'error': {'code': INTERNAL_ERROR, 'message': f"處理請求時發生錯誤: {e}"}}
+
+            self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b"\n")
+            self.wfile.flush()
+            if service.shutdown_requested.is_set():
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+                return
+
+
+class RenameDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    以 Unix socket 提供 RenameService 的常駐服務
+
+    socket 建立時只允許目前的使用者連線（權限 0600）。
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, service: Optional[RenameService] = None):
+        self.socket_path = socket_path
+        self.service = service or RenameService()
+        _remove_stale_socket(socket_path)
+        old_umask = os.umask(0o177)
+        try:
+            super().__init__(socket_path, _RequestHandler)
+        finally:
+            os.umask(old_umask)
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+
+
+def _remove_stale_socket(socket_path: str):
+    """移除上次未正常結束留下的 socket 檔；已有服務在執行時不覆蓋"""
+    if not os.path.exists(socket_path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        os.unlink(socket_path)
+        return
+    finally:
+        probe.close()
+    raise OSError(f"已有常駐服務在 {socket_path} 執行")
+
+
+def serve(socket_path: str):
+    """啟動常駐服務，直到收到 shutdown 請求或被中斷"""
+    with RenameDaemon(socket_path) as daemon:
+        print(f"常駐服務已啟動: {socket_path}")
+        try:
+            daemon.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    print("常駐服務已結束")
+
+
+class DaemonClient:
+    """常駐服務的用戶端，同一個連線可送出多個請求"""
+
+    def __init__(self, socket_path: str, timeout: Optional[float] = None):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.settimeout(timeout)
+        self.socket.connect(socket_path)
+        self._file = self.socket.makefile('rwb')
+        self._next_id = 0
+
+    def call(self, method: str, **params):
+        """送出請求並等待結果，服務返回錯誤時引發 DaemonError"""
+        self._next_id += 1
+        request = {'jsonrpc': '2.0', 'id': self._next_id, 'method': method, 'params': params}
+        self._file.write(json.dumps(request, ensure_ascii=False).encode('utf-8') + b"\n")
+        self._file.flush()
+
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("常駐服務已關閉連線")
+        response = json.loads(line)
+        if 'error' in response:
+            raise DaemonError(response['error']['code'], response['error']['message'])
+        return response['result']
+
+    def close(self):
+        self._file.close()
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
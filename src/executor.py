@@ -0,0 +1,609 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批次重命名執行引擎
+Batch rename planner and executor
+
+重命名與復原共用同一套流程：
+1. 每個相關目錄只開啟並掃描一次，以快照驗證整批操作，之後以 dir_fd 相對名稱重命名
+2. 依相依關係排出執行順序（a→b 必須等 b 先移走），循環以暫存檔名拆開
+3. 互不相依的操作鏈可平行執行，失敗只影響同一條鏈上的後續操作
+4. 來源與目標目錄的 st_dev 不同時，改為複製後刪除來源（見 transfer.py）
+5. 可選擇依目錄與 inode 順序執行，而不是顯示順序（見 order_chains）
+6. 重命名在父目錄 fsync 之後才算寫入磁碟，依耐久性模式決定何時 fsync（見 DirectorySync）
+"""
+
+import os
+import sys
+import time
+import uuid
+import errno
+import ctypes
+import threading
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    from .transfer import TRANSFER_WORKERS, move_across_devices
+except ImportError:  # 以 src 目錄直接匯入時（test.py、main.py）
+    from transfer import TRANSFER_WORKERS, move_across_devices
+
+# 執行步驟: (來源, 目標, 所屬操作索引, 是否完成該操作)
+Step = Tuple[str, str, int, bool]
+
+# 每個操作完成（或失敗）時呼叫: observer(操作索引, 耗時秒數)
+Observer = Callable[[int, float], None]
+
+RENAME_NOREPLACE = 1
+_AT_FDCWD = -100
+_renameat2 = None  # None 表示尚未載入，False 表示不支援
+
+# 這些錯誤表示無法建立硬連結，只能退回先檢查再重命名
+_LINK_UNSUPPORTED = {errno.EPERM, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EMLINK, errno.EXDEV}
+
+
+def _load_renameat2():
+    global _renameat2
+    if _renameat2 is None:
+        _renameat2 = False
+        if sys.platform.startswith('linux'):
+            try:
+                function = ctypes.CDLL(None, use_errno=True).renameat2
+                function.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int,
+                                     ctypes.c_char_p, ctypes.c_uint]
+                function.restype = ctypes.c_int
+                _renameat2 = function
+            except (OSError, AttributeError):  # glibc 2.28 之前沒有 renameat2
+                pass
+    return _renameat2
+
+
+def _link_noreplace(src: str, dst: str, src_dir_fd: Optional[int], dst_dir_fd: Optional[int]):
+    try:
+        os.link(src, dst, src_dir_fd=src_dir_fd, dst_dir_fd=dst_dir_fd, follow_symlinks=False)
+    except FileExistsError:
+        # 不分大小寫的檔案系統上只改大小寫時，目標其實是同一個檔案
+        src_stat = os.stat(src, dir_fd=src_dir_fd, follow_symlinks=False)
+        dst_stat = os.stat(dst, dir_fd=dst_dir_fd, follow_symlinks=False)
+        if (src_stat.st_dev, src_stat.st_ino) == (dst_stat.st_dev, dst_stat.st_ino):
+            os.rename(src, dst, src_dir_fd=src_dir_fd, dst_dir_fd=dst_dir_fd)
+            return
+        raise
+    except (OSError, NotImplementedError) as e:
+        if isinstance(e, OSError) and e.errno not in _LINK_UNSUPPORTED:
+            raise
+        # 不支援硬連結的檔案系統，只能盡量縮短檢查與重命名之間的間隔
+        try:
+            os.stat(dst, dir_fd=dst_dir_fd, follow_symlinks=False)
+        except FileNotFoundError:
+            os.rename(src, dst, src_dir_fd=src_dir_fd, dst_dir_fd=dst_dir_fd)
+            return
+        raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), dst)
+
+    try:
+        os.unlink(src, dir_fd=src_dir_fd)
+    except OSError:
+        os.unlink(dst, dir_fd=dst_dir_fd)
+        raise
+
+
+def rename_noreplace(src: str, dst: str, src_dir_fd: Optional[int] = None,
+                     dst_dir_fd: Optional[int] = None):
+    """
+    重命名但不覆蓋已存在的目標
+
+    Linux 上以 renameat2(RENAME_NOREPLACE) 由核心在同一個系統呼叫中檢查目標，
+    其他平台或檔案系統不支援時改用 link + unlink。
+
+    Args:
+        src, dst: 路徑，指定 dir_fd 時為相對於該目錄的名稱
+        src_dir_fd, dst_dir_fd: 已開啟的目錄，與 os.rename 相同
+
+    Raises:
+        FileExistsError: 目標已存在
+        OSError: 其他重命名錯誤
+    """
+    function = _load_renameat2()
+    if function:
+        result = function(_AT_FDCWD if src_dir_fd is None else src_dir_fd, os.fsencode(src),
+                          _AT_FDCWD if dst_dir_fd is None else dst_dir_fd, os.fsencode(dst),
+                          RENAME_NOREPLACE)
+        if result == 0:
+            return
+        error = ctypes.get_errno()
+        if error == errno.ENOSYS:  # 核心不支援
+            global _renameat2
+            _renameat2 = False
+        elif error != errno.EINVAL:  # EINVAL: 此檔案系統不支援該旗標
+            raise OSError(error, os.strerror(error), src, None, dst)
+
+    _link_noreplace(src, dst, src_dir_fd, dst_dir_fd)
+
+
+DIR_FD_SUPPORTED = (os.rename in os.supports_dir_fd and os.stat in os.supports_dir_fd
+                    and os.scandir in os.supports_fd and hasattr(os, 'O_DIRECTORY'))
+
+
+class DirectoryHandles:
+    """
+    每個相關目錄只開啟一次，之後以 dir_fd 相對名稱操作
+
+    核心不需要每次都從根目錄解析完整路徑，在很深或位於 NFS 上的目錄特別明顯。
+    不支援 dir_fd 的平台或無法開啟的目錄會退回使用完整路徑。
+    """
+
+    def __init__(self, directories=()):
+        self.fds: Dict[str, int] = {}
+        self.devices: Dict[str, Optional[int]] = {}
+        if DIR_FD_SUPPORTED:
+            for directory in directories:
+                self.open(directory)
+
+    def open(self, directory: str) -> Optional[int]:
+        """開啟目錄（已開啟則直接返回），失敗時返回 None"""
+        fd = self.fds.get(directory)
+        if fd is None and DIR_FD_SUPPORTED:
+            try:
+                fd = self.fds[directory] = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+            except OSError:
+                return None
+        return fd
+
+    def resolve(self, path: str) -> Tuple[str, Optional[int]]:
+        """
+        將完整路徑轉換為 (名稱, 目錄 fd)
+
+        Returns:
+            Tuple[str, Optional[int]]: 目錄未開啟時為 (完整路徑, None)
+        """
+        directory, name = os.path.split(path)
+        fd = self.fds.get(directory)
+        if fd is None:
+            return path, None
+        return name, fd
+
+    def device(self, directory: str) -> Optional[int]:
+        """目錄所在裝置的 st_dev（每個目錄只 stat 一次），無法讀取時為 None"""
+        if directory not in self.devices:
+            fd = self.fds.get(directory)
+            try:
+                self.devices[directory] = (os.stat(directory) if fd is None else os.fstat(fd)).st_dev
+            except OSError:
+                self.devices[directory] = None
+        return self.devices[directory]
+
+    def is_cross_device(self, src: str, dst: str) -> bool:
+        """來源與目標是否位於不同的檔案系統"""
+        src_device = self.device(os.path.dirname(src))
+        dst_device = self.device(os.path.dirname(dst))
+        return src_device is not None and dst_device is not None and src_device != dst_device
+
+    def move(self, src: str, dst: str, no_clobber: bool = False):
+        """重命名；目標位於其他檔案系統時複製後刪除來源"""
+        if self.is_cross_device(src, dst):
+            move_across_devices(src, dst, no_clobber)
+            return
+        try:
+            self.rename(src, dst, no_clobber)
+        except OSError as e:
+            if e.errno != errno.EXDEV:  # 同一個 st_dev 也可能跨掛載點（例如 bind mount）
+                raise
+            move_across_devices(src, dst, no_clobber)
+
+    def rename(self, src: str, dst: str, no_clobber: bool = False):
+        """以相對名稱重命名，錯誤訊息仍使用完整路徑"""
+        src_name, src_fd = self.resolve(src)
+        dst_name, dst_fd = self.resolve(dst)
+        try:
+            if no_clobber:
+                rename_noreplace(src_name, dst_name, src_fd, dst_fd)
+            else:
+                os.rename(src_name, dst_name, src_dir_fd=src_fd, dst_dir_fd=dst_fd)
+        except OSError as e:
+            e.filename, e.filename2 = src, dst
+            raise
+
+    def fsync(self, directory: str):
+        """將目錄項目的變更寫入磁碟（不支援目錄 fsync 的平台不做任何事）"""
+        fd = self.fds.get(directory)
+        if fd is not None:
+            os.fsync(fd)
+            return
+        if not hasattr(os, 'O_DIRECTORY'):
+            return  # Windows 無法開啟目錄，NTFS 的中繼資料由日誌保護
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def close(self):
+        for fd in self.fds.values():
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self.fds.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+DURABILITY_MODES = ('none', 'batch', 'strict')
+
+
+class DirectorySync:
+    """
+    依耐久性模式 fsync 重命名涉及的目錄
+
+    none: 不 fsync，由作業系統決定何時寫入
+    batch: 記錄涉及的目錄，每 every 個操作與結束時各 fsync 一次
+    strict: 每個操作後立即 fsync 來源與目標目錄
+    """
+
+    def __init__(self, mode: str = 'none', every: Optional[int] = 1000):
+        if mode not in DURABILITY_MODES:
+            raise ValueError(f"未知的耐久性模式: {mode}")
+        self.mode = mode
+        self.every = every
+        self.syncs = 0
+        self.errors: List[str] = []
+        self._pending = set()
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def touched(self, handles: DirectoryHandles, src: str, dst: str):
+        """一個重命名步驟完成"""
+        if self.mode == 'none':
+            return
+        directories = {os.path.dirname(src), os.path.dirname(dst)}
+        if self.mode == 'strict':
+            self._sync(handles, directories)
+            return
+        with self._lock:
+            self._pending.update(directories)
+            self._count += 1
+            if not self.every or self._count < self.every:
+                return
+            directories, self._pending, self._count = self._pending, set(), 0
+        self._sync(handles, directories)
+
+    def flush(self, handles: DirectoryHandles):
+        """fsync 尚未同步的目錄"""
+        with self._lock:
+            directories, self._pending, self._count = self._pending, set(), 0
+        self._sync(handles, directories)
+
+    def _sync(self, handles: DirectoryHandles, directories):
+        for directory in directories:
+            try:
+                handles.fsync(directory)
+            except OSError as e:
+                with self._lock:
+                    self.errors.append(f"{directory}: {e}")
+        with self._lock:
+            self.syncs += len(directories)
+
+    @property
+    def committed(self) -> bool:
+        """已到達耐久點：有 fsync 的模式全部同步成功"""
+        return self.mode != 'none' and not self.errors and not self._pending
+
+
+def snapshot_directories(directories,
+                         handles: Optional[DirectoryHandles] = None) -> Dict[str, Optional[Dict[str, int]]]:
+    """
+    掃描目錄，每個目錄只呼叫一次 scandir
+
+    Args:
+        directories: 目錄路徑集合
+        handles: 已開啟的目錄，有則以 fd 掃描
+
+    Returns:
+        Dict[str, Optional[Dict[str, int]]]: 目錄對應 {檔名: inode}，無法讀取的目錄為 None
+    """
+    snapshot = {}
+    for directory in directories:
+        fd = handles.fds.get(directory) if handles is not None else None
+        try:
+            with os.scandir(directory if fd is None else fd) as entries:
+                snapshot[directory] = {entry.name: entry.inode() for entry in entries}
+        except OSError:
+            snapshot[directory] = None
+    return snapshot
+
+
+def validate_moves(moves: List[Tuple[str, str]],
+                   snapshot: Dict[str, Optional[Dict[str, int]]]) -> Dict[int, str]:
+    """
+    以目錄快照驗證整批操作
+
+    Args:
+        moves: (來源路徑, 目標路徑) 列表
+        snapshot: snapshot_directories 的結果
+
+    Returns:
+        Dict[int, str]: 無法執行的操作索引與原因
+    """
+    errors = {}
+    source_index = {}
+    target_index = {}
+
+    for i, (src, dst) in enumerate(moves):
+        if src in source_index:
+            errors[i] = "來源檔案重複"
+            continue
+        source_index[src] = i
+
+    for i, (src, dst) in enumerate(moves):
+        if i in errors:
+            continue
+
+        src_dir, src_name = os.path.split(src)
+        names = snapshot.get(src_dir)
+        if names is None or src_name not in names:
+            errors[i] = "來源檔案不存在"
+            continue
+
+        if dst in target_index:
+            errors[i] = "目標檔名重複"
+            continue
+        target_index[dst] = i
+
+        dst_dir, dst_name = os.path.split(dst)
+        names = snapshot.get(dst_dir)
+        if names is None:
+            errors[i] = "目標目錄不存在"
+        elif dst_name in names and dst not in source_index:
+            errors[i] = "目標檔案已存在"
+
+    # 來源無法移走時，以它為目標的操作也無法執行
+    pending = list(errors)
+    while pending:
+        failed = pending.pop()
+        blocked = target_index.get(moves[failed][0])
+        if blocked is not None and blocked not in errors:
+            errors[blocked] = "目標檔案已存在"
+            pending.append(blocked)
+
+    return errors
+
+
+def _temp_path(path: str) -> str:
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}.renaming-{uuid.uuid4().hex[:8]}")
+
+
+def plan_moves(moves: List[Tuple[str, str]], skip=()) -> List[List[Step]]:
+    """
+    排出執行順序
+
+    每個目標只會被一個操作使用，相依關係因此只會形成鏈或循環。
+    鏈從目標空著的一端往回執行；循環先把其中一個檔案移到暫存名稱。
+
+    Args:
+        moves: (來源路徑, 目標路徑) 列表
+        skip: 不執行的操作索引
+
+    Returns:
+        List[List[Step]]: 互不相依的操作鏈，鏈內需依序執行
+    """
+    skip = set(skip)
+    by_source = {}
+    by_target = {}
+    for i, (src, dst) in enumerate(moves):
+        if i in skip or src == dst:
+            continue
+        by_source[src] = i
+        by_target[dst] = i
+
+    chains = []
+    visited = set()
+
+    # 目標未被其他操作佔用的操作是鏈的起點
+    for i in by_source.values():
+        src, dst = moves[i]
+        if dst in by_source:
+            continue
+
+        chain = []
+        current = i
+        while current is not None and current not in visited:
+            visited.add(current)
+            chain.append((moves[current][0], moves[current][1], current, True))
+            current = by_target.get(moves[current][0])
+        chains.append(chain)
+
+    # 剩下的都在循環中
+    for i in by_source.values():
+        if i in visited:
+            continue
+
+        src, dst = moves[i]
+        temp = _temp_path(dst)
+        chain = [(src, temp, i, False)]
+        visited.add(i)
+
+        current = by_target.get(src)
+        while current != i:
+            visited.add(current)
+            chain.append((moves[current][0], moves[current][1], current, True))
+            current = by_target.get(moves[current][0])
+
+        chain.append((temp, dst, i, True))
+        chains.append(chain)
+
+    return chains
+
+
+def order_chains(chains: List[List[Step]],
+                 snapshot: Dict[str, Optional[Dict[str, int]]]) -> List[List[Step]]:
+    """
+    依區域性排列操作鏈（鏈內順序不變，因此仍符合相依關係）
+
+    以來源目錄分組，組內依第一個來源的 inode 排序（inode 由 readdir 直接提供，不需 stat）。
+    冷快取時每次查詢檔名都要讀取 inode 所在的區塊；ext4 與 XFS 一個區塊存放多個相鄰的 inode，
+    依 inode 順序操作時連續的操作大多落在已讀取的區塊，而顯示順序與 inode 配置無關。
+
+    Args:
+        chains: plan_moves 的結果
+        snapshot: snapshot_directories 的結果
+
+    Returns:
+        List[List[Step]]: 排序後的操作鏈
+    """
+    if len(chains) < 2:
+        return chains
+
+    # 先分組再以整數排序，比以 (目錄, inode) tuple 排序快得多
+    groups: Dict[str, List[Tuple[int, List[Step]]]] = {}
+    for chain in chains:
+        directory, _, name = chain[0][0].rpartition(os.sep)
+        group = groups.get(directory)
+        if group is None:
+            group = groups[directory] = []
+        group.append(((snapshot.get(directory) or {}).get(name, -1), chain))
+
+    ordered = []
+    for group in groups.values():
+        group.sort(key=itemgetter(0))
+        ordered.extend(chain for _, chain in group)
+    return ordered
+
+
+def run_chain(chain: List[Step], observer: Optional[Observer] = None,
+              no_clobber: bool = False,
+              handles: Optional[DirectoryHandles] = None,
+              throttle=None,
+              sync: Optional[DirectorySync] = None) -> Dict[int, Optional[str]]:
+    """
+    依序執行一條操作鏈，遇到錯誤即停止
+    
+    Args:
+        chain: plan_moves 產生的操作鏈
+        observer: 每個實際執行的操作結束時呼叫，在執行鏈的執行緒中執行
+        no_clobber: 以 rename_noreplace 執行，目標在驗證後才出現時不會被覆蓋
+        handles: 已開啟的目錄，有則以 dir_fd 相對名稱重命名
+        throttle: throttle.Throttle，每個步驟前等待配額，結束後回報耗時
+        sync: 每個成功的步驟後通知，依耐久性模式 fsync 目錄
+
+    Returns:
+        Dict[int, Optional[str]]: 操作索引對應錯誤訊息（成功為 None）
+    """
+    if handles is None:
+        handles = DirectoryHandles()
+    rename = lambda src, dst: handles.move(src, dst, no_clobber)
+    results = {}
+    temp_step = None
+    temp_seconds = 0.0
+    timed = observer is not None or throttle is not None
+
+    for position, (src, dst, index, final) in enumerate(chain):
+        if throttle is not None:
+            throttle.acquire()
+        start = time.perf_counter() if timed else 0.0
+        try:
+            rename(src, dst)
+        except OSError as e:
+            if throttle is not None:
+                throttle.release(time.perf_counter() - start)
+            results[index] = str(e)
+            if observer is not None:
+                observer(index, time.perf_counter() - start)
+
+            for _, _, later_index, _ in chain[position + 1:]:
+                results.setdefault(later_index, "相依的重命名失敗，已跳過")
+
+            if temp_step is not None:
+                temp_path, original_path, temp_index = temp_step
+                # 只有在原位置尚未被佔用時才能把暫存檔移回去
+                if position == 1:
+                    try:
+                        rename(temp_path, original_path)
+                    except OSError as restore_error:
+                        results[temp_index] = f"無法還原暫存檔 {temp_path}: {restore_error}"
+                else:
+                    results[temp_index] = f"相依的重命名失敗，檔案暫存於 {temp_path}"
+            break
+
+        if throttle is not None:
+            throttle.release(time.perf_counter() - start)
+        if sync is not None:
+            sync.touched(handles, src, dst)
+        if final:
+            results[index] = None
+            if observer is not None:
+                seconds = time.perf_counter() - start
+                if temp_step is not None and temp_step[2] == index:
+                    seconds += temp_seconds  # 循環操作分成移到暫存名稱與移回兩步
+                observer(index, seconds)
+        else:
+            temp_step = (dst, src, index)
+            if observer is not None:
+                temp_seconds = time.perf_counter() - start
+
+    return results
+
+
+def execute_moves(moves: List[Tuple[str, str]], max_workers: int = 1,
+                  observer: Optional[Observer] = None,
+                  no_clobber: bool = False, throttle=None,
+                  locality: bool = False,
+                  sync: Optional[DirectorySync] = None) -> List[Optional[str]]:
+    """
+    驗證、規劃並執行一批重命名
+
+    Args:
+        moves: (來源路徑, 目標路徑) 列表
+        max_workers: 平行執行的操作鏈數量
+        observer: 見 run_chain
+        no_clobber: 見 run_chain
+        throttle: 見 run_chain；使用自適應同時操作數時，執行緒數為其上限
+        locality: 依目錄與 inode 順序執行（見 order_chains），False 時依 moves 的順序
+        sync: 見 run_chain；結束前 fsync 所有尚未同步的目錄，結果見 sync.committed
+
+    Returns:
+        List[Optional[str]]: 與 moves 對應的錯誤訊息，成功為 None
+    """
+    directories = set()
+    for src, dst in moves:
+        directories.add(os.path.dirname(src))
+        directories.add(os.path.dirname(dst))
+
+    with DirectoryHandles(directories) as handles:
+        snapshot = snapshot_directories(directories, handles)
+        errors = validate_moves(moves, snapshot)
+        chains = plan_moves(moves, skip=errors)
+        if locality:
+            chains = order_chains(chains, snapshot)
+
+        results: List[Optional[str]] = [None] * len(moves)
+        for index, message in errors.items():
+            results[index] = message
+
+        if throttle is not None:
+            max_workers = max(max_workers, throttle.max_workers)
+        if any(handles.is_cross_device(src, dst) for src, dst in moves):
+            # 跨檔案系統的移動需要複製資料，以執行緒池同時處理多個檔案
+            max_workers = max(max_workers, TRANSFER_WORKERS)
+        if max_workers > 1 and len(chains) > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                chain_results = list(executor.map(
+                    lambda chain: run_chain(chain, observer, no_clobber, handles, throttle, sync),
+                    chains))
+        else:
+            chain_results = [run_chain(chain, observer, no_clobber, handles, throttle, sync)
+                             for chain in chains]
+        if sync is not None:
+            sync.flush(handles)
+
+    for chain_result in chain_results:
+        for index, message in chain_result.items():
+            results[index] = message
+
+    return results
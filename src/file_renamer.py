@@ -8,15 +8,43 @@ Core file renaming logic
 import os
 import re
 import json
+import threading
 from datetime import datetime
-from typing import List, Dict, Tuple, Optional
+from typing import Callable, List, Dict, Tuple, Optional
 from pathlib import Path
 
+try:
+    from .metadata import MetadataCache, TemplateContext, render_template, template_fields
+    from .hashing import HashCache, hash_file, hash_files
+    from .media_date import read_media_dates
+    from .sorting import SORT_ORDERS, sort_files
+    from .executor import DURABILITY_MODES, DirectoryHandles, DirectorySync, execute_moves
+    from .throttle import AdaptiveConcurrency, Throttle
+    from .instrumentation import NULL_STAGE
+    from .metrics import failure_reason
+    from .utils import UniqueNameAllocator, backup_files, gc_paused
+    from .validation import FILENAME_PROFILES, get_validator
+    from .plan_file import write_plan
+    from .state import RenameState
+except ImportError:  # 以 src 目錄直接匯入時（test.py、main.py）
+    from metadata import MetadataCache, TemplateContext, render_template, template_fields
+    from hashing import HashCache, hash_file, hash_files
+    from media_date import read_media_dates
+    from sorting import SORT_ORDERS, sort_files
+    from executor import DURABILITY_MODES, DirectoryHandles, DirectorySync, execute_moves
+    from throttle import AdaptiveConcurrency, Throttle
+    from instrumentation import NULL_STAGE
+    from metrics import failure_reason
+    from utils import UniqueNameAllocator, backup_files, gc_paused
+    from validation import FILENAME_PROFILES, get_validator
+    from plan_file import write_plan
+    from state import RenameState
+
 class RenameRule:
     """重命名規則類別"""
     
     def __init__(self):
-        self.rule_type = "none"  # none, prefix, suffix, replace, sequence, case
+        self.rule_type = "none"  # none, prefix, suffix, replace, sequence, case, template, hash
         self.prefix = ""
         self.suffix = ""
         self.find_text = ""
@@ -25,159 +53,968 @@ class RenameRule:
         self.sequence_digits = 3
         self.case_option = "keep"  # keep, upper, lower, title, capitalize
         self.include_extension = False
+        self.template = ""  # 例如: {mtime:%Y%m%d}_{size}_{seq}
+        self.hash_algorithm = "sha256"
+        self.hash_length = 16  # 0 表示完整雜湊值
+    
+    def signature(self) -> tuple:
+        """規則內容的簽章，內容相同的規則簽章相同"""
+        return tuple(sorted(vars(self).items()))
+    
+    def depends_on_position(self) -> bool:
+        """結果是否取決於檔案在清單中的位置（序列編號、範本的 {index}、{seq}）"""
+        if self.rule_type == "sequence":
+            return True
+        if self.rule_type == "template":
+            return bool(template_fields(self.template) & {'index', 'seq'})
+        return False
 
 class FileRenamer:
     """檔案重命名器主類別"""
     
     def __init__(self):
         self.source_directory = ""
-        self.files_list = []
-        self.filtered_files = []
-        self.rename_rules = []
-        self.file_filters = []
-        self.history = []
+        self.target_directory = None  # 移動模式的目標目錄，None 表示在原目錄中重命名
+        # 掃描結果、過濾條件與規則鏈的不可變快照，修改時整個替換（見 state.py）
+        self._state = RenameState()
+        self._state_lock = threading.Lock()  # 只在替換快照與預覽計畫時持有，讀取不需要
+        self.metadata_cache = MetadataCache()
+        self.hash_cache = HashCache()
+        self.preview_version = 0
+        self.preview_plan = None  # 最近一次預覽的結果與產生它的版本資訊
+        self.instrumentation = None  # 設定 Instrumentation 以記錄各階段耗時
+        self.metrics = None  # 設定 RenameMetrics 以記錄重命名計數與延遲
         self.settings = self.load_settings()
+        self.sort_order = self.settings.get('sort_order', 'name')
+        self.sort_reverse = self.settings.get('sort_reverse', False)
+        if self.sort_order not in SORT_ORDERS:
+            self.sort_order = 'name'
+        self.max_workers = self.settings.get('max_workers', 1)
+        # 以 renameat2(RENAME_NOREPLACE) 等方式執行，預覽後才出現的檔案不會被覆蓋；
+        # 預設開啟（先前版本會覆蓋這類檔案），設定檔中設為 false 恢復舊行為
+        self.no_clobber = self.settings.get('no_clobber', True)
+        # 共用儲存裝置上的節流：每秒操作數上限與延遲目標（毫秒），None 表示不限制
+        self.max_ops_per_second = self.settings.get('max_ops_per_second')
+        self.latency_slo_ms = self.settings.get('latency_slo_ms')
+        self.last_throttle_stats = {}
+        # 依目錄與 inode 順序執行，而不是顯示順序（冷快取的大目錄、NFS 上可能較快）
+        self.locality_order = self.settings.get('locality_order', False)
+        # 耐久性模式：none（不 fsync）、batch（每 sync_every 個操作與結束時 fsync 目錄）、strict（每個操作）
+        self.durability = self.settings.get('durability', 'none')
+        if self.durability not in DURABILITY_MODES:
+            self.durability = 'none'
+        self.sync_every = self.settings.get('sync_every', 1000)
+        self.last_sync_stats = {}
+        # 重命名前的快照備份（硬連結 → reflink → 複製）
+        self.backup_before_rename = self.settings.get('backup_before_rename', False)
+        self.backup_method = self.settings.get('backup_method', 'auto')
+        self.backup_root = self.settings.get('backup_dir')  # None 表示放在來源目錄中
+        self.last_backup_stats = {}
+        # 預覽時將已存在或重複的目標檔名自動加上 _1、_2…，而不是標示為衝突
+        self.auto_resolve_conflicts = self.settings.get('auto_resolve_conflicts', False)
+        self.set_filename_profile(self.settings.get('filename_profile', 'windows'),
+                                  self.settings.get('filename_max_bytes'))
+    
+    def _stage(self, name: str):
+        """取得量測階段，未啟用效能分析時返回不做任何事的空階段"""
+        if self.instrumentation is None:
+            return NULL_STAGE
+        return self.instrumentation.stage(name)
+    
+    def snapshot(self) -> RenameState:
+        """
+        目前的狀態快照
+        
+        背景工作在開始時取得快照並只使用它，介面同時修改規則或重新掃描不會影響計算中的工作。
+        """
+        return self._state
+    
+    def _update(self, compute: Callable[[RenameState], Dict],
+                affects_preview: bool = True) -> RenameState:
+        """
+        以目前的快照為基礎發布新的快照
+        
+        compute 在鎖外執行並返回要修改的欄位；替換時若快照已被其他執行緒更新，
+        以新的快照重新計算，不會覆蓋對方的修改。
+        
+        Args:
+            compute: 接收基礎快照，返回 {欄位: 新值}，返回 None 表示不需修改
+            affects_preview: 修改是否影響預覽結果；只更新歷史或規則快取時不遞增版本號，
+                進行中的預覽不會因此被視為過期
+        
+        Returns:
+            RenameState: 發布的快照
+        """
+        while True:
+            base = self._state
+            changes = compute(base)
+            if changes is None:
+                return base
+            with self._state_lock:
+                if self._state is base:
+                    generation = base.generation + 1 if affects_preview else base.generation
+                    self._state = base.replace(generation=generation, **changes)
+                    return self._state
+    
+    # 以下屬性讀取目前的快照；集合以 tuple / frozenset 返回，修改請使用對應的方法
+    @property
+    def files_list(self) -> Tuple[Dict, ...]:
+        return self._state.files
+    
+    @property
+    def filtered_files(self) -> Tuple[Dict, ...]:
+        return self._state.filtered
+    
+    @property
+    def directory_names(self) -> frozenset:
+        return self._state.directory_names
+    
+    @property
+    def file_filters(self) -> Tuple[str, ...]:
+        return self._state.filters
+    
+    @property
+    def include_paths(self) -> frozenset:
+        return self._state.include_paths
+    
+    @property
+    def exclude_paths(self) -> frozenset:
+        return self._state.exclude_paths
+    
+    @property
+    def scan_generation(self) -> int:
+        return self._state.scan_generation
+    
+    @property
+    def scan_mtime_ns(self) -> Optional[int]:
+        return self._state.scan_mtime_ns
+    
+    @property
+    def files_generation(self) -> int:
+        return self._state.files_generation
+    
+    @property
+    def rename_rules(self) -> Tuple[RenameRule, ...]:
+        return self._state.rules
+    
+    @rename_rules.setter
+    def rename_rules(self, rules):
+        rules = tuple(rules)
+        self._update(lambda state: {'rules': rules})
+    
+    @property
+    def history(self) -> Tuple[Dict, ...]:
+        return self._state.history
+    
+    @history.setter
+    def history(self, history):
+        history = tuple(history)
+        self._update(lambda state: {'history': history}, affects_preview=False)
+    
+    @property
+    def last_preview_stats(self) -> Dict:
+        """最近一次預覽的雜湊與拍攝日期統計（與 preview_plan 一起記錄）"""
+        plan = self.preview_plan
+        return plan['stats'] if plan is not None else {}
     
     def set_source_directory(self, directory: str) -> bool:
         """設定來源目錄"""
         if not os.path.exists(directory) or not os.path.isdir(directory):
             return False
         
+        if directory != self.source_directory:
+            self._update(lambda state: {'include_paths': frozenset(), 'exclude_paths': frozenset()})
         self.source_directory = directory
         self.refresh_files_list()
         return True
     
+    def set_target_directory(self, directory: Optional[str]) -> bool:
+        """
+        設定移動模式的目標目錄（可位於其他檔案系統），None 表示在原目錄中重命名
+        
+        Returns:
+            bool: 目標目錄是否可用
+        """
+        if directory is not None:
+            directory = os.path.abspath(directory)
+            if not os.path.isdir(directory):
+                return False
+            if directory == self.source_directory:
+                directory = None
+        self.target_directory = directory
+        return True
+    
+    def _target_path(self, new_name: str) -> str:
+        return os.path.join(self.target_directory or self.source_directory, new_name)
+    
+    def _needs_move(self, result: Dict) -> bool:
+        return self.target_directory is not None or result['original_name'] != result['new_name']
+    
+    def _target_names(self, state: Optional[RenameState] = None) -> set:
+        """目標目錄中已存在的名稱（重命名時即為掃描結果）"""
+        if self.target_directory is None:
+            return (state or self._state).directory_names
+        try:
+            with os.scandir(self.target_directory) as entries:
+                return {entry.name for entry in entries}
+        except OSError as e:
+            print(f"讀取目標目錄時發生錯誤: {e}")
+            return set()
+    
+    def is_cross_device(self) -> bool:
+        """目標目錄是否位於另一個檔案系統（移動時需複製資料）"""
+        if self.target_directory is None:
+            return False
+        try:
+            return os.stat(self.source_directory).st_dev != os.stat(self.target_directory).st_dev
+        except OSError:
+            return False
+    
     def refresh_files_list(self):
         """刷新檔案列表"""
         if not self.source_directory:
             return
         
-        self.files_list = []
-        try:
-            for filename in os.listdir(self.source_directory):
-                filepath = os.path.join(self.source_directory, filename)
-                if os.path.isfile(filepath):
-                    self.files_list.append({
-                        'original_name': filename,
-                        'full_path': filepath,
-                        'size': os.path.getsize(filepath),
-                        'modified': datetime.fromtimestamp(os.path.getmtime(filepath))
-                    })
-            
-            # 按檔名排序
-            self.files_list.sort(key=lambda x: x['original_name'].lower())
-            self.apply_filters()
+        with self._stage("scan") as stage:
+            files = []
+            directory_names = set()
+            scan_mtime_ns = None
+            try:
+                # scandir 直接提供檔案類型與 inode，每個檔案只需一次 stat；
+                # 以目錄 fd 掃描時 stat 是相對於該目錄，不需重新解析完整路徑
+                prefix = os.path.join(self.source_directory, '')
+                with DirectoryHandles([self.source_directory]) as handles:
+                    fd = handles.fds.get(self.source_directory)
+                    # 掃描前取得 mtime，掃描期間的變更也會讓預覽被視為過期
+                    scan_mtime_ns = (os.stat(self.source_directory) if fd is None
+                                     else os.fstat(fd)).st_mtime_ns
+                    with os.scandir(self.source_directory if fd is None else fd) as entries:
+                        for entry in entries:
+                            directory_names.add(entry.name)
+                            if entry.is_file():
+                                stat = entry.stat()
+                                files.append({
+                                    'original_name': entry.name,
+                                    'full_path': prefix + entry.name,
+                                    'size': stat.st_size,
+                                    'modified': datetime.fromtimestamp(stat.st_mtime),
+                                    'inode': entry.inode(),
+                                    'mtime_ns': stat.st_mtime_ns
+                                })
+                
+                # 移除已不存在檔案的中繼資料快取與雜湊快取
+                self.metadata_cache.prune(files)
+                self.hash_cache.prune(self.source_directory, files)
+                
+                # 依目前的排序方式排序
+                sort_files(files, self.sort_order, self.sort_reverse)
+                
+            except Exception as e:
+                print(f"讀取檔案列表時發生錯誤: {e}")
             
-        except Exception as e:
-            print(f"讀取檔案列表時發生錯誤: {e}")
+            stage.items = len(files)
+        
+        files = tuple(files)
+        directory_names = frozenset(directory_names)
+        with self._stage("filter") as stage:
+            state = self._update(lambda base: dict(
+                self._filter_changes(base, files=files),
+                directory_names=directory_names,
+                scan_generation=base.scan_generation + 1,
+                scan_mtime_ns=scan_mtime_ns))
+            stage.items = len(state.filtered)
+    
+    def set_sort_order(self, order: str, reverse: bool = False):
+        """設定排序方式，重用掃描紀錄中已計算的排序鍵"""
+        if order not in SORT_ORDERS:
+            raise ValueError(f"未知的排序方式: {order}")
+        
+        self.sort_order = order
+        self.sort_reverse = reverse
+        
+        def compute(base):
+            files = list(base.files)
+            sort_files(files, order, reverse)
+            return self._filter_changes(base, files=tuple(files))
+        self._update(compute)
+    
+    def set_filename_profile(self, profile: str, max_bytes: Optional[int] = None):
+        """設定檔名驗證規則（windows, posix, smb），可另外限制 UTF-8 位元組數"""
+        if profile not in FILENAME_PROFILES:
+            profile = 'windows'
+        self.filename_profile = profile
+        self.filename_max_bytes = max_bytes
+        self.validator = get_validator(profile, max_bytes)
     
     def set_file_filters(self, filters: List[str]):
         """設定檔案過濾器"""
-        self.file_filters = filters
-        self.apply_filters()
+        filters = tuple(filters)
+        self._apply_filters(filters=filters)
+    
+    def exclude_files(self, paths):
+        """排除指定路徑的檔案"""
+        paths = frozenset(paths)
+        self._apply_filters(lambda base: {'exclude_paths': base.exclude_paths | paths,
+                                          'include_paths': base.include_paths - paths})
+    
+    def include_only(self, paths):
+        """只處理指定路徑的檔案"""
+        paths = frozenset(paths)
+        self._apply_filters(lambda base: {'include_paths': paths,
+                                          'exclude_paths': base.exclude_paths - paths})
+    
+    def _rename_path_filters(self, moves):
+        """重命名成功後，讓個別排除或只處理的設定跟著檔案的新路徑"""
+        state = self._state
+        if not state.include_paths and not state.exclude_paths:
+            return
+        renamed = dict(moves)
+        
+        def follow(paths):
+            return frozenset(renamed.get(path, path) for path in paths)
+        self._update(lambda base: {'include_paths': follow(base.include_paths),
+                                   'exclude_paths': follow(base.exclude_paths)})
+    
+    def clear_path_filters(self):
+        """清除個別排除或只處理的設定"""
+        self._apply_filters(include_paths=frozenset(), exclude_paths=frozenset())
     
     def apply_filters(self):
         """應用檔案過濾器"""
-        if not self.file_filters:
-            self.filtered_files = self.files_list.copy()
-            return
+        self._apply_filters()
+    
+    def _apply_filters(self, paths: Optional[Callable[[RenameState], Dict]] = None, **changes):
+        """修改過濾設定並重新過濾，paths 依基礎快照計算路徑集合的變更"""
+        with self._stage("filter") as stage:
+            def compute(base):
+                fields = dict(changes)
+                if paths is not None:
+                    fields.update(paths(base))
+                return self._filter_changes(base, **fields)
+            state = self._update(compute)
+            stage.items = len(state.filtered)
+    
+    def _filter_changes(self, base: RenameState, **changes) -> Dict:
+        """套用修改後的過濾設定，返回包含新過濾結果的欄位"""
+        # 過濾結果改變後，規則快取中的欄位資料不再對應
+        changes['files_generation'] = base.files_generation + 1
+        files = changes.get('files', base.files)
+        filters = changes.get('filters', base.filters)
+        include_paths = changes.get('include_paths', base.include_paths)
+        exclude_paths = changes.get('exclude_paths', base.exclude_paths)
+        
+        filtered = self._filter_by_name(files, filters) if filters else files
+        
+        # 個別排除或只處理的檔案，以路徑集合查詢
+        if include_paths:
+            filtered = [file_info for file_info in filtered
+                        if file_info['full_path'] in include_paths]
+        if exclude_paths:
+            filtered = [file_info for file_info in filtered
+                        if file_info['full_path'] not in exclude_paths]
+        changes['filtered'] = tuple(filtered)
+        changes['rule_cache'] = self._subset_rule_cache(base, changes['filtered'],
+                                                        changes['files_generation'])
+        return changes
+    
+    @staticmethod
+    def _subset_rule_cache(base: RenameState, filtered: Tuple[Dict, ...],
+                           files_generation: int) -> Optional[Tuple]:
+        """
+        新的過濾結果只是移除了部分檔案（排除、只處理選取的檔案）時，沿用規則快取
+        
+        不受位置影響的規則只需從各欄取出保留的檔案；序列編號等規則之後的欄位需要重新計算。
         
-        self.filtered_files = []
-        for file_info in self.files_list:
+        Returns:
+            Optional[Tuple]: 新過濾結果的規則快取，無法沿用時為 None
+        """
+        cache = base.rule_cache
+        if cache is None or cache[0] != base.files_generation or not filtered:
+            return None
+        # 掃描紀錄在快照之間共用，以物件身分對應到舊的位置，且順序必須不變
+        positions = {id(file_info): index for index, file_info in enumerate(base.filtered)}
+        indices = []
+        previous = -1
+        for file_info in filtered:
+            index = positions.get(id(file_info))
+            if index is None or index <= previous:
+                return None
+            indices.append(index)
+            previous = index
+        
+        signatures, columns, position_free = cache[1], cache[2], cache[3]
+        columns = tuple(([names[index] for index in indices], [exts[index] for index in indices])
+                        for names, exts in columns[:position_free + 1])
+        return (files_generation, signatures[:position_free], columns, position_free)
+    
+    @staticmethod
+    def _filter_by_name(files, filters) -> List[Dict]:
+        # 副檔名以集合查詢，檔名模式只編譯一次
+        extensions = set()
+        patterns = []
+        for filter_pattern in filters:
+            if filter_pattern.startswith('.'):
+                extensions.add(filter_pattern.lower())
+            else:
+                try:
+                    patterns.append(re.compile(filter_pattern, re.IGNORECASE))
+                except re.error:
+                    # 輸入到一半的模式（如 "[a"）當作一般文字比對
+                    patterns.append(re.compile(re.escape(filter_pattern), re.IGNORECASE))
+        
+        filtered = []
+        append = filtered.append
+        for file_info in files:
             filename = file_info['original_name']
-            file_ext = os.path.splitext(filename)[1].lower()
             
             # 檢查是否符合任一過濾條件
-            for filter_pattern in self.file_filters:
-                if filter_pattern.startswith('.'):
-                    # 副檔名過濾
-                    if file_ext == filter_pattern.lower():
-                        self.filtered_files.append(file_info)
-                        break
-                else:
-                    # 檔名模式過濾
-                    if re.search(filter_pattern, filename, re.IGNORECASE):
-                        self.filtered_files.append(file_info)
-                        break
+            if extensions:
+                file_ext = file_info.get('ext_lower')
+                if file_ext is None:
+                    file_ext = file_info['ext_lower'] = os.path.splitext(filename)[1].lower()
+                if file_ext in extensions:
+                    append(file_info)
+                    continue
+            
+            for pattern in patterns:
+                if pattern.search(filename):
+                    append(file_info)
+                    break
+        return filtered
     
     def add_rename_rule(self, rule: RenameRule):
         """添加重命名規則"""
-        self.rename_rules.append(rule)
+        self._update(lambda state: {'rules': state.rules + (rule,)})
     
     def clear_rename_rules(self):
         """清除所有重命名規則"""
-        self.rename_rules.clear()
+        self._update(lambda state: {'rules': ()})
     
-    def preview_rename(self) -> List[Dict]:
-        """預覽重命名結果"""
+    def move_rename_rule(self, index: int, new_index: int):
+        """移動規則到新的位置"""
+        def compute(state):
+            rules = list(state.rules)
+            rules.insert(new_index, rules.pop(index))
+            return {'rules': tuple(rules)}
+        self._update(compute)
+    
+    def remove_rename_rule(self, index: int):
+        """刪除指定的規則"""
+        self._update(lambda state: {'rules': state.rules[:index] + state.rules[index + 1:]})
+    
+    def preview_rename(self, rules: Optional[List[RenameRule]] = None,
+                       should_cancel: Optional[Callable[[], bool]] = None,
+                       state: Optional[RenameState] = None,
+                       on_chunk: Optional[Callable[[List[Dict]], None]] = None,
+                       chunk_size: int = 4096) -> Optional[List[Dict]]:
+        """
+        預覽重命名結果
+        
+        整個預覽只使用開始時的狀態快照，可在背景執行緒中與介面的修改同時進行。
+        
+        Args:
+            rules: 要預覽的規則，預設為快照中的規則列表（即時預覽會另外加上編輯中的規則）
+            should_cancel: 在各階段之間與比對衝突時定期呼叫，返回 True 時中止預覽
+            state: 要預覽的快照，預設為目前的快照
+            on_chunk: 每比對完 chunk_size 筆即以這一段結果呼叫，不必等整個預覽完成
+            chunk_size: 比對衝突時每段的筆數（每段之間檢查 should_cancel）
+        
+        Returns:
+            Optional[List[Dict]]: 預覽結果，被取消時為 None
+        """
+        if state is None:
+            state = self._state
+        if rules is None:
+            rules = state.rules
         preview_results = []
+        config = self._preview_config(rules, state)
         
-        for i, file_info in enumerate(self.filtered_files):
-            original_name = file_info['original_name']
-            new_name = self.apply_rename_rules(original_name, i)
-            
-            # 檢查衝突
-            conflict = False
-            conflict_reason = ""
+        with self._stage("preview") as preview_stage, gc_paused():
+            with self._stage("prefetch") as stage:
+                stats = self.prefetch_hashes(rules, state.filtered, should_cancel)
+                if should_cancel is not None and should_cancel():
+                    return None
+                stats.update(self.prefetch_media_dates(rules, state.filtered))
+                stage.items = len(state.filtered)
             
-            # 檢查檔名是否有效
-            if not self.is_valid_filename(new_name):
-                conflict = True
-                conflict_reason = "檔名包含無效字元"
+            with self._stage("rules") as stage:
+                new_names = self.compute_new_names(rules, should_cancel, state)
+                if new_names is None:
+                    return None
+                stage.items = len(new_names)
             
-            # 檢查是否與現有檔案衝突
-            new_path = os.path.join(self.source_directory, new_name)
-            if os.path.exists(new_path) and new_name != original_name:
-                conflict = True
-                conflict_reason = "檔名已存在"
+            with self._stage("conflicts") as stage:
+                allocator = None
+                directory_names = self._target_names(state)
+                if self.auto_resolve_conflicts:
+                    allocator = UniqueNameAllocator(directory_names)
+                targets = set()
+                moving = self.target_directory is not None
+                append = preview_results.append
+                files = state.filtered
+                invalid_reasons = self.validator.check_many(new_names)
+                
+                # 分段處理，每段之間檢查是否已被新的輸入取消
+                for start in range(0, len(files), chunk_size):
+                    if should_cancel is not None and should_cancel():
+                        return None
+                    end = start + chunk_size
+                    
+                    for file_info, new_name, invalid_reason in zip(
+                            files[start:end], new_names[start:end], invalid_reasons[start:end]):
+                        original_name = file_info['original_name']
+                        
+                        # 檢查衝突
+                        conflict = False
+                        conflict_reason = ""
+                        auto_renamed = False
+                        
+                        # 檢查檔名是否有效
+                        if invalid_reason is not None:
+                            conflict = True
+                            conflict_reason = invalid_reason
+                        
+                        # 檢查是否與現有檔案或同批的其他目標衝突（以掃描結果判斷，不需逐檔 stat；
+                        # 執行時會再驗證，no_clobber 模式下也不會覆蓋之後才出現的檔案）
+                        elif moving or new_name != original_name:
+                            if allocator is not None:
+                                unique_name = allocator.allocate(new_name)
+                                auto_renamed = unique_name != new_name
+                                new_name = unique_name
+                            elif new_name in directory_names:
+                                conflict = True
+                                conflict_reason = "檔名已存在"
+                            elif new_name in targets:
+                                conflict = True
+                                conflict_reason = "檔名重複"
+                            targets.add(new_name)
+                        
+                        append({
+                            'original_name': original_name,
+                            'new_name': new_name,
+                            'full_path': file_info['full_path'],
+                            'conflict': conflict,
+                            'conflict_reason': conflict_reason,
+                            'auto_renamed': auto_renamed,
+                            'size': file_info['size'],
+                            'modified': file_info['modified']
+                        })
+                    if on_chunk is not None:
+                        # 之後的項目不會改變已比對項目的衝突狀態，可以先交出
+                        on_chunk(preview_results[start:])
+                stage.items = len(preview_results)
             
-            preview_results.append({
-                'original_name': original_name,
-                'new_name': new_name,
-                'full_path': file_info['full_path'],
-                'conflict': conflict,
-                'conflict_reason': conflict_reason,
-                'size': file_info['size'],
-                'modified': file_info['modified']
-            })
+            preview_stage.items = len(preview_results)
         
+        self._store_plan(preview_results, config, state, stats)
         return preview_results
     
-    def apply_rename_rules(self, filename: str, index: int) -> str:
-        """應用重命名規則到單個檔名"""
-        name, ext = os.path.splitext(filename)
-        result_name = name
+    def _preview_config(self, rules: List[RenameRule], state: RenameState) -> tuple:
+        """影響預覽結果的設定（過濾後的檔案版本、規則內容與驗證選項）"""
+        return (state.files_generation, tuple(rule.signature() for rule in rules),
+                self.auto_resolve_conflicts, self.filename_profile, self.filename_max_bytes,
+                self.target_directory)
+    
+    def _store_plan(self, preview_results: List[Dict], config: tuple, state: RenameState,
+                    stats: Dict, revalidated: int = 0) -> bool:
+        """記錄為最近一次預覽；計算期間已有以較新快照完成的預覽時捨棄，返回是否已記錄"""
+        with self._state_lock:
+            plan = self.preview_plan
+            if plan is not None and plan['generation'] > state.generation:
+                return False
+            self.preview_version += 1
+            self.preview_plan = {
+                'version': self.preview_version,
+                'generation': state.generation,
+                'results': preview_results,
+                'config': config,
+                'scan_generation': state.scan_generation,
+                'mtime_ns': state.scan_mtime_ns,
+                'stats': stats,
+                'revalidated': revalidated,
+            }
+            return True
+    
+    def preview_token(self) -> Tuple[int, Optional[int]]:
+        """
+        目前目錄狀態的版本: (掃描版本, 目錄 mtime)
         
-        for rule in self.rename_rules:
-            if rule.rule_type == "prefix":
-                result_name = rule.prefix + result_name
+        只需 stat 目錄一次；目錄中新增、刪除或重命名項目都會改變 mtime。
+        """
+        try:
+            mtime_ns = os.stat(self.source_directory).st_mtime_ns
+        except OSError:
+            mtime_ns = None
+        return self._state.scan_generation, mtime_ns
+    
+    def files_changed(self) -> bool:
+        """
+        掃描紀錄中是否有檔案的大小、修改時間或 inode 已改變
+        
+        就地改寫檔案不會改變目錄 mtime，preview_token 看不出來；這裡以目錄 fd 逐一 stat
+        掃描到的檔案（不需重新列出目錄、排序與過濾），遇到第一個差異即返回。
+        """
+        files = self._state.files
+        if not files:
+            return False
+        with DirectoryHandles([self.source_directory]) as handles:
+            for file_info in files:
+                name, fd = handles.resolve(file_info['full_path'])
+                try:
+                    stat = os.stat(name, dir_fd=fd)
+                except OSError:
+                    return True
+                if (stat.st_size != file_info['size'] or
+                        stat.st_mtime_ns != file_info.get('mtime_ns') or
+                        stat.st_ino != file_info.get('inode', stat.st_ino)):
+                    return True
+        return False
+    
+    def get_execution_plan(self, preview_results: Optional[List[Dict]] = None) -> List[Dict]:
+        """
+        取得要執行的重命名計畫
+        
+        使用者檢視過的預覽仍是最近一次預覽、且規則與設定都沒變時直接重用；
+        目錄在預覽後有變動時重新掃描，只重新驗證受影響的項目；
+        其他情況（例如規則已修改）重新預覽。
+        
+        Args:
+            preview_results: 畫面上的預覽結果，None 表示最近一次預覽
+        
+        Returns:
+            List[Dict]: 可交給 execute_rename 的預覽結果
+        """
+        plan = self.preview_plan
+        state = self._state
+        if (plan is None or
+                (preview_results is not None and preview_results is not plan['results']) or
+                plan['config'] != self._preview_config(state.rules, state)):
+            return self.preview_rename()
+        
+        token = (plan['scan_generation'], plan['mtime_ns'])
+        if plan['mtime_ns'] is not None and self.preview_token() == token:
+            return plan['results']
+        
+        if self.target_directory is not None:
+            # 重新驗證只比對來源目錄的變動，移動模式直接重新預覽
+            return self.preview_rename()
+        return self._revalidate_plan(plan)
+    
+    def export_plan(self, path: str, preview_results: Optional[List[Dict]] = None) -> Dict:
+        """
+        將預覽結果寫成計畫檔，之後可用無介面模式的 --run-plan 執行
+        
+        有衝突或檔名沒有變化的項目不會寫入。
+        
+        Args:
+            path: 計畫檔路徑
+            preview_results: 預覽結果，None 表示最近一次預覽（過期時會重新驗證）
+        
+        Returns:
+            Dict: 操作數、操作鏈數、步驟數與略過的衝突數
+        """
+        if preview_results is None:
+            preview_results = self.get_execution_plan()
+        
+        moves = [(result['full_path'], self._target_path(result['new_name']))
+                 for result in preview_results
+                 if not result['conflict'] and self._needs_move(result)]
+        with self._stage("export_plan") as stage:
+            stats = write_plan(path, self.source_directory, moves, self.locality_order)
+            stage.items = len(moves)
+        
+        stats['conflicts'] = sum(1 for result in preview_results if result['conflict'])
+        return stats
+    
+    def _revalidate_plan(self, plan: Dict) -> List[Dict]:
+        """重新掃描目錄，只重新檢查來源或目標檔名在預覽後有變動的項目"""
+        with self._stage("revalidate") as stage:
+            old_names = self._state.directory_names
+            self.refresh_files_list()
+            state = self._state
+            added = state.directory_names - old_names
+            removed = old_names - state.directory_names
+            
+            results = plan['results']
+            changed = 0
+            if added or removed:
+                targets = {result['new_name'] for result in results
+                           if not result['conflict'] and result['new_name'] != result['original_name']}
+                revalidated = []
+                for result in results:
+                    original_name = result['original_name']
+                    new_name = result['new_name']
+                    reason = None
+                    
+                    if original_name in removed:
+                        reason = "來源檔案不存在"
+                    elif new_name != original_name and new_name in added:
+                        reason = "檔名已存在"
+                    elif result['conflict_reason'] == "檔名已存在" and new_name in removed:
+                        # 原本佔用目標檔名的檔案已被移走
+                        reason = "檔名重複" if new_name in targets else ""
+                        targets.add(new_name)
+                    
+                    if reason is not None and reason != result['conflict_reason']:
+                        result = dict(result, conflict=bool(reason), conflict_reason=reason)
+                        changed += 1
+                    revalidated.append(result)
+                results = revalidated
             
-            elif rule.rule_type == "suffix":
-                result_name = result_name + rule.suffix
+            self._store_plan(results, self._preview_config(state.rules, state), state,
+                             plan['stats'], changed)
+            stage.items = changed
+        
+        return results
+    
+    def prefetch_hashes(self, rules: Optional[List[RenameRule]] = None,
+                        files: Optional[List[Dict]] = None,
+                        should_cancel: Optional[Callable[[], bool]] = None):
+        """
+        以執行緒池預先計算雜湊規則需要的檔案雜湊（files 預設為目前過濾後的檔案）
+        
+        should_cancel 在每個檔案開始前呼叫，返回 True 時不再計算其餘檔案
+        
+        Returns:
+            Dict: 各演算法的統計（鍵為 hash:演算法）
+        """
+        if rules is None:
+            rules = self._state.rules
+        if files is None:
+            files = self._state.filtered
+        algorithms = {rule.hash_algorithm for rule in rules if rule.rule_type == "hash"}
+        all_stats = {}
+        
+        for algorithm in algorithms:
+            field = f"hash:{algorithm}"
+            missing = [file_info for file_info in files
+                       if self.metadata_cache.peek(file_info, field) is None]
             
-            elif rule.rule_type == "replace":
-                if rule.include_extension:
-                    full_name = result_name + ext
-                    full_name = full_name.replace(rule.find_text, rule.replace_text)
-                    result_name, ext = os.path.splitext(full_name)
-                else:
-                    result_name = result_name.replace(rule.find_text, rule.replace_text)
+            digests, stats = hash_files(missing, algorithm, self.hash_cache,
+                                        should_cancel=should_cancel)
+            for file_info in missing:
+                digest = digests.get(file_info['full_path'])
+                if digest is not None:
+                    self.metadata_cache.put(file_info, field, digest)
             
-            elif rule.rule_type == "sequence":
-                sequence_num = str(rule.sequence_start + index).zfill(rule.sequence_digits)
-                result_name = sequence_num
+            # 記憶體快取命中也計入命中率
+            total = len(files)
+            stats['files'] = total
+            stats['cache_hits'] += total - len(missing)
+            stats['cache_hit_rate'] = stats['cache_hits'] / total if total else 0.0
+            for error in stats['errors']:
+                print(f"計算雜湊時發生錯誤: {error}")
             
-            elif rule.rule_type == "case":
-                if rule.case_option == "upper":
-                    result_name = result_name.upper()
-                elif rule.case_option == "lower":
-                    result_name = result_name.lower()
-                elif rule.case_option == "title":
-                    result_name = result_name.title()
-                elif rule.case_option == "capitalize":
-                    result_name = result_name.capitalize()
-        
-        return result_name + ext
+            all_stats[field] = stats
+            if stats['cancelled']:
+                break
+        return all_stats
+    
+    def prefetch_media_dates(self, rules: Optional[List[RenameRule]] = None,
+                             files: Optional[List[Dict]] = None) -> Dict:
+        """
+        以執行緒池預先讀取範本需要的拍攝日期（files 預設為目前過濾後的檔案）
+        
+        Returns:
+            Dict: {'media_date': 統計}，範本不需要拍攝日期時為空
+        """
+        if rules is None:
+            rules = self._state.rules
+        if files is None:
+            files = self._state.filtered
+        needed = any(rule.rule_type == "template" and
+                     'media_date' in template_fields(rule.template)
+                     for rule in rules)
+        if not needed:
+            return {}
+        
+        missing = [file_info for file_info in files
+                   if self.metadata_cache.peek(file_info, 'media_date', False) is False]
+        
+        dates, stats = read_media_dates(missing)
+        for file_info in missing:
+            self.metadata_cache.put(file_info, 'media_date', dates.get(file_info['full_path']))
+        for error in stats['errors']:
+            print(f"讀取拍攝日期時發生錯誤: {error}")
+        
+        stats['cache_hits'] = len(files) - len(missing)
+        return {'media_date': stats}
+    
+    def get_file_hash(self, file_info: Dict, algorithm: str) -> Optional[str]:
+        """取得檔案雜湊，無法讀取時返回 None"""
+        def load(info):
+            try:
+                return hash_file(info['full_path'], algorithm)[0]
+            except (OSError, ValueError) as e:
+                print(f"計算雜湊時發生錯誤: {e}")
+                return None
+        
+        return self.metadata_cache.get(file_info, f"hash:{algorithm}", load)
+    
+    def _make_file_info(self, filename: str) -> Dict:
+        """為不在掃描紀錄中的檔名建立最小紀錄"""
+        return {
+            'original_name': filename,
+            'full_path': os.path.join(self.source_directory, filename)
+        }
+    
+    def apply_rename_rules(self, filename: str, index: int,
+                           file_info: Optional[Dict] = None) -> str:
+        """應用重命名規則到單個檔名"""
+        name, ext = os.path.splitext(filename)
+        
+        for rule in self.rename_rules:
+            name, ext = self._apply_rule(rule, name, ext, index, file_info, filename)
+        
+        return name + ext
+    
+    def _apply_rule(self, rule: RenameRule, name: str, ext: str, index: int,
+                    file_info: Optional[Dict], filename: str) -> Tuple[str, str]:
+        """將單一規則套用到 (主檔名, 副檔名)"""
+        if rule.rule_type == "prefix":
+            name = rule.prefix + name
+        
+        elif rule.rule_type == "suffix":
+            name = name + rule.suffix
+        
+        elif rule.rule_type == "replace":
+            if rule.include_extension:
+                full_name = name + ext
+                full_name = full_name.replace(rule.find_text, rule.replace_text)
+                name, ext = os.path.splitext(full_name)
+            else:
+                name = name.replace(rule.find_text, rule.replace_text)
+        
+        elif rule.rule_type == "sequence":
+            name = str(rule.sequence_start + index).zfill(rule.sequence_digits)
+        
+        elif rule.rule_type == "case":
+            if rule.case_option == "upper":
+                name = name.upper()
+            elif rule.case_option == "lower":
+                name = name.lower()
+            elif rule.case_option == "title":
+                name = name.title()
+            elif rule.case_option == "capitalize":
+                name = name.capitalize()
+        
+        elif rule.rule_type == "template":
+            if file_info is None:
+                file_info = self._make_file_info(filename)
+            context = TemplateContext(file_info, name, ext, index,
+                                      rule, self.metadata_cache)
+            name = render_template(rule.template, context)
+        
+        elif rule.rule_type == "hash":
+            if file_info is None:
+                file_info = self._make_file_info(filename)
+            digest = self.get_file_hash(file_info, rule.hash_algorithm)
+            if digest is not None:
+                name = digest[:rule.hash_length] if rule.hash_length > 0 else digest
+        
+        return name, ext
+    
+    def _apply_rule_column(self, rule: RenameRule, names: List[str], exts: List[str],
+                           files: List[Dict]) -> Tuple[List[str], List[str]]:
+        """
+        將單一規則套用到整欄檔名
+        
+        常用的規則以串列生成式一次處理整欄，其餘規則逐檔呼叫 _apply_rule，
+        兩者結果相同。
+        """
+        rule_type = rule.rule_type
+        
+        if rule_type == "prefix":
+            prefix = rule.prefix
+            return [prefix + name for name in names], exts
+        
+        if rule_type == "suffix":
+            suffix = rule.suffix
+            return [name + suffix for name in names], exts
+        
+        if rule_type == "replace" and not rule.include_extension:
+            find_text, replace_text = rule.find_text, rule.replace_text
+            return [name.replace(find_text, replace_text) for name in names], exts
+        
+        if rule_type == "sequence":
+            start, digits = rule.sequence_start, rule.sequence_digits
+            return [str(start + i).zfill(digits) for i in range(len(names))], exts
+        
+        if rule_type == "case":
+            method = {'upper': str.upper, 'lower': str.lower, 'title': str.title,
+                      'capitalize': str.capitalize}.get(rule.case_option)
+            if method is None:
+                return names, exts
+            return [method(name) for name in names], exts
+        
+        if rule_type not in ("replace", "template", "hash"):
+            return names, exts
+        
+        apply_rule = self._apply_rule
+        new_names = []
+        new_exts = []
+        for i, (name, ext, file_info) in enumerate(zip(names, exts, files)):
+            name, ext = apply_rule(rule, name, ext, i, file_info, file_info['original_name'])
+            new_names.append(name)
+            new_exts.append(ext)
+        return new_names, new_exts
+    
+    def compute_new_names(self, rules: Optional[List[RenameRule]] = None,
+                          should_cancel: Optional[Callable[[], bool]] = None,
+                          state: Optional[RenameState] = None) -> Optional[List[str]]:
+        """
+        計算過濾後所有檔案的新檔名
+        
+        每條規則套用後的整欄結果都會快取，以規則內容作為鍵；
+        只修改最後一條規則（例如即時預覽中的草稿規則）時，前面的規則不需重算。
+        
+        Args:
+            rules: 要套用的規則，預設為目前的規則列表
+            should_cancel: 每套用一條規則前呼叫，返回 True 時中止
+            state: 使用的快照，預設為目前的快照
+        
+        Returns:
+            Optional[List[str]]: 新檔名列表，被取消時為 None
+        """
+        if state is None:
+            state = self._state
+        if rules is None:
+            rules = state.rules
+        files = state.filtered
+        signatures = [rule.signature() for rule in rules]
+        
+        # 找出與上次計算相同的規則前綴
+        columns = []
+        cache = state.rule_cache
+        if cache is not None and cache[0] == state.files_generation:
+            columns = list(cache[2][:1])
+            for old, new, column in zip(cache[1], signatures, cache[2][1:]):
+                if old != new:
+                    break
+                columns.append(column)
+        
+        if not columns:
+            columns = [([], [])]
+            for file_info in files:
+                name, ext = os.path.splitext(file_info['original_name'])
+                columns[0][0].append(name)
+                columns[0][1].append(ext)
+        
+        for rule in rules[len(columns) - 1:]:
+            if should_cancel is not None and should_cancel():
+                return None
+            names, exts = columns[-1]
+            columns.append(self._apply_rule_column(rule, names, exts, files))
+        
+        position_free = next((index for index, rule in enumerate(rules)
+                              if rule.depends_on_position()), len(rules))
+        rule_cache = (state.files_generation, tuple(signatures), tuple(columns), position_free)
+        # 發布到目前的快照；過濾結果已改變時快取對目前的快照沒有用處
+        self._update(lambda base: ({'rule_cache': rule_cache}
+                                   if base.files_generation == state.files_generation else None),
+                     affects_preview=False)
+        names, exts = columns[len(rules)]
+        return [name + ext for name, ext in zip(names, exts)]
     
     def execute_rename(self, preview_results: List[Dict]) -> Tuple[int, int, List[str]]:
         """執行重命名操作"""
@@ -185,42 +1022,88 @@ class FileRenamer:
         error_count = 0
         errors = []
         rename_operations = []
+        metrics = self.metrics
         
         try:
+            pending = []
             for result in preview_results:
                 if result['conflict']:
                     error_count += 1
                     errors.append(f"{result['original_name']}: {result['conflict_reason']}")
+                    if metrics is not None:
+                        metrics.record_attempt()
+                        metrics.record_failure("conflict")
                     continue
                 
-                if result['original_name'] == result['new_name']:
+                if not self._needs_move(result):
                     continue  # 檔名沒有變化，跳過
                 
-                old_path = result['full_path']
-                new_path = os.path.join(self.source_directory, result['new_name'])
-                
-                try:
-                    os.rename(old_path, new_path)
-                    success_count += 1
-                    rename_operations.append({
-                        'old_name': result['original_name'],
-                        'new_name': result['new_name'],
-                        'old_path': old_path,
-                        'new_path': new_path,
-                        'timestamp': datetime.now()
-                    })
-                except Exception as e:
+                pending.append(result)
+            
+            backup_dir = None
+            self.last_backup_stats = {}
+            if self.backup_before_rename and pending:
+                backup_dir, pending = self._backup_pending(pending, errors)
+                error_count += len(self.last_backup_stats['errors'])
+                if metrics is not None:
+                    for _ in self.last_backup_stats['errors']:
+                        metrics.record_attempt()
+                        metrics.record_failure("backup_failed")
+            
+            # 整批驗證後依相依順序執行（可處理 a↔b 互換）
+            moves = [(result['full_path'], self._target_path(result['new_name']))
+                     for result in pending]
+            cross_device = self.is_cross_device()
+            with self._stage("execute") as stage:
+                observer = None
+                if metrics is not None:
+                    metrics.record_attempt(len(moves))
+                    observer = lambda index, seconds: metrics.observe_latency(seconds)
+                throttle = self.make_throttle()
+                sync = DirectorySync(self.durability, self.sync_every)
+                move_errors = execute_moves(moves, self.max_workers, observer, self.no_clobber,
+                                            throttle, self.locality_order, sync)
+                self.last_throttle_stats = throttle.stats() if throttle is not None else {}
+                stage.items = len(moves)
+            errors.extend(f"同步目錄時發生錯誤: {message}" for message in sync.errors)
+            self.last_sync_stats = {'mode': sync.mode, 'syncs': sync.syncs, 'committed': sync.committed}
+            
+            for result, (old_path, new_path), move_error in zip(pending, moves, move_errors):
+                if move_error is not None:
                     error_count += 1
-                    errors.append(f"{result['original_name']}: {str(e)}")
+                    errors.append(f"{result['original_name']}: {move_error}")
+                    if metrics is not None:
+                        metrics.record_failure(failure_reason(move_error))
+                    continue
+                
+                success_count += 1
+                if metrics is not None:
+                    metrics.record_success(result.get('size', 0))
+                rename_operations.append({
+                    'old_name': result['original_name'],
+                    'new_name': result['new_name'],
+                    'old_path': old_path,
+                    'new_path': new_path,
+                    'cross_device': cross_device,  # 跨檔案系統的移動，復原時同樣複製回來
+                    'timestamp': datetime.now()
+                })
+            
+            self._rename_path_filters((op['old_path'], op['new_path']) for op in rename_operations)
             
             # 記錄操作歷史
             if rename_operations:
-                self.history.append({
+                entry = {
                     'timestamp': datetime.now(),
                     'operations': rename_operations,
-                    'directory': self.source_directory
-                })
-                self.save_history()
+                    'directory': self.source_directory,
+                    'backup_dir': backup_dir,
+                    # 只有在選擇的耐久點（目錄 fsync）完成後才視為已寫入磁碟
+                    'durability': self.durability,
+                    'committed': sync.committed
+                }
+                state = self._update(lambda base: {'history': base.history + (entry,)},
+                                     affects_preview=False)
+                self.save_history(state.history)
             
             # 刷新檔案列表
             self.refresh_files_list()
@@ -231,55 +1114,117 @@ class FileRenamer:
         
         return success_count, error_count, errors
     
+    def make_throttle(self) -> Optional[Throttle]:
+        """依設定建立執行時的節流，沒有設定限制時返回 None"""
+        if not self.max_ops_per_second and not self.latency_slo_ms:
+            return None
+        controller = None
+        if self.latency_slo_ms:
+            controller = AdaptiveConcurrency(self.latency_slo_ms / 1000,
+                                             max_limit=max(self.max_workers, 16))
+        return Throttle(self.max_ops_per_second, controller=controller)
+    
+    def _backup_pending(self, pending: List[Dict], errors: List[str]) -> Tuple[str, List[Dict]]:
+        """
+        以原檔名建立重命名前的快照，備份失敗的檔案不會被重命名
+        
+        Returns:
+            Tuple[str, List[Dict]]: (快照目錄, 已備份的預覽結果)
+        """
+        root = self.backup_root or self.source_directory
+        name = f"rename_backup_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+        if root == self.source_directory:
+            name = f".{name}"
+        backup_dir = os.path.join(root, name)
+        
+        with self._stage("backup") as stage:
+            backups, self.last_backup_stats = backup_files(
+                [result['full_path'] for result in pending], backup_dir,
+                self.backup_method, max(self.max_workers, 4))
+            stage.items = len(pending)
+        
+        backed_up = []
+        for result in pending:
+            if backups[result['full_path']] is None:
+                errors.append(f"{result['original_name']}: 備份失敗，未重命名")
+            else:
+                backed_up.append(result)
+        return backup_dir, backed_up
+    
+    def undo_operation(self, history_index: int) -> Tuple[int, int, List[str]]:
+        """
+        復原指定的歷史操作
+        
+        整批操作先以目錄快照驗證，再與重命名共用同一套執行流程。
+        部分失敗時，已復原的操作從歷史記錄移除，失敗的操作保留以便重試。
+        
+        Returns:
+            Tuple[int, int, List[str]]: (成功數量, 失敗數量, 失敗原因)
+        """
+        entry = self._state.history[history_index]
+        operations = entry['operations']
+        
+        moves = [(op['new_path'], op['old_path']) for op in operations]
+        with self._stage("undo") as stage:
+            throttle = self.make_throttle()
+            sync = DirectorySync(self.durability, self.sync_every)
+            move_errors = execute_moves(moves, self.max_workers, no_clobber=self.no_clobber,
+                                        throttle=throttle, locality=self.locality_order, sync=sync)
+            self.last_throttle_stats = throttle.stats() if throttle is not None else {}
+            stage.items = len(moves)
+        
+        failed_operations = []
+        errors = [f"同步目錄時發生錯誤: {message}" for message in sync.errors]
+        for op, move_error in zip(operations, move_errors):
+            if move_error is not None:
+                failed_operations.append(op)
+                errors.append(f"{op['new_name']} → {op['old_name']}: {move_error}")
+        self._rename_path_filters((new_path, old_path) for (new_path, old_path), move_error
+                                  in zip(moves, move_errors) if move_error is None)
+        
+        # 以記錄本身（而非索引）找出要更新的項目，期間新增的歷史不受影響
+        remaining = (dict(entry, operations=failed_operations),) if failed_operations else ()
+        state = self._update(lambda base: {'history': tuple(
+            kept for old in base.history
+            for kept in (remaining if old is entry else (old,)))}, affects_preview=False)
+        self.save_history(state.history)
+        
+        # 刷新檔案列表
+        self.refresh_files_list()
+        
+        return len(operations) - len(failed_operations), len(failed_operations), errors
+    
     def undo_last_operation(self) -> bool:
         """復原上一次操作"""
-        if not self.history:
+        history = self.history
+        if not history:
             return False
         
         try:
-            last_operation = self.history[-1]
-            operations = last_operation['operations']
-            
-            # 反向執行操作
-            for op in reversed(operations):
-                if os.path.exists(op['new_path']):
-                    os.rename(op['new_path'], op['old_path'])
-            
-            # 從歷史記錄中移除
-            self.history.pop()
-            self.save_history()
-            
-            # 刷新檔案列表
-            self.refresh_files_list()
-            
-            return True
+            success_count, error_count, errors = self.undo_operation(len(history) - 1)
+            for error in errors:
+                print(f"復原操作時發生錯誤: {error}")
+            return error_count == 0
             
         except Exception as e:
             print(f"復原操作時發生錯誤: {e}")
             return False
     
+    def delete_history_entry(self, history_index: int):
+        """刪除一筆歷史記錄（不復原檔案）並儲存"""
+        entry = self._state.history[history_index]
+        state = self._update(lambda base: {'history': tuple(
+            old for old in base.history if old is not entry)}, affects_preview=False)
+        self.save_history(state.history)
+    
+    def clear_history(self):
+        """清除所有歷史記錄並儲存"""
+        self.history = ()
+        self.save_history(())
+    
     def is_valid_filename(self, filename: str) -> bool:
         """檢查檔名是否有效"""
-        if not filename or filename in ['', '.', '..']:
-            return False
-        
-        # Windows 無效字元
-        invalid_chars = ['<', '>', ':', '"', '|', '?', '*']
-        for char in invalid_chars:
-            if char in filename:
-                return False
-        
-        # Windows 保留名稱
-        reserved_names = ['CON', 'PRN', 'AUX', 'NUL', 'COM1', 'COM2', 'COM3', 
-                         'COM4', 'COM5', 'COM6', 'COM7', 'COM8', 'COM9', 
-                         'LPT1', 'LPT2', 'LPT3', 'LPT4', 'LPT5', 'LPT6', 
-                         'LPT7', 'LPT8', 'LPT9']
-        
-        name_without_ext = os.path.splitext(filename)[0].upper()
-        if name_without_ext in reserved_names:
-            return False
-        
-        return True
+        return self.validator.is_valid(filename)
     
     def load_settings(self) -> Dict:
         """載入設定"""
@@ -287,7 +1232,8 @@ class FileRenamer:
         default_settings = {
             'last_directory': '',
             'window_geometry': '800x600',
-            'recent_rules': []
+            'recent_rules': [],
+            'no_clobber': True
         }
         
         try:
@@ -307,11 +1253,23 @@ class FileRenamer:
         except Exception as e:
             print(f"儲存設定時發生錯誤: {e}")
     
-    def save_history(self):
-        """儲存操作歷史"""
+    def save_history(self, history: Optional[Tuple[Dict, ...]] = None):
+        """
+        儲存操作歷史
+        
+        Args:
+            history: 要儲存的歷史，預設為目前快照中的歷史
+        """
+        if history is None:
+            history = self._state.history
+        with self._stage("save_history") as stage:
+            self._save_history(history)
+            stage.items = sum(len(entry['operations']) for entry in history[-20:])
+    
+    def _save_history(self, history: Tuple[Dict, ...]):
         try:
             # 只保留最近20次操作
-            history_to_save = self.history[-20:] if len(self.history) > 20 else self.history
+            history_to_save = history[-20:]
             
             # 轉換datetime為字串以便JSON序列化
             serializable_history = []
@@ -319,6 +1277,9 @@ class FileRenamer:
                 serializable_entry = {
                     'timestamp': entry['timestamp'].isoformat(),
                     'directory': entry['directory'],
+                    'backup_dir': entry.get('backup_dir'),
+                    'durability': entry.get('durability', 'none'),
+                    'committed': entry.get('committed', False),
                     'operations': []
                 }
                 
@@ -328,14 +1289,23 @@ class FileRenamer:
                         'new_name': op['new_name'],
                         'old_path': op['old_path'],
                         'new_path': op['new_path'],
+                        'cross_device': op.get('cross_device', False),
                         'timestamp': op['timestamp'].isoformat()
                     }
                     serializable_entry['operations'].append(serializable_op)
                 
                 serializable_history.append(serializable_entry)
             
-            with open("history.json", 'w', encoding='utf-8') as f:
-                json.dump(serializable_history, f, ensure_ascii=False, indent=2)
+            if self.durability == 'none':
+                with open("history.json", 'w', encoding='utf-8') as f:
+                    json.dump(serializable_history, f, ensure_ascii=False, indent=2)
+            else:
+                # 歷史記錄本身也要寫入磁碟：寫到暫存檔、fsync 後再取代
+                with open("history.json.tmp", 'w', encoding='utf-8') as f:
+                    json.dump(serializable_history, f, ensure_ascii=False, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace("history.json.tmp", "history.json")
                 
         except Exception as e:
             print(f"儲存歷史記錄時發生錯誤: {e}")
@@ -348,11 +1318,14 @@ class FileRenamer:
                     serializable_history = json.load(f)
                 
                 # 轉換字串回datetime
-                self.history = []
+                history = []
                 for entry in serializable_history:
                     history_entry = {
                         'timestamp': datetime.fromisoformat(entry['timestamp']),
                         'directory': entry['directory'],
+                        'backup_dir': entry.get('backup_dir'),
+                        'durability': entry.get('durability', 'none'),
+                        'committed': entry.get('committed', False),
                         'operations': []
                     }
                     
@@ -362,12 +1335,14 @@ class FileRenamer:
                             'new_name': op['new_name'],
                             'old_path': op['old_path'],
                             'new_path': op['new_path'],
+                            'cross_device': op.get('cross_device', False),
                             'timestamp': datetime.fromisoformat(op['timestamp'])
                         }
                         history_entry['operations'].append(operation)
                     
-                    self.history.append(history_entry)
+                    history.append(history_entry)
+                self.history = history
                     
         except Exception as e:
             print(f"載入歷史記錄時發生錯誤: {e}")
-            self.history = []
\ No newline at end of file
+            self.history = ()
\ No newline at end of file
@@ -10,6 +10,11 @@ from tkinter import ttk, messagebox
 import os
 from datetime import datetime
 
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from src.gui.tree_loader import ChunkedTreeLoader, cached_strftime
+
 class HistoryPanel:
     """歷史記錄面板類別"""
     
@@ -97,6 +102,10 @@ class HistoryPanel:
         ttk.Button(button_frame, text="復原此操作", command=self.undo_selected_operation).pack(side=tk.LEFT, padx=(0, 5))
         ttk.Button(button_frame, text="刪除此記錄", command=self.delete_selected_record).pack(side=tk.LEFT, padx=(0, 5))
         
+        # 大量項目分批插入
+        self.history_loader = ChunkedTreeLoader(self.history_tree)
+        self.details_loader = ChunkedTreeLoader(self.details_tree)
+        
         # 綁定事件
         self.history_tree.bind('<<TreeviewSelect>>', self.on_history_selection_changed)
         self.history_tree.bind('<Double-1>', self.on_history_double_click)
@@ -107,11 +116,8 @@ class HistoryPanel:
     def refresh_history(self):
         """刷新歷史記錄"""
         # 清除現有項目
-        for item in self.history_tree.get_children():
-            self.history_tree.delete(item)
-        
-        for item in self.details_tree.get_children():
-            self.details_tree.delete(item)
+        self.history_loader.clear()
+        self.details_loader.clear()
         
         # 載入歷史記錄
         history = self.file_renamer.history
@@ -123,20 +129,15 @@ class HistoryPanel:
         total_operations = len(history)
         total_files = sum(len(entry['operations']) for entry in history)
         
-        # 按時間倒序顯示（最新的在上面）
-        for i, entry in enumerate(reversed(history)):
-            operation_id = total_operations - i
-            files_count = len(entry['operations'])
-            directory = entry['directory']
-            timestamp = entry['timestamp'].strftime("%Y-%m-%d %H:%M:%S")
-            
-            # 插入歷史記錄項目
-            item = self.history_tree.insert('', 'end', text=f"#{operation_id}",
-                                          values=(files_count, directory, timestamp))
-            
-            # 儲存索引以便後續使用
-            self.history_tree.set(item, 'history_index', len(history) - 1 - i)
+        # 按時間倒序顯示（最新的在上面），項目 iid 即為歷史記錄索引
+        rows = []
+        for history_index in range(total_operations - 1, -1, -1):
+            entry = history[history_index]
+            timestamp = cached_strftime(entry['timestamp'], "%Y-%m-%d %H:%M:%S")
+            rows.append((str(history_index), f"#{history_index + 1}",
+                         (len(entry['operations']), entry['directory'], timestamp), ()))
         
+        self.history_loader.load(rows)
         self.update_stats(total_operations, total_files)
     
     def update_stats(self, operations, files):
@@ -152,7 +153,7 @@ class HistoryPanel:
         
         item = selection[0]
         try:
-            history_index = int(self.history_tree.set(item, 'history_index'))
+            history_index = int(item)
             self.show_operation_details(history_index)
         except (ValueError, IndexError):
             self.clear_details()
@@ -165,30 +166,22 @@ class HistoryPanel:
     
     def show_operation_details(self, history_index):
         """顯示操作詳細資訊"""
-        # 清除現有詳細資訊
-        for item in self.details_tree.get_children():
-            self.details_tree.delete(item)
-        
         try:
             history_entry = self.file_renamer.history[history_index]
-            operations = history_entry['operations']
             
             # 顯示每個檔案的重命名操作
-            for operation in operations:
-                old_name = operation['old_name']
-                new_name = operation['new_name']
-                op_time = operation['timestamp'].strftime("%H:%M:%S")
-                
-                self.details_tree.insert('', 'end', text=old_name,
-                                        values=(new_name, op_time))
+            rows = [(str(i), operation['old_name'],
+                     (operation['new_name'], cached_strftime(operation['timestamp'], "%H:%M:%S")), ())
+                    for i, operation in enumerate(history_entry['operations'])]
+            self.details_loader.load(rows)
         
         except (IndexError, KeyError) as e:
+            self.details_loader.clear()
             print(f"顯示操作詳細資訊時發生錯誤: {e}")
     
     def clear_details(self):
         """清除詳細資訊"""
-        for item in self.details_tree.get_children():
-            self.details_tree.delete(item)
+        self.details_loader.clear()
     
     def undo_selected_operation(self):
         """復原選中的操作"""
@@ -199,7 +192,7 @@ class HistoryPanel:
         
         item = selection[0]
         try:
-            history_index = int(self.history_tree.set(item, 'history_index'))
+            history_index = int(item)
             history_entry = self.file_renamer.history[history_index]
             
             operation_count = len(history_entry['operations'])
@@ -222,62 +215,24 @@ class HistoryPanel:
                                      f"是否確定復原？"):
                 return
             
-            # 如果不是最後一次操作，需要特殊處理
-            if history_index == len(self.file_renamer.history) - 1:
-                # 最後一次操作，使用標準復原方法
-                if self.file_renamer.undo_last_operation():
-                    messagebox.showinfo("完成", f"成功復原 {operation_count} 個檔案的重命名")
-                    self.refresh_history()
-                else:
-                    messagebox.showerror("錯誤", "復原操作失敗")
+            success_count, error_count, errors = self.file_renamer.undo_operation(history_index)
+            
+            if errors:
+                error_msg = "\n".join(errors[:10])  # 只顯示前10個錯誤
+                if len(errors) > 10:
+                    error_msg += f"\n... 以及其他 {len(errors) - 10} 個錯誤"
+                
+                messagebox.showwarning("復原完成（有錯誤）",
+                                     f"成功復原: {success_count} 個檔案\n"
+                                     f"失敗: {error_count} 個檔案（保留於歷史記錄中）\n\n"
+                                     f"錯誤詳情:\n{error_msg}")
             else:
-                # 不是最後一次操作，手動復原
-                if self.manual_undo_operation(history_index):
-                    messagebox.showinfo("完成", f"成功復原 {operation_count} 個檔案的重命名")
-                    self.refresh_history()
-                else:
-                    messagebox.showerror("錯誤", "復原操作失敗")
+                messagebox.showinfo("完成", f"成功復原 {success_count} 個檔案的重命名")
+            self.refresh_history()
                     
         except (ValueError, IndexError, KeyError) as e:
             messagebox.showerror("錯誤", f"復原操作時發生錯誤:\n{str(e)}")
     
-    def manual_undo_operation(self, history_index):
-        """手動復原指定的操作"""
-        try:
-            history_entry = self.file_renamer.history[history_index]
-            operations = history_entry['operations']
-            
-            # 檢查檔案是否還存在且可以復原
-            failed_operations = []
-            for operation in operations:
-                new_path = operation['new_path']
-                old_path = operation['old_path']
-                
-                if not os.path.exists(new_path):
-                    failed_operations.append(f"檔案不存在: {operation['new_name']}")
-                elif os.path.exists(old_path):
-                    failed_operations.append(f"目標檔案已存在: {operation['old_name']}")
-            
-            if failed_operations:
-                messagebox.showerror("無法復原", 
-                                   f"以下檔案無法復原:\n" + "\n".join(failed_operations))
-                return False
-            
-            # 執行復原
-            import os
-            for operation in reversed(operations):
-                os.rename(operation['new_path'], operation['old_path'])
-            
-            # 從歷史記錄中移除
-            del self.file_renamer.history[history_index]
-            self.file_renamer.save_history()
-            
-            return True
-            
-        except Exception as e:
-            print(f"手動復原操作時發生錯誤: {e}")
-            return False
-    
     def delete_selected_record(self):
         """刪除選中的歷史記錄"""
         selection = self.history_tree.selection()
@@ -290,11 +245,10 @@ class HistoryPanel:
         
         item = selection[0]
         try:
-            history_index = int(self.history_tree.set(item, 'history_index'))
+            history_index = int(item)
             
             # 刪除歷史記錄
-            del self.file_renamer.history[history_index]
-            self.file_renamer.save_history()
+            self.file_renamer.delete_history_entry(history_index)
             
             # 刷新顯示
             self.refresh_history()
@@ -316,8 +270,7 @@ class HistoryPanel:
             return
         
         try:
-            self.file_renamer.history.clear()
-            self.file_renamer.save_history()
+            self.file_renamer.clear_history()
             self.refresh_history()
             
             messagebox.showinfo("完成", "所有歷史記錄已清除")
@@ -385,7 +338,7 @@ class HistoryPanel:
         
         item = selection[0]
         try:
-            history_index = int(self.history_tree.set(item, 'history_index'))
+            history_index = int(item)
             history_entry = self.file_renamer.history[history_index]
             
             info = f"操作詳細資訊\n\n"
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+即時預覽
+Debounced live preview
+"""
+
+import queue
+import threading
+from typing import Callable, List, Optional
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from src.utils import gc_paused
+from src.gui.preview_panel import build_preview_rows
+
+
+class LivePreview:
+    """
+    編輯規則或過濾條件時自動更新預覽
+
+    輸入停止 delay_ms 毫秒後才重新預覽；新的輸入會讓執行中的預覽在下一個檢查點中止。
+    過濾、套用規則與格式化資料列都在背景執行緒中完成，Tk 只在主執行緒中操作：
+    結果放入佇列，由 after() 輪詢取出，只顯示最新一次輸入的結果。
+    預覽以開始時的狀態快照計算，主執行緒可同時修改規則或重新掃描；完成時快照已不是
+    最新（例如執行重命名後重新掃描）的結果會被捨棄，並以新的快照重新預覽。
+    """
+
+    def __init__(self, widget, file_renamer, get_rules: Callable[[], List],
+                 on_result: Callable, delay_ms: int = 150, poll_ms: int = 30):
+        self.widget = widget
+        self.file_renamer = file_renamer
+        self.get_rules = get_rules
+        self.on_result = on_result
+        self.delay_ms = delay_ms
+        self.poll_ms = poll_ms
+        self.generation = 0
+        self._filters: Optional[List[str]] = None
+        self._after_id = None
+        self._poll_id = None
+        self._running = 0
+        self._results = queue.Queue()
+        self._lock = threading.Lock()  # 同一時間只有一個預覽在計算
+
+    def schedule(self, filters: Optional[List[str]] = None):
+        """
+        輸入改變時呼叫，重新開始計時
+
+        Args:
+            filters: 新的過濾條件，None 表示過濾條件沒有改變
+        """
+        if filters is not None:
+            self._filters = filters
+        self.cancel()
+        self._after_id = self.widget.after(self.delay_ms, self._start)
+
+    def cancel(self):
+        """取消尚未開始的預覽，執行中的預覽會在下一個檢查點中止"""
+        self.generation += 1
+        if self._after_id is not None:
+            self.widget.after_cancel(self._after_id)
+            self._after_id = None
+
+    def _start(self):
+        self._after_id = None
+        generation = self.generation
+        rules = self.get_rules()  # 讀取表單必須在主執行緒
+        self._running += 1
+        threading.Thread(target=self._run, args=(generation, rules), daemon=True).start()
+        if self._poll_id is None:
+            self._poll_id = self.widget.after(self.poll_ms, self._poll)
+
+    def _run(self, generation: int, rules: List):
+        cancelled = lambda: generation != self.generation
+        result = None
+        try:
+            with self._lock:
+                if cancelled():
+                    return
+                filters = self._filters
+                if filters is not None and tuple(filters) != self.file_renamer.file_filters:
+                    self.file_renamer.set_file_filters(filters)
+                state = self.file_renamer.snapshot()
+                preview_results = self.file_renamer.preview_rename(rules, cancelled, state)
+                if preview_results is not None and not cancelled():
+                    with gc_paused():
+                        result = (state.generation, preview_results,
+                                  build_preview_rows(preview_results))
+        except Exception as e:
+            print(f"即時預覽時發生錯誤: {e}")
+        finally:
+            self._results.put((generation, result))
+
+    def _poll(self):
+        self._poll_id = None
+        latest = None
+        while True:
+            try:
+                generation, result = self._results.get_nowait()
+            except queue.Empty:
+                break
+            self._running -= 1
+            if generation == self.generation and result is not None:
+                latest = result
+
+        if latest is not None:
+            state_generation, preview_results, rows = latest
+            if state_generation < self.file_renamer.snapshot().generation:
+                self.schedule()  # 計算期間狀態已改變
+            else:
+                self.on_result(preview_results, rows)
+        if self._running > 0:
+            self._poll_id = self.widget.after(self.poll_ms, self._poll)
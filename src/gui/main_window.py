@@ -8,6 +8,7 @@ Main Window GUI
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import os
+import threading
 from datetime import datetime
 
 import sys
@@ -15,9 +16,12 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from src.file_renamer import FileRenamer, RenameRule
+from src.instrumentation import Instrumentation
+from src.utils import format_backup_stats
 from src.gui.rule_panel import RulePanel
 from src.gui.preview_panel import PreviewPanel
 from src.gui.history_panel import HistoryPanel
+from src.gui.live_preview import LivePreview
 
 class MainWindow:
     """主視窗類別"""
@@ -97,6 +101,15 @@ class MainWindow:
         ttk.Button(action_frame, text="執行重命名", command=self.execute_rename).pack(side=tk.LEFT, padx=(0, 5))
         ttk.Button(action_frame, text="復原操作", command=self.undo_operation).pack(side=tk.LEFT, padx=(0, 5))
         ttk.Button(action_frame, text="刷新列表", command=self.refresh_files).pack(side=tk.LEFT, padx=(0, 5))
+        
+        # 重命名前快照備份（硬連結不佔額外空間）
+        self.backup_var = tk.BooleanVar(value=self.file_renamer.backup_before_rename)
+        ttk.Checkbutton(action_frame, text="執行前備份", variable=self.backup_var,
+                        command=self.on_backup_changed).pack(side=tk.LEFT, padx=(10, 0))
+    
+    def on_backup_changed(self):
+        """切換重命名前的快照備份"""
+        self.file_renamer.backup_before_rename = self.backup_var.get()
     
     def create_main_tab(self):
         """創建主要操作分頁"""
@@ -108,12 +121,30 @@ class MainWindow:
         paned_window.pack(fill=tk.BOTH, expand=True)
         
         # 左側：規則設定面板
-        self.rule_panel = RulePanel(paned_window, self.file_renamer)
+        self.rule_panel = RulePanel(paned_window, self.file_renamer,
+                                    on_change=self.schedule_live_preview)
         paned_window.add(self.rule_panel.frame, weight=1)
         
         # 右側：預覽面板
-        self.preview_panel = PreviewPanel(paned_window, self.file_renamer)
+        self.preview_panel = PreviewPanel(paned_window, self.file_renamer,
+                                          on_files_changed=self.update_file_count)
         paned_window.add(self.preview_panel.frame, weight=2)
+        
+        # 即時預覽：停止輸入 150 ms 後在背景重新預覽
+        self.live_preview = LivePreview(self.root, self.file_renamer,
+                                        self.rule_panel.get_live_rules,
+                                        self.on_live_preview_result)
+    
+    def schedule_live_preview(self, filters=None):
+        """規則或過濾條件改變時排定即時預覽"""
+        self.live_preview.schedule(filters)
+    
+    def on_live_preview_result(self, preview_results, rows):
+        """顯示即時預覽的結果"""
+        self.preview_panel.show_results(preview_results, rows)
+        self.update_file_count()
+        if self.timing_pending:
+            self.update_timing()
     
     def create_history_tab(self):
         """創建歷史記錄分頁"""
@@ -139,6 +170,49 @@ class MainWindow:
         self.file_count_var.set("檔案數量: 0")
         count_label = ttk.Label(statusbar_frame, textvariable=self.file_count_var)
         count_label.pack(side=tk.RIGHT)
+        
+        # 各階段耗時
+        self.show_timings_var = tk.BooleanVar(value=False)
+        timings_check = ttk.Checkbutton(statusbar_frame, text="顯示耗時",
+                                        variable=self.show_timings_var,
+                                        command=self.on_show_timings_changed)
+        timings_check.pack(side=tk.RIGHT, padx=(0, 10))
+        
+        self.timing_var = tk.StringVar()
+        self.timing_pending = False  # 背景執行緒中的階段已結束，等主執行緒更新顯示
+        timing_label = ttk.Label(statusbar_frame, textvariable=self.timing_var,
+                                 foreground="gray")
+        timing_label.pack(side=tk.RIGHT, padx=(0, 10))
+    
+    def on_show_timings_changed(self):
+        """切換各階段耗時顯示"""
+        if self.show_timings_var.get():
+            instrumentation = Instrumentation()
+            instrumentation.add_hook(self.on_stage_finished)
+            self.file_renamer.instrumentation = instrumentation
+            self.timing_var.set("重新預覽或執行後顯示耗時")
+        else:
+            self.file_renamer.instrumentation = None
+            self.timing_var.set("")
+    
+    def on_stage_finished(self, stage):
+        """
+        階段結束時呼叫，可能位於即時預覽的背景執行緒
+        
+        Tk 只能在主執行緒中操作：背景執行緒只做標記，由即時預覽的結果（經 after() 輪詢
+        回到主執行緒）一併更新。
+        """
+        if threading.current_thread() is threading.main_thread():
+            self.update_timing()
+        else:
+            self.timing_pending = True
+    
+    def update_timing(self):
+        """以最近一次的各階段耗時更新狀態欄"""
+        self.timing_pending = False
+        instrumentation = self.file_renamer.instrumentation
+        if instrumentation is not None:
+            self.timing_var.set(instrumentation.summary())
     
     def browse_directory(self):
         """瀏覽並選擇目錄"""
@@ -148,6 +222,7 @@ class MainWindow:
         )
         
         if directory:
+            self.live_preview.cancel()
             if self.file_renamer.set_source_directory(directory):
                 self.dir_var.set(directory)
                 self.update_file_count()
@@ -170,6 +245,7 @@ class MainWindow:
             return
         
         try:
+            self.live_preview.cancel()
             self.status_var.set("正在生成預覽...")
             self.root.update()
             
@@ -190,8 +266,29 @@ class MainWindow:
             messagebox.showwarning("警告", "請先設定重命名規則")
             return
         
-        # 獲取預覽結果
-        preview_results = self.file_renamer.preview_rename()
+        # 部分項目被選取時，可只重命名選取的項目
+        selected = self.preview_panel.get_selected_results()
+        if selected and len(selected) < len(self.preview_panel.preview_results):
+            answer = messagebox.askyesnocancel("執行範圍",
+                                               f"目前選取了 {len(selected)} 個項目。\n"
+                                               f"是：只重命名選取的項目\n否：重命名全部項目")
+            if answer is None:
+                return
+            selected_paths = {result['full_path'] for result in selected} if answer else None
+        else:
+            selected_paths = None
+        
+        # 重用畫面上的預覽結果；目錄已變動時只重新驗證受影響的項目
+        self.live_preview.cancel()
+        preview_results = self.file_renamer.get_execution_plan(self.preview_panel.preview_results)
+        if preview_results is not self.preview_panel.preview_results:
+            # 執行的計畫與畫面上的不同（規則已修改或目錄已變動），先顯示新的計畫
+            self.preview_panel.show_results(preview_results)
+            self.update_file_count()
+        
+        if selected_paths is not None:
+            preview_results = [result for result in preview_results
+                               if result['full_path'] in selected_paths]
         
         if not preview_results:
             messagebox.showinfo("資訊", "沒有檔案需要重命名")
@@ -218,6 +315,10 @@ class MainWindow:
             
             success_count, error_count, errors = self.file_renamer.execute_rename(preview_results)
             
+            backup_msg = ""
+            if self.file_renamer.last_backup_stats:
+                backup_msg = f"\n\n{format_backup_stats(self.file_renamer.last_backup_stats)}"
+            
             # 顯示結果
             if errors:
                 error_msg = "\n".join(errors[:10])  # 只顯示前10個錯誤
@@ -228,9 +329,9 @@ class MainWindow:
                                      f"重命名完成！\n"
                                      f"成功: {success_count} 個檔案\n"
                                      f"失敗: {error_count} 個檔案\n\n"
-                                     f"錯誤詳情:\n{error_msg}")
+                                     f"錯誤詳情:\n{error_msg}{backup_msg}")
             else:
-                messagebox.showinfo("完成", f"重命名完成！\n成功處理 {success_count} 個檔案")
+                messagebox.showinfo("完成", f"重命名完成！\n成功處理 {success_count} 個檔案{backup_msg}")
             
             # 更新界面
             self.preview_panel.refresh_preview()
@@ -244,11 +345,12 @@ class MainWindow:
     
     def undo_operation(self):
         """復原上一次操作"""
-        if not self.file_renamer.history:
+        history = self.file_renamer.history
+        if not history:
             messagebox.showinfo("資訊", "沒有可復原的操作")
             return
         
-        last_operation = self.file_renamer.history[-1]
+        last_operation = history[-1]
         operation_count = len(last_operation['operations'])
         operation_time = last_operation['timestamp'].strftime("%Y-%m-%d %H:%M:%S")
         
@@ -261,20 +363,31 @@ class MainWindow:
             return
         
         try:
+            self.live_preview.cancel()
             self.status_var.set("正在復原操作...")
             self.root.update()
             
-            if self.file_renamer.undo_last_operation():
-                messagebox.showinfo("完成", f"成功復原 {operation_count} 個檔案的重命名")
+            success_count, error_count, errors = self.file_renamer.undo_operation(
+                len(history) - 1)
+            
+            if errors:
+                error_msg = "\n".join(errors[:10])  # 只顯示前10個錯誤
+                if len(errors) > 10:
+                    error_msg += f"\n... 以及其他 {len(errors) - 10} 個錯誤"
                 
-                # 更新界面
-                self.preview_panel.refresh_preview()
-                self.history_panel.refresh_history()
-                self.update_file_count()
-                self.status_var.set("復原操作完成")
+                messagebox.showwarning("復原完成（有錯誤）",
+                                     f"成功復原: {success_count} 個檔案\n"
+                                     f"失敗: {error_count} 個檔案（保留於歷史記錄中）\n\n"
+                                     f"錯誤詳情:\n{error_msg}")
+                self.status_var.set(f"復原完成 - 成功: {success_count}, 失敗: {error_count}")
             else:
-                messagebox.showerror("錯誤", "復原操作失敗")
-                self.status_var.set("復原失敗")
+                messagebox.showinfo("完成", f"成功復原 {success_count} 個檔案的重命名")
+                self.status_var.set("復原操作完成")
+            
+            # 更新界面
+            self.preview_panel.refresh_preview()
+            self.history_panel.refresh_history()
+            self.update_file_count()
                 
         except Exception as e:
             messagebox.showerror("錯誤", f"復原操作時發生錯誤:\n{str(e)}")
@@ -283,6 +396,7 @@ class MainWindow:
     def refresh_files(self):
         """刷新檔案列表"""
         if self.file_renamer.source_directory:
+            self.live_preview.cancel()
             self.file_renamer.refresh_files_list()
             self.preview_panel.refresh_preview()
             self.update_file_count()
@@ -330,6 +444,14 @@ class MainWindow:
             # 儲存目前目錄
             settings['last_directory'] = self.file_renamer.source_directory
             
+            # 儲存排序方式
+            settings['sort_order'] = self.file_renamer.sort_order
+            settings['sort_reverse'] = self.file_renamer.sort_reverse
+            settings['backup_before_rename'] = self.file_renamer.backup_before_rename
+            settings['auto_resolve_conflicts'] = self.file_renamer.auto_resolve_conflicts
+            settings['no_clobber'] = self.file_renamer.no_clobber
+            settings['live_preview'] = self.rule_panel.live_preview_var.get()
+            
             self.file_renamer.save_settings(settings)
             
         except Exception as e:
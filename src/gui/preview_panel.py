@@ -10,18 +10,71 @@ from tkinter import ttk
 import os
 from datetime import datetime
 
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from src.sorting import SORT_ORDERS
+from src.gui.tree_loader import ChunkedTreeLoader, cached_file_size, cached_strftime
+
+def build_preview_rows(preview_results):
+    """
+    將預覽結果格式化為樹狀檢視的資料列
+    
+    不使用任何 Tk 物件，可在背景執行緒中執行。項目 iid 為預覽結果的索引。
+    
+    Returns:
+        Tuple[List, int, int]: (資料列, 將變更數量, 衝突數量)
+    """
+    rows = []
+    append = rows.append
+    changed_files = 0
+    conflict_files = 0
+    
+    for index, result in enumerate(preview_results):
+        original_name = result['original_name']
+        new_name = result['new_name']
+        
+        # 確定狀態
+        if result['conflict']:
+            status = f"衝突: {result['conflict_reason']}"
+            conflict_files += 1
+            tag = 'conflict'
+        elif original_name != new_name:
+            status = "將重命名（自動編號）" if result.get('auto_renamed') else "將重命名"
+            changed_files += 1
+            tag = 'changed'
+        else:
+            status = "無變化"
+            tag = 'unchanged'
+        
+        append((str(index), original_name,
+                (new_name, cached_file_size(result['size']),
+                 cached_strftime(result['modified'], "%Y-%m-%d %H:%M"), status),
+                (tag,)))
+    
+    return rows, changed_files, conflict_files
+
+# 移除檔案後逐項更新的上限，超過時重新載入整個樹狀檢視
+MAX_ROW_UPDATES = 1000
+
 class PreviewPanel:
     """預覽面板類別"""
     
-    def __init__(self, parent, file_renamer):
+    def __init__(self, parent, file_renamer, on_files_changed=None):
         self.parent = parent
         self.file_renamer = file_renamer
+        # 排除或只處理部分檔案後呼叫，讓主視窗更新檔案計數
+        self.on_files_changed = on_files_changed
         
         # 創建主框架
         self.frame = ttk.LabelFrame(parent, text="重命名預覽", padding=10)
         
-        self.create_widgets()
         self.preview_results = []
+        # 樹狀檢視項目 iid 對應的預覽結果，以及 preview_results 各項目的 iid；
+        # 從預覽中移除檔案後 iid 不再等於 preview_results 的索引
+        self.row_results = []
+        self.row_iids = []
+        self.create_widgets()
     
     def create_widgets(self):
         """創建界面組件"""
@@ -33,6 +86,23 @@ class PreviewPanel:
         ttk.Button(toolbar_frame, text="全選", command=self.select_all).pack(side=tk.LEFT, padx=(0, 5))
         ttk.Button(toolbar_frame, text="反選", command=self.invert_selection).pack(side=tk.LEFT, padx=(0, 5))
         
+        # 排序方式
+        ttk.Label(toolbar_frame, text="排序:").pack(side=tk.LEFT, padx=(10, 0))
+        self.sort_var = tk.StringVar(value=SORT_ORDERS[self.file_renamer.sort_order])
+        sort_combo = ttk.Combobox(toolbar_frame, textvariable=self.sort_var,
+                                  values=list(SORT_ORDERS.values()), state="readonly", width=10)
+        sort_combo.pack(side=tk.LEFT, padx=(5, 5))
+        sort_combo.bind('<<ComboboxSelected>>', self.on_sort_changed)
+        
+        self.sort_reverse_var = tk.BooleanVar(value=self.file_renamer.sort_reverse)
+        ttk.Checkbutton(toolbar_frame, text="反向", variable=self.sort_reverse_var,
+                       command=self.on_sort_changed).pack(side=tk.LEFT)
+        
+        # 自動為重複的檔名加上編號
+        self.auto_resolve_var = tk.BooleanVar(value=self.file_renamer.auto_resolve_conflicts)
+        ttk.Checkbutton(toolbar_frame, text="自動解決衝突", variable=self.auto_resolve_var,
+                       command=self.on_auto_resolve_changed).pack(side=tk.LEFT, padx=(10, 0))
+        
         # 統計資訊
         self.stats_var = tk.StringVar()
         stats_label = ttk.Label(toolbar_frame, textvariable=self.stats_var)
@@ -74,6 +144,14 @@ class PreviewPanel:
         tree_frame.grid_rowconfigure(0, weight=1)
         tree_frame.grid_columnconfigure(0, weight=1)
         
+        # 設定標籤顏色
+        self.tree.tag_configure('conflict', foreground='red')
+        self.tree.tag_configure('changed', foreground='blue')
+        self.tree.tag_configure('unchanged', foreground='gray')
+        
+        # 大量項目分批插入，介面在載入期間仍可操作
+        self.tree_loader = ChunkedTreeLoader(self.tree)
+        
         # 綁定事件
         self.tree.bind('<Double-1>', self.on_double_click)
         self.tree.bind('<Button-3>', self.on_right_click)
@@ -101,94 +179,99 @@ class PreviewPanel:
         self.context_menu.add_command(label="查看詳細資訊", command=self.show_file_details)
         self.context_menu.add_command(label="在檔案總管中顯示", command=self.show_in_explorer)
         self.context_menu.add_separator()
-        self.context_menu.add_command(label="排除此檔案", command=self.exclude_file)
-        self.context_menu.add_command(label="僅處理此檔案", command=self.include_only_this)
+        self.context_menu.add_command(label="排除選取的檔案", command=self.exclude_file)
+        self.context_menu.add_command(label="僅處理選取的檔案", command=self.include_only_this)
+        self.context_menu.add_command(label="顯示全部檔案", command=self.show_all_files)
     
     def refresh_preview(self):
         """刷新預覽"""
         # 清除現有項目
-        for item in self.tree.get_children():
-            self.tree.delete(item)
+        self.tree_loader.clear()
         
         if not self.file_renamer.source_directory:
+            self.preview_results = []
+            self.row_results = []
+            self.row_iids = []
             self.update_stats(0, 0, 0)
             return
         
         try:
             # 獲取預覽結果
             self.preview_results = self.file_renamer.preview_rename()
-            
-            # 統計資訊
-            total_files = len(self.preview_results)
-            changed_files = 0
-            conflict_files = 0
-            
-            # 添加項目到樹狀檢視
-            for result in self.preview_results:
-                original_name = result['original_name']
-                new_name = result['new_name']
-                size = self.format_file_size(result['size'])
-                modified = result['modified'].strftime("%Y-%m-%d %H:%M")
-                
-                # 確定狀態
-                if result['conflict']:
-                    status = f"衝突: {result['conflict_reason']}"
-                    conflict_files += 1
-                    tag = 'conflict'
-                elif original_name != new_name:
-                    status = "將重命名"
-                    changed_files += 1
-                    tag = 'changed'
-                else:
-                    status = "無變化"
-                    tag = 'unchanged'
-                
-                # 插入項目
-                item = self.tree.insert('', 'end', text=original_name,
-                                      values=(new_name, size, modified, status),
-                                      tags=(tag,))
-            
-            # 設定標籤顏色
-            self.tree.tag_configure('conflict', foreground='red')
-            self.tree.tag_configure('changed', foreground='blue')
-            self.tree.tag_configure('unchanged', foreground='gray')
-            
-            # 更新統計
-            self.update_stats(total_files, changed_files, conflict_files)
+            self.show_results(self.preview_results)
             
         except Exception as e:
             print(f"刷新預覽時發生錯誤: {e}")
             self.update_stats(0, 0, 0)
     
-    def format_file_size(self, size_bytes):
-        """格式化檔案大小"""
-        if size_bytes == 0:
-            return "0 B"
+    def show_results(self, preview_results, rows=None):
+        """
+        顯示預覽結果
         
-        size_names = ["B", "KB", "MB", "GB"]
-        size = float(size_bytes)
-        i = 0
+        Args:
+            preview_results: preview_rename 的結果
+            rows: 已由 build_preview_rows 準備好的資料列，None 時在此格式化
+        """
+        if rows is None:
+            rows, changed_files, conflict_files = build_preview_rows(preview_results)
+        else:
+            rows, changed_files, conflict_files = rows
         
-        while size >= 1024.0 and i < len(size_names) - 1:
-            size /= 1024.0
-            i += 1
+        self.preview_results = preview_results
+        self.row_results = list(preview_results)
+        self.row_iids = [row[0] for row in rows]
+        self.tree_loader.load(rows)
         
-        return f"{size:.1f} {size_names[i]}"
+        # 更新統計
+        self.update_stats(len(preview_results), changed_files, conflict_files)
+    
+    def get_result(self, item):
+        """取得項目對應的預覽結果"""
+        try:
+            return self.row_results[int(item)]
+        except (ValueError, IndexError):
+            return None
+    
+    def on_sort_changed(self, event=None):
+        """排序方式改變事件"""
+        label = self.sort_var.get()
+        order = next(key for key, value in SORT_ORDERS.items() if value == label)
+        self.file_renamer.set_sort_order(order, self.sort_reverse_var.get())
+        self.refresh_preview()
+    
+    def on_auto_resolve_changed(self):
+        """自動解決衝突選項改變事件"""
+        self.file_renamer.auto_resolve_conflicts = self.auto_resolve_var.get()
+        self.refresh_preview()
+    
+    def format_file_size(self, size_bytes):
+        """格式化檔案大小"""
+        return cached_file_size(size_bytes)
     
     def update_stats(self, total, changed, conflicts):
         """更新統計資訊"""
         if total == 0:
             self.stats_var.set("無檔案")
-        else:
-            self.stats_var.set(f"總計: {total} | 將變更: {changed} | 衝突: {conflicts}")
+            return
+        
+        stats_text = f"總計: {total} | 將變更: {changed} | 衝突: {conflicts}"
+        
+        # 內容雜湊的吞吐量與快取命中率
+        for key, stats in self.file_renamer.last_preview_stats.items():
+            if key.startswith("hash:"):
+                stats_text += (f" | {stats['algorithm']}: {stats['mb_per_second']:.1f} MB/s, "
+                               f"快取命中 {stats['cache_hit_rate']:.0%}")
+        
+        self.stats_var.set(stats_text)
     
     def select_all(self):
-        """全選所有項目"""
-        for item in self.tree.get_children():
-            self.tree.selection_add(item)
+        """全選所有項目（先完成分批載入，否則只會選到已插入的項目）"""
+        self.tree_loader.finish()
+        self.tree.selection_set(self.tree.get_children())
     
     def invert_selection(self):
         """反選"""
+        self.tree_loader.finish()
         selected = set(self.tree.selection())
         all_items = set(self.tree.get_children())
         
@@ -210,7 +293,9 @@ class PreviewPanel:
         """右鍵點擊事件"""
         item = self.tree.identify('item', event.x, event.y)
         if item:
-            self.tree.selection_set(item)
+            # 在已選取的項目上按右鍵時保留多重選取
+            if item not in self.tree.selection():
+                self.tree.selection_set(item)
             self.context_menu.post(event.x_root, event.y_root)
     
     def on_selection_changed(self, event):
@@ -233,11 +318,7 @@ class PreviewPanel:
                 new_name, size, modified, status = values
                 
                 # 尋找對應的預覽結果
-                result = None
-                for r in self.preview_results:
-                    if r['original_name'] == original_name:
-                        result = r
-                        break
+                result = self.get_result(item)
                 
                 if result:
                     details = f"原檔名: {original_name}\n"
@@ -280,14 +361,9 @@ class PreviewPanel:
             return
         
         item = selection[0]
-        original_name = self.tree.item(item, 'text')
         
         # 尋找對應的預覽結果
-        result = None
-        for r in self.preview_results:
-            if r['original_name'] == original_name:
-                result = r
-                break
+        result = self.get_result(item)
         
         if result:
             from tkinter import messagebox
@@ -311,14 +387,9 @@ class PreviewPanel:
             return
         
         item = selection[0]
-        original_name = self.tree.item(item, 'text')
         
         # 尋找對應的預覽結果
-        result = None
-        for r in self.preview_results:
-            if r['original_name'] == original_name:
-                result = r
-                break
+        result = self.get_result(item)
         
         if result:
             try:
@@ -328,14 +399,109 @@ class PreviewPanel:
                 from tkinter import messagebox
                 messagebox.showerror("錯誤", f"無法開啟檔案總管:\n{str(e)}")
     
+    def get_selected_results(self):
+        """取得選取項目對應的預覽結果"""
+        results = []
+        for item in self.tree.selection():
+            result = self.get_result(item)
+            if result is not None:
+                results.append(result)
+        return results
+    
     def exclude_file(self):
-        """排除檔案（此功能需要擴展檔案過濾器）"""
-        # 這個功能可以在未來版本中實現
-        from tkinter import messagebox
-        messagebox.showinfo("功能提示", "此功能將在未來版本中實現")
+        """排除選取的檔案"""
+        paths = [result['full_path'] for result in self.get_selected_results()]
+        if paths:
+            self.file_renamer.exclude_files(paths)
+            self.on_path_filters_changed(set(paths))
     
     def include_only_this(self):
-        """僅處理此檔案（此功能需要擴展檔案過濾器）"""
-        # 這個功能可以在未來版本中實現
-        from tkinter import messagebox
-        messagebox.showinfo("功能提示", "此功能將在未來版本中實現")
\ No newline at end of file
+        """僅處理選取的檔案"""
+        paths = [result['full_path'] for result in self.get_selected_results()]
+        if paths:
+            self.file_renamer.include_only(paths)
+            selected = set(paths)
+            self.on_path_filters_changed({result['full_path'] for result in self.preview_results
+                                          if result['full_path'] not in selected})
+    
+    def show_all_files(self):
+        """清除排除與僅處理的設定"""
+        self.file_renamer.clear_path_filters()
+        self.on_path_filters_changed()
+    
+    def on_path_filters_changed(self, removed=None):
+        """
+        個別排除或只處理的檔案改變後更新預覽
+        
+        Args:
+            removed: 從預覽中移除的檔案路徑；None 時重新載入整個預覽
+        """
+        if removed is None or not self.remove_rows(removed):
+            self.refresh_preview()
+        if self.on_files_changed is not None:
+            self.on_files_changed()
+    
+    def remove_rows(self, removed):
+        """
+        從目前的預覽中移除檔案，只刪除對應的項目並更新新檔名或衝突狀態改變的項目
+        
+        規則快取在移除檔案後仍然有效，重新預覽時只需重新檢查衝突
+        （以及序列編號等取決於位置的規則）。
+        
+        Args:
+            removed: 要移除的檔案路徑集合
+        
+        Returns:
+            bool: 是否已更新；樹狀檢視仍在分批載入或結果無法對應時返回 False
+        """
+        if self.tree_loader.loading:
+            return False
+        
+        removed_iids = []
+        kept_iids = []
+        for iid, result in zip(self.row_iids, self.preview_results):
+            if result['full_path'] in removed:
+                removed_iids.append(iid)
+            else:
+                kept_iids.append((iid, result))
+        
+        try:
+            preview_results = self.file_renamer.preview_rename()
+        except Exception as e:
+            print(f"刷新預覽時發生錯誤: {e}")
+            return False
+        if len(preview_results) != len(kept_iids):
+            return False
+        
+        # 找出新檔名或狀態改變的項目，數量太多時整個重新載入比逐項更新快
+        updates = []
+        for (iid, old), new in zip(kept_iids, preview_results):
+            if old['full_path'] != new['full_path']:
+                return False
+            if (old['new_name'] != new['new_name'] or old['conflict'] != new['conflict']
+                    or old['conflict_reason'] != new['conflict_reason']
+                    or old.get('auto_renamed') != new.get('auto_renamed')):
+                updates.append((iid, new))
+        if len(updates) > MAX_ROW_UPDATES:
+            self.show_results(preview_results)
+            return True
+        
+        if removed_iids:
+            self.tree.delete(*removed_iids)
+        for iid, result in updates:
+            (_, _, values, tags), = build_preview_rows([result])[0]
+            self.tree.item(iid, values=values, tags=tags)
+        
+        row_results = self.row_results
+        for iid in removed_iids:
+            row_results[int(iid)] = None
+        for (iid, _), result in zip(kept_iids, preview_results):
+            row_results[int(iid)] = result
+        self.row_iids = [iid for iid, _ in kept_iids]
+        self.preview_results = preview_results
+        
+        changed_files = sum(1 for result in preview_results
+                            if not result['conflict'] and result['original_name'] != result['new_name'])
+        conflict_files = sum(1 for result in preview_results if result['conflict'])
+        self.update_stats(len(preview_results), changed_files, conflict_files)
+        return True
\ No newline at end of file
@@ -12,19 +12,31 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from src.file_renamer import RenameRule
+from src.metadata import compile_template
+from src.hashing import HASH_ALGORITHMS, check_algorithm
 
 class RulePanel:
     """規則設定面板類別"""
     
-    def __init__(self, parent, file_renamer):
+    def __init__(self, parent, file_renamer, on_change=None):
         self.parent = parent
         self.file_renamer = file_renamer
+        # 即時預覽開啟時，規則或過濾條件改變後呼叫 on_change(filters)
+        self.on_change = on_change
+        self.last_filters = []
         
         # 創建主框架
         self.frame = ttk.LabelFrame(parent, text="重命名規則設定", padding=10)
         
         self.create_widgets()
         self.current_rule = RenameRule()
+        
+        # 表單的任何變更都觸發即時預覽
+        for var in (self.rule_type_var, self.prefix_var, self.suffix_var, self.find_var,
+                    self.replace_var, self.include_ext_var, self.start_var, self.digits_var,
+                    self.case_var, self.template_var, self.hash_algorithm_var,
+                    self.hash_length_var):
+            var.trace_add('write', lambda *args: self.notify_changed())
     
     def create_widgets(self):
         """創建界面組件"""
@@ -36,7 +48,7 @@ class RulePanel:
         
         self.rule_type_var = tk.StringVar(value="prefix")
         rule_type_combo = ttk.Combobox(rule_type_frame, textvariable=self.rule_type_var, 
-                                     values=["prefix", "suffix", "replace", "sequence", "case"],
+                                     values=["prefix", "suffix", "replace", "sequence", "case", "template", "hash"],
                                      state="readonly")
         rule_type_combo.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(10, 0))
         rule_type_combo.bind('<<ComboboxSelected>>', self.on_rule_type_changed)
@@ -50,6 +62,8 @@ class RulePanel:
         self.create_replace_settings()
         self.create_sequence_settings()
         self.create_case_settings()
+        self.create_template_settings()
+        self.create_hash_settings()
         
         # 預設顯示前綴設定
         self.show_prefix_suffix_settings()
@@ -66,6 +80,13 @@ class RulePanel:
         
         ttk.Label(filter_frame, text="例如: .txt,.jpg,.png").pack(anchor=tk.W)
         
+        # 即時預覽
+        self.live_preview_var = tk.BooleanVar(
+            value=self.file_renamer.settings.get('live_preview', False))
+        ttk.Checkbutton(self.frame, text="即時預覽（編輯時自動更新）",
+                        variable=self.live_preview_var,
+                        command=self.on_live_preview_changed).pack(anchor=tk.W, pady=(0, 10))
+        
         # 操作按鈕
         button_frame = ttk.Frame(self.frame)
         button_frame.pack(fill=tk.X)
@@ -195,6 +216,45 @@ class RulePanel:
             ttk.Radiobutton(self.case_frame, text=text, variable=self.case_var, 
                            value=value).pack(anchor=tk.W, pady=2)
     
+    def create_template_settings(self):
+        """創建命名範本設定界面"""
+        self.template_frame = ttk.Frame(self.settings_frame)
+        
+        template_entry_frame = ttk.Frame(self.template_frame)
+        template_entry_frame.pack(fill=tk.X, pady=(0, 10))
+        
+        ttk.Label(template_entry_frame, text="範本:").pack(side=tk.LEFT)
+        self.template_var = tk.StringVar()
+        ttk.Entry(template_entry_frame, textvariable=self.template_var).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(10, 0))
+        
+        ttk.Label(self.template_frame, text="例如: {mtime:%Y%m%d}_{size}_{seq}").pack(anchor=tk.W)
+        ttk.Label(self.template_frame, 
+                 text="可用欄位: name, ext, size, mtime, ctime, atime,\nmode, inode, parent, index, seq, media_date").pack(anchor=tk.W, pady=(5, 0))
+    
+    def create_hash_settings(self):
+        """創建內容雜湊設定界面"""
+        self.hash_frame = ttk.Frame(self.settings_frame)
+        
+        # 演算法
+        algorithm_frame = ttk.Frame(self.hash_frame)
+        algorithm_frame.pack(fill=tk.X, pady=(0, 10))
+        
+        ttk.Label(algorithm_frame, text="演算法:").pack(side=tk.LEFT)
+        self.hash_algorithm_var = tk.StringVar(value="sha256")
+        ttk.Combobox(algorithm_frame, textvariable=self.hash_algorithm_var,
+                    values=HASH_ALGORITHMS, state="readonly").pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(10, 0))
+        
+        # 截取長度
+        length_frame = ttk.Frame(self.hash_frame)
+        length_frame.pack(fill=tk.X)
+        
+        ttk.Label(length_frame, text="長度:").pack(side=tk.LEFT)
+        self.hash_length_var = tk.StringVar(value="16")
+        ttk.Spinbox(length_frame, textvariable=self.hash_length_var,
+                   from_=0, to=128, width=10).pack(side=tk.LEFT, padx=(10, 0))
+        
+        ttk.Label(self.hash_frame, text="長度 0 表示使用完整雜湊值").pack(anchor=tk.W, pady=(10, 0))
+    
     def show_prefix_suffix_settings(self):
         """顯示前綴/後綴設定"""
         self.hide_all_settings()
@@ -215,10 +275,20 @@ class RulePanel:
         self.hide_all_settings()
         self.case_frame.pack(fill=tk.BOTH, expand=True)
     
+    def show_template_settings(self):
+        """顯示命名範本設定"""
+        self.hide_all_settings()
+        self.template_frame.pack(fill=tk.BOTH, expand=True)
+    
+    def show_hash_settings(self):
+        """顯示內容雜湊設定"""
+        self.hide_all_settings()
+        self.hash_frame.pack(fill=tk.BOTH, expand=True)
+    
     def hide_all_settings(self):
         """隱藏所有設定界面"""
         for frame in [self.prefix_suffix_frame, self.replace_frame, 
-                     self.sequence_frame, self.case_frame]:
+                     self.sequence_frame, self.case_frame, self.template_frame, self.hash_frame]:
             frame.pack_forget()
     
     def on_rule_type_changed(self, event=None):
@@ -233,9 +303,13 @@ class RulePanel:
             self.show_sequence_settings()
         elif rule_type == "case":
             self.show_case_settings()
+        elif rule_type == "template":
+            self.show_template_settings()
+        elif rule_type == "hash":
+            self.show_hash_settings()
     
-    def on_filter_changed(self, event=None):
-        """檔案過濾改變事件"""
+    def get_filters(self):
+        """解析過濾條件輸入框"""
         filter_text = self.filter_var.get().strip()
         if filter_text:
             # 分割並清理過濾條件
@@ -244,49 +318,123 @@ class RulePanel:
             filters = [f if f.startswith('.') else f'.{f}' for f in filters]
         else:
             filters = []
-        
-        self.file_renamer.set_file_filters(filters)
+        return filters
     
-    def apply_rule(self):
-        """應用當前規則"""
+    def on_filter_changed(self, event=None):
+        """檔案過濾改變事件"""
+        filters = self.get_filters()
+        if filters == self.last_filters:
+            return  # 方向鍵等不改變內容的按鍵
+        self.last_filters = filters
+        
+        if self.live_preview_var.get() and self.on_change is not None:
+            # 交給即時預覽在背景中過濾，連續輸入時只處理最後一次
+            self.on_change(filters)
+        else:
+            self.file_renamer.set_file_filters(filters)
+    
+    def on_live_preview_changed(self):
+        """即時預覽選項改變事件"""
+        self.file_renamer.settings['live_preview'] = self.live_preview_var.get()
+        if self.live_preview_var.get():
+            self.notify_changed(self.get_filters())
+        else:
+            # 關閉時立即套用尚未交給即時預覽處理的過濾條件
+            self.file_renamer.set_file_filters(self.get_filters())
+    
+    def notify_changed(self, filters=None):
+        """規則改變時通知即時預覽"""
+        if self.live_preview_var.get() and self.on_change is not None:
+            self.on_change(filters)
+    
+    def get_live_rules(self):
+        """即時預覽使用的規則：已套用的規則加上表單中編輯中的規則（有效時）"""
+        rules = list(self.file_renamer.rename_rules)
+        draft = self.build_rule(show_errors=False)
+        if draft is not None:
+            rules.append(draft)
+        return rules
+    
+    def build_rule(self, show_errors=True):
+        """
+        依表單內容建立規則
+        
+        Args:
+            show_errors: 表單內容無效時是否顯示訊息
+        
+        Returns:
+            RenameRule: 建立的規則，表單內容無效時為 None
+        """
+        def warn(title, message):
+            if show_errors:
+                if title == "警告":
+                    messagebox.showwarning(title, message)
+                else:
+                    messagebox.showerror(title, message)
+            return None
+        
         rule_type = self.rule_type_var.get()
         rule = RenameRule()
         rule.rule_type = rule_type
         
-        try:
-            if rule_type == "prefix":
-                prefix = self.prefix_var.get().strip()
-                if not prefix:
-                    messagebox.showwarning("警告", "請輸入前綴內容")
-                    return
-                rule.prefix = prefix
-                
-            elif rule_type == "suffix":
-                suffix = self.suffix_var.get().strip()
-                if not suffix:
-                    messagebox.showwarning("警告", "請輸入後綴內容")
-                    return
-                rule.suffix = suffix
-                
-            elif rule_type == "replace":
-                find_text = self.find_var.get()
-                if not find_text:
-                    messagebox.showwarning("警告", "請輸入要尋找的文字")
-                    return
-                rule.find_text = find_text
-                rule.replace_text = self.replace_var.get()
-                rule.include_extension = self.include_ext_var.get()
+        if rule_type == "prefix":
+            prefix = self.prefix_var.get().strip()
+            if not prefix:
+                return warn("警告", "請輸入前綴內容")
+            rule.prefix = prefix
+            
+        elif rule_type == "suffix":
+            suffix = self.suffix_var.get().strip()
+            if not suffix:
+                return warn("警告", "請輸入後綴內容")
+            rule.suffix = suffix
+            
+        elif rule_type == "replace":
+            find_text = self.find_var.get()
+            if not find_text:
+                return warn("警告", "請輸入要尋找的文字")
+            rule.find_text = find_text
+            rule.replace_text = self.replace_var.get()
+            rule.include_extension = self.include_ext_var.get()
+            
+        elif rule_type == "sequence":
+            try:
+                rule.sequence_start = int(self.start_var.get())
+                rule.sequence_digits = int(self.digits_var.get())
+            except ValueError:
+                return warn("錯誤", "請輸入有效的數字")
                 
-            elif rule_type == "sequence":
-                try:
-                    rule.sequence_start = int(self.start_var.get())
-                    rule.sequence_digits = int(self.digits_var.get())
-                except ValueError:
-                    messagebox.showerror("錯誤", "請輸入有效的數字")
-                    return
-                    
-            elif rule_type == "case":
-                rule.case_option = self.case_var.get()
+        elif rule_type == "case":
+            rule.case_option = self.case_var.get()
+            
+        elif rule_type == "template":
+            template = self.template_var.get().strip()
+            if not template:
+                return warn("警告", "請輸入命名範本")
+            try:
+                compile_template(template)
+            except ValueError as e:
+                return warn("錯誤", f"範本格式錯誤:\n{str(e)}")
+            rule.template = template
+            
+        elif rule_type == "hash":
+            try:
+                rule.hash_length = int(self.hash_length_var.get())
+            except ValueError:
+                return warn("錯誤", "請輸入有效的數字")
+            try:
+                rule.hash_algorithm = check_algorithm(self.hash_algorithm_var.get())
+            except ValueError as e:
+                return warn("錯誤", str(e))
+        
+        return rule
+    
+    def apply_rule(self):
+        """應用當前規則"""
+        try:
+            rule = self.build_rule()
+            if rule is None:
+                return
             
             # 添加規則
             self.file_renamer.add_rename_rule(rule)
@@ -303,6 +451,7 @@ class RulePanel:
         if messagebox.askyesno("確認", "確定要清除所有規則嗎？"):
             self.file_renamer.clear_rename_rules()
             self.refresh_rules_list()
+            self.notify_changed()
     
     def reset_form(self):
         """重設表單"""
@@ -314,6 +463,9 @@ class RulePanel:
         self.start_var.set("1")
         self.digits_var.set("3")
         self.case_var.set("keep")
+        self.template_var.set("")
+        self.hash_algorithm_var.set("sha256")
+        self.hash_length_var.set("16")
     
     def refresh_rules_list(self):
         """刷新規則列表"""
@@ -347,6 +499,11 @@ class RulePanel:
                 "title": "標題格式"
             }
             return f"大小寫: {case_names.get(rule.case_option, rule.case_option)}"
+        elif rule.rule_type == "template":
+            return f"範本: {rule.template}"
+        elif rule.rule_type == "hash":
+            length = f"前 {rule.hash_length} 字元" if rule.hash_length > 0 else "完整"
+            return f"內容雜湊: {rule.hash_algorithm}（{length}）"
         return "未知規則"
     
     def move_rule_up(self):
@@ -360,13 +517,13 @@ class RulePanel:
         
         if index > 0:
             # 交換規則順序
-            rules = self.file_renamer.rename_rules
-            rules[index], rules[index-1] = rules[index-1], rules[index]
+            self.file_renamer.move_rename_rule(index, index - 1)
             self.refresh_rules_list()
             
             # 重新選擇項目
             new_item = self.rules_tree.get_children()[index-1]
             self.rules_tree.selection_set(new_item)
+            self.notify_changed()
     
     def move_rule_down(self):
         """下移規則"""
@@ -376,16 +533,16 @@ class RulePanel:
         
         item = selection[0]
         index = self.rules_tree.index(item)
-        rules = self.file_renamer.rename_rules
         
-        if index < len(rules) - 1:
+        if index < len(self.file_renamer.rename_rules) - 1:
             # 交換規則順序
-            rules[index], rules[index+1] = rules[index+1], rules[index]
+            self.file_renamer.move_rename_rule(index, index + 1)
             self.refresh_rules_list()
             
             # 重新選擇項目
             new_item = self.rules_tree.get_children()[index+1]
             self.rules_tree.selection_set(new_item)
+            self.notify_changed()
     
     def delete_rule(self):
         """刪除規則"""
@@ -398,5 +555,6 @@ class RulePanel:
             index = self.rules_tree.index(item)
             
             # 刪除規則
-            del self.file_renamer.rename_rules[index]
-            self.refresh_rules_list()
\ No newline at end of file
+            self.file_renamer.remove_rename_rule(index)
+            self.refresh_rules_list()
+            self.notify_changed()
\ No newline at end of file
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分批載入樹狀檢視
+Chunked Treeview population
+"""
+
+import time
+from functools import lru_cache
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from src.utils import format_file_size
+
+# 一列資料: (iid, 第一欄文字, 其他欄位值, 標籤)
+Row = Tuple[str, str, Sequence[str], Tuple[str, ...]]
+
+
+# 快取需容納整個大目錄的不同值，否則即時預覽每次輸入都會重新格式化
+@lru_cache(maxsize=262144)
+def cached_file_size(size_bytes: int) -> str:
+    """格式化檔案大小（重複的大小直接取用快取）"""
+    return format_file_size(size_bytes)
+
+
+@lru_cache(maxsize=262144)
+def cached_strftime(value, fmt: str) -> str:
+    """格式化時間（重複的時間直接取用快取）"""
+    return value.strftime(fmt)
+
+
+class ChunkedTreeLoader:
+    """
+    分批將資料列插入 Treeview
+
+    第一批同步插入，讓第一個畫面立即出現；其餘每次 after() 只插入一個時間片段內
+    能完成的列數，其間介面仍可捲動與點擊。重新載入時會取消尚未完成的上一次載入。
+    """
+
+    def __init__(self, tree, first_chunk: int = 200, time_slice: float = 0.03,
+                 on_done: Optional[Callable[[], None]] = None):
+        self.tree = tree
+        self.first_chunk = first_chunk
+        self.time_slice = time_slice
+        self.on_done = on_done
+        self._rows: List[Row] = []
+        self._position = 0
+        self._after_id = None
+
+    @property
+    def loading(self) -> bool:
+        return self._after_id is not None
+
+    def clear(self):
+        """取消載入並清除所有項目"""
+        self.cancel()
+        children = self.tree.get_children()
+        if children:
+            self.tree.delete(*children)
+
+    def cancel(self):
+        """取消尚未完成的載入"""
+        if self._after_id is not None:
+            self.tree.after_cancel(self._after_id)
+            self._after_id = None
+        self._rows = []
+        self._position = 0
+
+    def finish(self):
+        """立即插入所有尚未載入的資料列（例如全選前，選取範圍需要包含所有項目）"""
+        if self._after_id is None:
+            return
+        self.tree.after_cancel(self._after_id)
+        self._after_id = None
+        self._insert(len(self._rows) - self._position)
+        self._rows = []
+        if self.on_done is not None:
+            self.on_done()
+
+    def load(self, rows: List[Row]):
+        """
+        清除現有項目並開始載入
+
+        Args:
+            rows: 已格式化的資料列（可在背景執行緒中預先準備）
+        """
+        self.clear()
+        self._rows = rows
+        self._insert(self.first_chunk)
+        if self._position < len(self._rows):
+            self._after_id = self.tree.after(1, self._insert_next)
+        elif self.on_done is not None:
+            self.on_done()
+
+    def _insert(self, limit: Optional[int] = None):
+        insert = self.tree.insert
+        rows = self._rows
+        end = len(rows) if limit is None else min(len(rows), self._position + limit)
+        deadline = time.perf_counter() + self.time_slice
+        position = self._position
+
+        while position < end:
+            # 每 100 列檢查一次時間，避免每列都呼叫 perf_counter
+            for iid, text, values, tags in rows[position:min(end, position + 100)]:
+                insert('', 'end', iid=iid, text=text, values=values, tags=tags)
+            position = min(end, position + 100)
+            if limit is None and time.perf_counter() >= deadline:
+                break
+
+        self._position = position
+
+    def _insert_next(self):
+        self._after_id = None
+        self._insert()
+        if self._position < len(self._rows):
+            self._after_id = self.tree.after(1, self._insert_next)
+        else:
+            self._rows = []
+            if self.on_done is not None:
+                self.on_done()
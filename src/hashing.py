@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+檔案內容雜湊
+File content hashing
+"""
+
+import os
+import json
+import mmap
+import time
+import atexit
+import hashlib
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    from .config import HASH_CACHE_FILE
+except ImportError:  # 以 src 目錄直接匯入時（test.py、main.py）
+    from config import HASH_CACHE_FILE
+
+# 可用的雜湊演算法（排除需要指定長度的 shake 系列）
+HASH_ALGORITHMS = sorted(a for a in hashlib.algorithms_guaranteed
+                         if not a.startswith('shake'))
+
+
+def check_algorithm(algorithm: str) -> str:
+    """
+    確認雜湊演算法可用（建立規則時呼叫，而不是在預覽中才失敗）
+
+    Returns:
+        str: 演算法名稱
+
+    Raises:
+        ValueError: 不在 HASH_ALGORITHMS 中的演算法
+    """
+    if algorithm not in HASH_ALGORITHMS:
+        raise ValueError(f"不支援的雜湊演算法: {algorithm}（可用: {', '.join(HASH_ALGORITHMS)}）")
+    return algorithm
+
+# 大於此大小的檔案改用 mmap 讀取
+MMAP_THRESHOLD = 8 * 1024 * 1024
+
+# 一般讀取時的固定緩衝區大小
+BUFFER_SIZE = 1024 * 1024
+
+# 累積這麼多筆變更後才重寫快取檔，其餘在程式結束時寫入
+SAVE_THRESHOLD = 1000
+
+
+def hash_file(filepath: str, algorithm: str = 'sha256') -> Tuple[str, int]:
+    """
+    計算檔案內容雜湊
+
+    Args:
+        filepath: 檔案路徑
+        algorithm: hashlib 演算法名稱
+
+    Returns:
+        Tuple[str, int]: (十六進位雜湊值, 讀取的位元組數)
+    """
+    hasher = hashlib.new(algorithm)
+
+    with open(filepath, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+
+        if size >= MMAP_THRESHOLD:
+            # 大檔案直接映射，hashlib 在計算時會釋放 GIL
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                hasher.update(mapped)
+            return hasher.hexdigest(), size
+
+        buffer = bytearray(BUFFER_SIZE)
+        view = memoryview(buffer)
+        bytes_read = 0
+        while True:
+            count = f.readinto(buffer)
+            if not count:
+                break
+            hasher.update(view[:count])
+            bytes_read += count
+
+    return hasher.hexdigest(), bytes_read
+
+
+class HashCache:
+    """
+    以 (路徑, 大小, 修改時間, inode) 為鍵的磁碟雜湊快取
+
+    快取檔每次都整個重寫，因此累積 SAVE_THRESHOLD 筆變更後才寫入，其餘在程式結束時寫入。
+    重新掃描目錄後以 prune() 移除該目錄中已不存在或已變更的檔案，快取不會無限增長。
+    """
+
+    def __init__(self, cache_file: str = HASH_CACHE_FILE, save_threshold: int = SAVE_THRESHOLD):
+        self.cache_file = cache_file
+        self.save_threshold = save_threshold
+        self._entries = None
+        self._changes = 0
+        self._pending_prune = {}  # 快取尚未載入時，各目錄待套用的掃描結果
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(file_info: Dict, algorithm: str) -> str:
+        """產生快取鍵（路徑放在最後，可含任何字元）"""
+        return (f"{algorithm}|{file_info['size']}|{file_info.get('mtime_ns')}|"
+                f"{file_info.get('inode')}|{file_info['full_path']}")
+
+    def _load(self):
+        # 呼叫者須持有 self._lock
+        if self._entries is not None:
+            return
+        self._entries = {}
+        try:
+            if os.path.exists(self.cache_file):
+                with open(self.cache_file, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f)
+        except Exception as e:
+            print(f"載入雜湊快取時發生錯誤: {e}")
+        pending, self._pending_prune = self._pending_prune, {}
+        for directory, files in pending.items():
+            self._prune(directory, files)
+
+    def get(self, file_info: Dict, algorithm: str) -> Optional[str]:
+        """讀取快取的雜湊值"""
+        with self._lock:
+            self._load()
+            return self._entries.get(self.make_key(file_info, algorithm))
+
+    def put(self, file_info: Dict, algorithm: str, digest: str):
+        """寫入雜湊值"""
+        with self._lock:
+            self._load()
+            self._entries[self.make_key(file_info, algorithm)] = digest
+            self._changed(1)
+
+    def prune(self, directory: str, files: List[Dict]) -> int:
+        """
+        移除目錄中已不存在或已變更（大小、修改時間、inode 不同）的檔案
+
+        Args:
+            directory: 掃描的目錄
+            files: 該目錄的掃描紀錄
+
+        Returns:
+            int: 移除的項目數；快取尚未載入時延後到載入時才移除，返回 0
+        """
+        with self._lock:
+            if self._entries is None:
+                # 不使用雜湊規則時不需要為了清理而讀取快取檔
+                self._pending_prune[directory] = files
+                return 0
+            return self._prune(directory, files)
+
+    def _prune(self, directory: str, files: List[Dict]) -> int:
+        # 呼叫者須持有 self._lock，且快取已載入
+        prefix = os.path.join(directory, '')
+        current = {(str(file_info['size']), str(file_info.get('mtime_ns')),
+                    str(file_info.get('inode')), file_info['full_path']) for file_info in files}
+        stale = []
+        for key in self._entries:
+            fields = key.split('|', 4)
+            if len(fields) != 5:
+                stale.append(key)  # 舊格式的鍵
+                continue
+            path = fields[4]
+            if (path.startswith(prefix) and os.sep not in path[len(prefix):] and
+                    tuple(fields[1:]) not in current):
+                stale.append(key)
+        for key in stale:
+            del self._entries[key]
+        self._changed(len(stale))
+        return len(stale)
+
+    def _changed(self, count: int):
+        # 呼叫者須持有 self._lock
+        if count:
+            self._changes += count
+            _unsaved_caches.add(self)
+
+    def save(self, force: bool = False):
+        """
+        儲存快取到磁碟
+
+        Args:
+            force: 即使變更未達門檻也寫入
+        """
+        with self._lock:
+            if not self._changes or (not force and self._changes < self.save_threshold):
+                return
+            try:
+                temp_file = f"{self.cache_file}.tmp"
+                with open(temp_file, 'w', encoding='utf-8') as f:
+                    json.dump(self._entries, f, ensure_ascii=False)
+                os.replace(temp_file, self.cache_file)
+                self._changes = 0
+                _unsaved_caches.discard(self)
+            except Exception as e:
+                print(f"儲存雜湊快取時發生錯誤: {e}")
+
+
+# 有未寫入變更的快取，程式結束時寫入
+_unsaved_caches = weakref.WeakSet()
+
+
+@atexit.register
+def _save_unsaved_caches():
+    for cache in list(_unsaved_caches):
+        cache.save(force=True)
+
+
+def hash_files(files: List[Dict], algorithm: str = 'sha256',
+               cache: Optional[HashCache] = None,
+               max_workers: Optional[int] = None,
+               should_cancel: Optional[Callable[[], bool]] = None) -> Tuple[Dict[str, str], Dict]:
+    """
+    以執行緒池計算多個檔案的雜湊
+
+    Args:
+        files: 掃描紀錄列表（需含 full_path、size、mtime_ns）
+        algorithm: hashlib 演算法名稱
+        cache: 磁碟雜湊快取，未變更的檔案不會重新計算
+        max_workers: 執行緒數量
+        should_cancel: 每個檔案開始前呼叫，返回 True 時不再計算其餘檔案
+
+    Returns:
+        Tuple[Dict[str, str], Dict]: (路徑對應雜湊值, 統計資訊)；被取消時只含已完成的檔案，
+        統計中的 cancelled 為 True
+    """
+    digests = {}
+    pending = []
+
+    for file_info in files:
+        digest = cache.get(file_info, algorithm) if cache is not None else None
+        if digest is None:
+            pending.append(file_info)
+        else:
+            digests[file_info['full_path']] = digest
+
+    cache_hits = len(files) - len(pending)
+    bytes_hashed = 0
+    errors = []
+    start_time = time.perf_counter()
+
+    cancelled = threading.Event()
+
+    def worker(file_info):
+        if cancelled.is_set() or (should_cancel is not None and should_cancel()):
+            cancelled.set()
+            return file_info, None, None
+        try:
+            return file_info, hash_file(file_info['full_path'], algorithm), None
+        except (OSError, ValueError) as e:
+            return file_info, None, e
+
+    if pending:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for file_info, result, error in executor.map(worker, pending):
+                if result is None and error is None:
+                    continue  # 已取消
+                if error is not None:
+                    errors.append(f"{file_info['original_name']}: {error}")
+                    continue
+                digest, bytes_read = result
+                digests[file_info['full_path']] = digest
+                bytes_hashed += bytes_read
+                if cache is not None:
+                    cache.put(file_info, algorithm, digest)
+
+    elapsed = time.perf_counter() - start_time
+    if cache is not None:
+        cache.save()
+
+    stats = {
+        'algorithm': algorithm,
+        'files': len(files),
+        'hashed': len(digests) - cache_hits,
+        'cache_hits': cache_hits,
+        'cache_hit_rate': cache_hits / len(files) if files else 0.0,
+        'bytes': bytes_hashed,
+        'seconds': elapsed,
+        'mb_per_second': bytes_hashed / (1024 * 1024) / elapsed if elapsed > 0 else 0.0,
+        'errors': errors,
+        'cancelled': cancelled.is_set()
+    }
+    return digests, stats
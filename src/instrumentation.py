@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+階段計時與效能分析
+Per-stage timing instrumentation
+"""
+
+import os
+import time
+import threading
+from typing import Callable, Dict, List, Optional
+
+try:
+    from . import executor
+except ImportError:  # 以 src 目錄直接匯入時（test.py、main.py）
+    import executor
+
+# 統計呼叫次數的 os 函數（os.path.exists 等也會經由 os.stat 計入）
+COUNTED_OS_CALLS = ['stat', 'lstat', 'scandir', 'listdir', 'rename', 'replace',
+                    'link', 'unlink', 'open', 'fsync']
+
+
+def read_io_syscalls() -> int:
+    """讀取 /proc/self/io 的 read/write 系統呼叫次數（非 Linux 返回 0）"""
+    try:
+        with open('/proc/self/io', 'r') as f:
+            values = dict(line.split(':') for line in f.read().splitlines())
+        return int(values['syscr']) + int(values['syscw'])
+    except (OSError, KeyError, ValueError):
+        return 0
+
+
+class OsCallCounter:
+    """暫時包裝 os 函數以統計呼叫次數
+
+    不覆蓋模式的重命名以 ctypes 直接呼叫 renameat2，不經過 os 模組，另外包裝後計為
+    renameat2。包裝是全域的，只適合在效能測試或除錯時短暫使用。
+    """
+
+    def __init__(self, names=COUNTED_OS_CALLS):
+        self.names = [name for name in names if hasattr(os, name)]
+        self.counts = {}
+        self._originals = {}
+        self._renameat2 = None
+
+    def _wrap(self, name, original):
+        counts = self.counts
+
+        def wrapper(*args, **kwargs):
+            counts[name] = counts.get(name, 0) + 1
+            return original(*args, **kwargs)
+        return wrapper
+
+    def __enter__(self):
+        for name in self.names:
+            self._originals[name] = getattr(os, name)
+            setattr(os, name, self._wrap(name, self._originals[name]))
+        function = executor._load_renameat2()
+        if function:
+            self._renameat2 = function
+            executor._renameat2 = self._wrap('renameat2', function)
+        return self
+
+    def __exit__(self, *exc_info):
+        for name, original in self._originals.items():
+            setattr(os, name, original)
+        self._originals.clear()
+        if self._renameat2 is not None:
+            if executor._renameat2:  # 期間發現核心不支援時已設為 False
+                executor._renameat2 = self._renameat2
+            self._renameat2 = None
+
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+
+class _NullStage:
+    """停用時使用的空階段，所有操作都不做任何事"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+NULL_STAGE = _NullStage()
+
+
+class Stage:
+    """單一階段的量測結果"""
+
+    def __init__(self, instrumentation: 'Instrumentation', name: str):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.items = 0
+        self.seconds = 0.0
+        self.io_syscalls = 0
+        self.os_calls = {}
+        self._start = 0.0
+        self._io_start = 0
+        self._counter = None
+
+    def __enter__(self):
+        if self.instrumentation.count_os_calls:
+            self._counter = OsCallCounter().__enter__()
+        self._io_start = read_io_syscalls()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds = time.perf_counter() - self._start
+        self.io_syscalls = read_io_syscalls() - self._io_start
+        if self._counter is not None:
+            self._counter.__exit__(*exc_info)
+            self.os_calls = dict(self._counter.counts)
+        self.instrumentation.record(self)
+        return False
+
+    def to_dict(self) -> Dict:
+        return {
+            'stage': self.name,
+            'items': self.items,
+            'seconds': self.seconds,
+            'io_syscalls': self.io_syscalls,
+            'os_calls': self.os_calls
+        }
+
+
+class Instrumentation:
+    """
+    FileRenamer 各階段的計時器
+
+    以 with instrumentation.stage("scan") as stage: 包住要量測的區塊，
+    並設定 stage.items。每個階段結束後會呼叫所有已註冊的 hook。
+    """
+
+    def __init__(self, count_os_calls: bool = False):
+        self.count_os_calls = count_os_calls
+        self.stages: Dict[str, Stage] = {}
+        self.hooks: List[Callable[[Stage], None]] = []
+        self._lock = threading.Lock()
+
+    def stage(self, name: str) -> Stage:
+        """建立一個量測階段"""
+        return Stage(self, name)
+
+    def add_hook(self, hook: Callable[[Stage], None]):
+        """註冊階段結束時呼叫的函數"""
+        self.hooks.append(hook)
+
+    def record(self, stage: Stage):
+        """記錄階段結果（同名階段保留最後一次）"""
+        with self._lock:
+            self.stages[stage.name] = stage
+        for hook in self.hooks:
+            try:
+                hook(stage)
+            except Exception as e:
+                print(f"執行效能分析 hook 時發生錯誤: {e}")
+
+    def reset(self):
+        """清除已記錄的階段"""
+        with self._lock:
+            self.stages.clear()
+
+    def summary(self, names: Optional[List[str]] = None) -> str:
+        """
+        產生各階段耗時摘要
+
+        Args:
+            names: 要顯示的階段，None 表示全部
+
+        Returns:
+            str: 如 "scan 12ms (1000) | preview 30ms (1000)"
+        """
+        parts = []
+        for name, stage in list(self.stages.items()):
+            if names is not None and name not in names:
+                continue
+            parts.append(f"{name} {stage.seconds * 1000:.0f}ms ({stage.items})")
+        return " | ".join(parts)
+
+    def report(self) -> str:
+        """產生多行的詳細報表"""
+        lines = [f"{'階段':<14}{'項目':>10}{'時間(ms)':>12}{'I/O 呼叫':>10}{'os 呼叫':>10}"]
+        for stage in list(self.stages.values()):
+            os_calls = sum(stage.os_calls.values()) if self.count_os_calls else '-'
+            lines.append(f"{stage.name:<14}{stage.items:>10}{stage.seconds * 1000:>12.1f}"
+                         f"{stage.io_syscalls:>10}{os_calls:>10}")
+        return "\n".join(lines)
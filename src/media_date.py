@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+媒體拍攝日期解析
+Media capture date extraction
+
+只讀取檔頭所需的位元組：JPEG 的 EXIF 區段、PNG 的 IDAT 之前的區塊、
+MP4/MOV 的 box 標頭與 mvhd。影像與影音資料本身透過 seek 略過。
+"""
+
+import os
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+# EXIF 標籤
+EXIF_TAG_DATETIME = 0x0132
+EXIF_TAG_EXIF_IFD = 0x8769
+EXIF_TAG_DATETIME_ORIGINAL = 0x9003
+EXIF_TAG_DATETIME_DIGITIZED = 0x9004
+
+# 讀取 PNG tEXt 區塊的長度上限
+MAX_SEGMENT_SIZE = 65535
+
+# MP4 時間起點 (1904-01-01) 與 Unix 時間起點的差距（秒）
+MP4_EPOCH_OFFSET = 2082844800
+# datetime 可表示的最大 Unix 時間（9999-12-30），損壞的 mvhd 可能超過此範圍
+MAX_UNIX_TIME = 253402128000
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# PNG tEXt 區塊中可能出現的時間格式（時區與小數秒會被截去）
+PNG_TEXT_DATE_FORMATS = [
+    "%Y:%m:%d %H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%d %H:%M:%S",
+    "%a, %d %b %Y %H:%M:%S",
+]
+
+
+class _CountingReader:
+    """記錄實際讀取位元組數的檔案包裝"""
+
+    def __init__(self, f):
+        self.f = f
+        self.bytes_read = 0
+
+    def read(self, size: int) -> bytes:
+        data = self.f.read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def skip(self, size: int):
+        self.f.seek(size, os.SEEK_CUR)
+
+    def seek(self, offset: int):
+        self.f.seek(offset)
+
+
+def _parse_exif_datetime(value: bytes) -> Optional[datetime]:
+    try:
+        text = value.split(b'\x00', 1)[0].decode('ascii').strip()
+        return datetime.strptime(text, "%Y:%m:%d %H:%M:%S")
+    except (UnicodeDecodeError, ValueError):
+        return None
+
+
+def _parse_text_datetime(text: str) -> Optional[datetime]:
+    for date_format in PNG_TEXT_DATE_FORMATS:
+        # 以格式本身的長度截取，略過時區等尾端資訊
+        length = len(datetime(2000, 1, 1).strftime(date_format))
+        try:
+            return datetime.strptime(text[:length], date_format)
+        except ValueError:
+            continue
+    return None
+
+
+def parse_tiff_datetime(data: bytes) -> Optional[datetime]:
+    """
+    從 TIFF 結構（EXIF 內容）取得拍攝日期
+
+    Args:
+        data: 以 "II" 或 "MM" 開頭的 TIFF 資料
+
+    Returns:
+        Optional[datetime]: DateTimeOriginal，其次為 DateTimeDigitized 與 DateTime
+    """
+    if len(data) < 8:
+        return None
+    if data[:2] == b'II':
+        order = '<'
+    elif data[:2] == b'MM':
+        order = '>'
+    else:
+        return None
+
+    def read_ifd(offset: int) -> Dict[int, bytes]:
+        # 只收集需要的標籤
+        tags = {}
+        if offset + 2 > len(data):
+            return tags
+        count = struct.unpack_from(order + 'H', data, offset)[0]
+        for i in range(count):
+            entry = offset + 2 + i * 12
+            if entry + 12 > len(data):
+                break
+            tag, field_type, value_count = struct.unpack_from(order + 'HHI', data, entry)
+            if tag == EXIF_TAG_EXIF_IFD:
+                tags[tag] = struct.unpack_from(order + 'I', data, entry + 8)[0]
+            elif tag in (EXIF_TAG_DATETIME, EXIF_TAG_DATETIME_ORIGINAL,
+                         EXIF_TAG_DATETIME_DIGITIZED) and field_type == 2:
+                # ASCII 超過 4 位元組時，數值欄位存放的是偏移量
+                if value_count <= 4:
+                    tags[tag] = data[entry + 8:entry + 8 + value_count]
+                else:
+                    value_offset = struct.unpack_from(order + 'I', data, entry + 8)[0]
+                    tags[tag] = data[value_offset:value_offset + value_count]
+        return tags
+
+    ifd0 = read_ifd(struct.unpack_from(order + 'I', data, 4)[0])
+    exif_ifd = read_ifd(ifd0[EXIF_TAG_EXIF_IFD]) if EXIF_TAG_EXIF_IFD in ifd0 else {}
+
+    for tags, tag in ((exif_ifd, EXIF_TAG_DATETIME_ORIGINAL),
+                      (exif_ifd, EXIF_TAG_DATETIME_DIGITIZED),
+                      (ifd0, EXIF_TAG_DATETIME)):
+        if tag in tags:
+            result = _parse_exif_datetime(tags[tag])
+            if result is not None:
+                return result
+    return None
+
+
+def _read_jpeg_date(reader: _CountingReader) -> Optional[datetime]:
+    reader.seek(2)
+    while True:
+        header = reader.read(4)
+        if len(header) < 4 or header[0] != 0xFF:
+            return None
+
+        marker = header[1]
+        length = struct.unpack('>H', header[2:4])[0]
+
+        # 遇到影像資料開始（SOS）或結束（EOI）就停止
+        if marker in (0xDA, 0xD9) or length < 2:
+            return None
+
+        if marker == 0xE1 and length >= 8:
+            # 先確認識別碼，XMP 等其他 APP1 區段不讀取內容
+            if reader.read(6) == b'Exif\x00\x00':
+                return parse_tiff_datetime(reader.read(length - 8))
+            reader.skip(length - 8)
+        else:
+            reader.skip(length - 2)
+
+
+def _read_png_date(reader: _CountingReader) -> Optional[datetime]:
+    reader.seek(len(PNG_SIGNATURE))
+    text_date = None
+    time_date = None
+
+    while True:
+        header = reader.read(8)
+        if len(header) < 8:
+            break
+        length, chunk_type = struct.unpack('>I4s', header)
+
+        # 影像資料之後的區塊不再讀取
+        if chunk_type in (b'IDAT', b'IEND'):
+            break
+
+        if chunk_type == b'eXIf':
+            result = parse_tiff_datetime(reader.read(length))
+            if result is not None:
+                return result
+            reader.skip(4)
+        elif chunk_type == b'tEXt' and length <= MAX_SEGMENT_SIZE:
+            keyword, _, value = reader.read(length).partition(b'\x00')
+            if keyword == b'Creation Time' and text_date is None:
+                text_date = _parse_text_datetime(value.decode('latin-1').strip())
+            reader.skip(4)
+        elif chunk_type == b'tIME' and length == 7:
+            year, month, day, hour, minute, second = struct.unpack('>HBBBBB', reader.read(7))
+            try:
+                time_date = datetime(year, month, day, hour, minute, second)
+            except ValueError:
+                pass
+            reader.skip(4)
+        else:
+            reader.skip(length + 4)
+
+    return text_date or time_date
+
+
+def _read_mp4_date(reader: _CountingReader, file_size: int) -> Optional[datetime]:
+    def walk(start: int, end: int) -> Optional[datetime]:
+        offset = start
+        while offset + 8 <= end:
+            reader.seek(offset)
+            header = reader.read(8)
+            if len(header) < 8:
+                return None
+            size, box_type = struct.unpack('>I4s', header)
+            header_size = 8
+            if size == 1:
+                size = struct.unpack('>Q', reader.read(8))[0]
+                header_size = 16
+            elif size == 0:
+                size = end - offset
+            if size < header_size:
+                return None
+
+            if box_type == b'moov':
+                return walk(offset + header_size, offset + size)
+            if box_type == b'mvhd':
+                version = reader.read(1)
+                if not version:
+                    return None
+                reader.skip(3)
+                if version[0] == 1:
+                    creation_time = struct.unpack('>Q', reader.read(8))[0]
+                else:
+                    creation_time = struct.unpack('>I', reader.read(4))[0]
+                timestamp = creation_time - MP4_EPOCH_OFFSET
+                if not 0 < timestamp <= MAX_UNIX_TIME:
+                    return None
+                try:
+                    return datetime.fromtimestamp(timestamp)
+                except (ValueError, OverflowError, OSError):
+                    return None  # 平台的 time_t 範圍較小
+
+            offset += size
+        return None
+
+    return walk(0, file_size)
+
+
+def read_media_date(filepath: str) -> Tuple[Optional[datetime], int]:
+    """
+    讀取媒體檔的拍攝/建立日期
+
+    Args:
+        filepath: 檔案路徑
+
+    Returns:
+        Tuple[Optional[datetime], int]: (拍攝日期, 讀取的位元組數)，
+        不支援的格式或無日期資訊時日期為 None
+    """
+    with open(filepath, 'rb', buffering=0) as f:
+        reader = _CountingReader(f)
+        magic = reader.read(12)
+
+        if magic[:3] == b'\xff\xd8\xff':
+            result = _read_jpeg_date(reader)
+        elif magic[:8] == PNG_SIGNATURE:
+            result = _read_png_date(reader)
+        elif magic[4:8] == b'ftyp':
+            result = _read_mp4_date(reader, os.fstat(f.fileno()).st_size)
+        else:
+            result = None
+
+    return result, reader.bytes_read
+
+
+def read_media_dates(files: List[Dict],
+                     max_workers: Optional[int] = None) -> Tuple[Dict[str, Optional[datetime]], Dict]:
+    """
+    以執行緒池讀取多個檔案的拍攝日期
+
+    Args:
+        files: 掃描紀錄列表（需含 full_path）
+        max_workers: 執行緒數量
+
+    Returns:
+        Tuple[Dict, Dict]: (路徑對應拍攝日期, 統計資訊)
+    """
+    dates = {}
+    bytes_read = 0
+    errors = []
+    start_time = time.perf_counter()
+
+    def worker(file_info):
+        try:
+            return file_info, read_media_date(file_info['full_path']), None
+        except (OSError, struct.error, ValueError, OverflowError) as e:
+            # 損壞的檔案只影響該檔案，不中止整個預覽
+            return file_info, None, e
+
+    if files:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for file_info, result, error in executor.map(worker, files):
+                if error is not None:
+                    errors.append(f"{file_info['original_name']}: {error}")
+                    dates[file_info['full_path']] = None
+                    continue
+                dates[file_info['full_path']] = result[0]
+                bytes_read += result[1]
+
+    stats = {
+        'files': len(files),
+        'found': sum(1 for value in dates.values() if value is not None),
+        'bytes_read': bytes_read,
+        'bytes_per_file': bytes_read / len(files) if files else 0.0,
+        'seconds': time.perf_counter() - start_time,
+        'errors': errors
+    }
+    return dates, stats
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+檔案中繼資料快取與命名範本
+File metadata cache and naming templates
+"""
+
+import os
+import string
+from datetime import datetime
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    from .media_date import read_media_date
+except ImportError:  # 以 src 目錄直接匯入時（test.py、main.py）
+    from media_date import read_media_date
+
+# 範本可用的欄位
+# name/ext/size/mtime/index/seq/parent 直接取自掃描紀錄，不需額外的系統呼叫
+# ctime/atime/mode/inode 需要完整的 stat 結果，第一次使用時才取得並快取
+# media_date 需要讀取檔頭，同樣延遲載入並快取
+TEMPLATE_FIELDS = {
+    'name': '目前檔名（不含副檔名）',
+    'ext': '副檔名（不含點）',
+    'size': '檔案大小（位元組）',
+    'mtime': '修改時間',
+    'ctime': '建立/狀態變更時間',
+    'atime': '存取時間',
+    'mode': '權限位元',
+    'inode': 'inode 編號',
+    'parent': '所在目錄名稱',
+    'index': '檔案順序（從 0 開始）',
+    'seq': '序列編號（依規則的起始值與位數）',
+    'media_date': '拍攝日期（EXIF/PNG/MP4，無資訊時使用修改時間）',
+}
+
+# 需要 stat 結果的欄位
+STAT_FIELDS = frozenset(['ctime', 'atime', 'mode', 'inode'])
+
+# 時間欄位未指定格式時使用的格式（避免產生含冒號的檔名）
+DEFAULT_DATE_FORMAT = "%Y%m%d_%H%M%S"
+
+# 各欄位的範例值，解析範本時用來檢查格式是否適用於該欄位的型別
+_SAMPLE_VALUES = {
+    'name': "name", 'ext': "txt", 'parent': "parent",
+    'size': 0, 'mode': 0o644, 'inode': 1, 'index': 0, 'seq': 1,
+    'mtime': datetime(2000, 1, 1), 'ctime': datetime(2000, 1, 1),
+    'atime': datetime(2000, 1, 1), 'media_date': datetime(2000, 1, 1),
+}
+
+
+class MetadataCache:
+    """以 (inode, mtime) 為鍵的檔案中繼資料快取
+
+    每個檔案一個字典，欄位只在第一次被需要時載入。
+    檔案內容變更後 mtime 隨之改變，舊的快取項目自然失效。
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(file_info: Dict) -> Tuple:
+        """產生快取鍵"""
+        inode = file_info.get('inode')
+        mtime_ns = file_info.get('mtime_ns')
+        if inode and mtime_ns is not None:
+            return (inode, mtime_ns)
+        # 沒有 inode 的平台改用路徑
+        return (file_info.get('full_path'), mtime_ns)
+
+    def get(self, file_info: Dict, field: str, loader: Callable[[Dict], object]):
+        """取得欄位值，快取未命中時呼叫 loader 載入"""
+        entry = self._entries.setdefault(self.make_key(file_info), {})
+        if field in entry:
+            self.hits += 1
+            return entry[field]
+
+        self.misses += 1
+        value = loader(file_info)
+        entry[field] = value
+        return value
+
+    def peek(self, file_info: Dict, field: str, default=None):
+        """只讀取已快取的欄位，不觸發載入"""
+        entry = self._entries.get(self.make_key(file_info))
+        if entry is None:
+            return default
+        return entry.get(field, default)
+
+    def put(self, file_info: Dict, field: str, value):
+        """直接寫入欄位值"""
+        self._entries.setdefault(self.make_key(file_info), {})[field] = value
+
+    def prune(self, files_list: List[Dict]):
+        """移除不在目前檔案列表中的快取項目"""
+        live_keys = {self.make_key(file_info) for file_info in files_list}
+        for key in list(self._entries):
+            if key not in live_keys:
+                del self._entries[key]
+
+    def clear(self):
+        """清除所有快取"""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _load_stat(file_info: Dict) -> os.stat_result:
+    return os.stat(file_info['full_path'])
+
+
+def load_media_date(file_info: Dict) -> Optional[datetime]:
+    """讀取拍攝日期，無法解析時返回 None"""
+    try:
+        return read_media_date(file_info['full_path'])[0]
+    except Exception as e:
+        print(f"讀取拍攝日期時發生錯誤: {e}")
+        return None
+
+
+@lru_cache(maxsize=256)
+def compile_template(template: str) -> Tuple[Tuple[str, Optional[str], str], ...]:
+    """
+    解析命名範本
+
+    Args:
+        template: 命名範本，如 "{mtime:%Y%m%d}_{size}_{seq}"
+
+    Returns:
+        Tuple: (前置文字, 欄位名稱, 格式) 組成的序列
+
+    Raises:
+        ValueError: 範本語法錯誤、包含未知欄位，或格式不適用於欄位的型別（如 {size:%Y}）
+    """
+    parts = []
+    for literal, field, spec, conversion in string.Formatter().parse(template):
+        if field is not None:
+            if field not in TEMPLATE_FIELDS:
+                raise ValueError(f"未知的範本欄位: {{{field}}}")
+            if conversion:
+                raise ValueError(f"範本欄位不支援轉換: {{{field}!{conversion}}}")
+            if spec:
+                try:
+                    format(_SAMPLE_VALUES[field], spec)
+                except (ValueError, TypeError) as e:
+                    raise ValueError(f"範本欄位的格式無效: {{{field}:{spec}}}（{e}）")
+        parts.append((literal, field, spec or ''))
+    return tuple(parts)
+
+
+def template_fields(template: str) -> frozenset:
+    """取得範本實際使用的欄位"""
+    return frozenset(field for _, field, _ in compile_template(template) if field)
+
+
+class TemplateContext:
+    """範本欄位的延遲求值環境"""
+
+    def __init__(self, file_info: Dict, name: str, ext: str, index: int,
+                 rule, cache: Optional[MetadataCache] = None):
+        self.file_info = file_info
+        self.name = name
+        self.ext = ext
+        self.index = index
+        self.rule = rule
+        self.cache = cache
+
+    def _stat(self) -> os.stat_result:
+        if self.cache is None:
+            return _load_stat(self.file_info)
+        return self.cache.get(self.file_info, 'stat', _load_stat)
+
+    def value(self, field: str):
+        """取得欄位值"""
+        if field == 'name':
+            return self.name
+        if field == 'ext':
+            return self.ext[1:] if self.ext.startswith('.') else self.ext
+        if field == 'size' and 'size' in self.file_info:
+            return self.file_info['size']
+        if field == 'mtime' and 'modified' in self.file_info:
+            return self.file_info['modified']
+        if field == 'index':
+            return self.index
+        if field == 'seq':
+            return self.rule.sequence_start + self.index
+        if field == 'parent':
+            return os.path.basename(os.path.dirname(self.file_info['full_path']))
+        if field == 'inode' and self.file_info.get('inode'):
+            return self.file_info['inode']
+        if field == 'media_date':
+            media_date = None
+            if self.cache is None:
+                media_date = load_media_date(self.file_info)
+            else:
+                media_date = self.cache.get(self.file_info, 'media_date', load_media_date)
+            if media_date is not None:
+                return media_date
+            field = 'mtime'
+            if 'modified' in self.file_info:
+                return self.file_info['modified']
+
+        st = self._stat()
+        if field == 'size':
+            return st.st_size
+        if field == 'mtime':
+            return datetime.fromtimestamp(st.st_mtime)
+        if field == 'ctime':
+            return datetime.fromtimestamp(st.st_ctime)
+        if field == 'atime':
+            return datetime.fromtimestamp(st.st_atime)
+        if field == 'mode':
+            return st.st_mode & 0o7777
+        if field == 'inode':
+            return st.st_ino
+        raise ValueError(f"未知的範本欄位: {{{field}}}")
+
+
+def render_template(template: str, context: TemplateContext) -> str:
+    """
+    依範本產生檔名
+
+    Args:
+        template: 命名範本
+        context: 欄位求值環境
+
+    Returns:
+        str: 產生的檔名（不含副檔名）
+    """
+    result = []
+    for literal, field, spec in compile_template(template):
+        result.append(literal)
+        if field is None:
+            continue
+
+        value = context.value(field)
+        if field == 'seq' and not spec:
+            result.append(str(value).zfill(context.rule.sequence_digits))
+        elif field == 'mode' and not spec:
+            result.append(format(value, 'o'))
+        elif isinstance(value, datetime) and not spec:
+            result.append(value.strftime(DEFAULT_DATE_FORMAT))
+        else:
+            result.append(format(value, spec))
+    return ''.join(result)
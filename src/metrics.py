@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+重命名統計指標
+Rename metrics collection and export
+
+每個執行緒寫入自己的分片，只有第一次使用時需要取得鎖，
+匯出時再合併所有分片，因此平行執行時的記錄成本很低。
+"""
+
+import os
+import re
+import json
+import time
+import errno
+import bisect
+import threading
+from datetime import datetime
+from typing import Dict, List
+
+# 單次重命名延遲的直方圖上限（秒）
+LATENCY_BUCKETS = [0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0]
+
+METRIC_PREFIX = "bulk_renamer"
+
+EXPORT_FORMATS = ['prometheus', 'jsonl']
+
+# 驗證失敗訊息對應的原因標籤
+FAILURE_REASONS = {
+    "來源檔案重複": "duplicate_source",
+    "來源檔案不存在": "source_missing",
+    "目標檔名重複": "duplicate_target",
+    "目標目錄不存在": "target_dir_missing",
+    "目標檔案已存在": "target_exists",
+    "相依的重命名失敗，已跳過": "dependency_failed",
+}
+
+_ERRNO_PATTERN = re.compile(r'\[Errno (\d+)\]')
+
+
+def failure_reason(message: str) -> str:
+    """
+    將錯誤訊息轉換為原因標籤
+
+    Args:
+        message: executor 返回的錯誤訊息
+
+    Returns:
+        str: 原因標籤，如 target_exists、enoent
+    """
+    reason = FAILURE_REASONS.get(message)
+    if reason is not None:
+        return reason
+    match = _ERRNO_PATTERN.search(message)
+    if match:
+        return errno.errorcode.get(int(match.group(1)), "oserror").lower()
+    return "other"
+
+
+class _Shard:
+    """單一執行緒的計數"""
+
+    __slots__ = ('attempted', 'succeeded', 'failed', 'bytes', 'buckets', 'latency_sum',
+                 'latency_count')
+
+    def __init__(self):
+        self.attempted = 0
+        self.succeeded = 0
+        self.failed = {}
+        self.bytes = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.latency_count = 0
+
+
+class RenameMetrics:
+    """
+    批次重命名的計數器與延遲直方圖
+
+    設定 FileRenamer.metrics 後，execute_rename 會自動記錄；
+    工作結束時以 export() 寫成 Prometheus 文字格式或 JSON lines。
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self._local = threading.local()
+        self._shards: List[_Shard] = []
+        self._lock = threading.Lock()
+
+    def _shard(self) -> _Shard:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def record_attempt(self, count: int = 1):
+        """記錄嘗試的重命名數量"""
+        self._shard().attempted += count
+
+    def record_success(self, size: int = 0):
+        """記錄成功的重命名與涉及的位元組數"""
+        shard = self._shard()
+        shard.succeeded += 1
+        shard.bytes += size
+
+    def record_failure(self, reason: str):
+        """記錄失敗的重命名"""
+        failed = self._shard().failed
+        failed[reason] = failed.get(reason, 0) + 1
+
+    def observe_latency(self, seconds: float):
+        """記錄單次重命名的耗時"""
+        shard = self._shard()
+        shard.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        shard.latency_sum += seconds
+        shard.latency_count += 1
+
+    def reset(self):
+        """清除所有計數"""
+        with self._lock:
+            self._shards = []
+            self._local = threading.local()
+            self.started = time.time()
+
+    def snapshot(self) -> Dict:
+        """
+        合併所有分片
+
+        Returns:
+            Dict: 目前的計數，直方圖為非累積的各區間數量
+        """
+        with self._lock:
+            shards = list(self._shards)
+
+        result = {
+            'attempted': 0,
+            'succeeded': 0,
+            'failed': {},
+            'bytes': 0,
+            'latency_buckets': [0] * (len(LATENCY_BUCKETS) + 1),
+            'latency_sum': 0.0,
+            'latency_count': 0,
+        }
+        for shard in shards:
+            result['attempted'] += shard.attempted
+            result['succeeded'] += shard.succeeded
+            result['bytes'] += shard.bytes
+            result['latency_sum'] += shard.latency_sum
+            result['latency_count'] += shard.latency_count
+            for reason, count in list(shard.failed.items()):
+                result['failed'][reason] = result['failed'].get(reason, 0) + count
+            for i, count in enumerate(shard.buckets):
+                result['latency_buckets'][i] += count
+        return result
+
+    def to_prometheus(self) -> str:
+        """以 Prometheus 文字格式輸出"""
+        data = self.snapshot()
+        p = METRIC_PREFIX
+        lines = [
+            f"# HELP {p}_renames_attempted_total Renames attempted.",
+            f"# TYPE {p}_renames_attempted_total counter",
+            f"{p}_renames_attempted_total {data['attempted']}",
+            f"# HELP {p}_renames_succeeded_total Renames that succeeded.",
+            f"# TYPE {p}_renames_succeeded_total counter",
+            f"{p}_renames_succeeded_total {data['succeeded']}",
+            f"# HELP {p}_renames_failed_total Renames that failed, by reason.",
+            f"# TYPE {p}_renames_failed_total counter",
+        ]
+        for reason, count in sorted(data['failed'].items()):
+            lines.append(f'{p}_renames_failed_total{{reason="{reason}"}} {count}')
+        lines += [
+            f"# HELP {p}_bytes_total Size of renamed files in bytes.",
+            f"# TYPE {p}_bytes_total counter",
+            f"{p}_bytes_total {data['bytes']}",
+            f"# HELP {p}_rename_latency_seconds Latency of a single rename.",
+            f"# TYPE {p}_rename_latency_seconds histogram",
+        ]
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, data['latency_buckets']):
+            cumulative += count
+            lines.append(f'{p}_rename_latency_seconds_bucket{{le="{bound:g}"}} {cumulative}')
+        lines += [
+            f'{p}_rename_latency_seconds_bucket{{le="+Inf"}} {data["latency_count"]}',
+            f"{p}_rename_latency_seconds_sum {data['latency_sum']:.9f}",
+            f"{p}_rename_latency_seconds_count {data['latency_count']}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    def to_json(self) -> Dict:
+        """以單筆 JSON 紀錄輸出"""
+        data = self.snapshot()
+        data['timestamp'] = datetime.now().isoformat()
+        data['seconds'] = time.time() - self.started
+        data['latency_bounds'] = LATENCY_BUCKETS
+        return data
+
+    def export(self, path: str, format: str = 'prometheus'):
+        """
+        匯出到本機檔案
+
+        Prometheus 格式會整個覆寫（適合 node_exporter 的 textfile collector），
+        JSON lines 則每次附加一行，方便比較每晚執行的趨勢。
+
+        Args:
+            path: 輸出檔案路徑
+            format: prometheus 或 jsonl
+        """
+        if format == 'prometheus':
+            temp_path = f"{path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(self.to_prometheus())
+            os.replace(temp_path, path)
+        elif format == 'jsonl':
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(self.to_json(), ensure_ascii=False) + "\n")
+        else:
+            raise ValueError(f"未知的匯出格式: {format}")
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+重命名計畫檔
+Serializable rename plans with resumable execution
+
+計畫檔為 JSON Lines：第一行是標頭，之後每行一個執行步驟
+    [操作鏈編號, 來源, 目標, 是否完成該操作]
+步驟已依 plan_moves 的相依順序排好（循環已拆成暫存檔名），同一條鏈的步驟相鄰，
+可選擇讓操作鏈之間依目錄與 inode 順序排列；執行時只需逐行讀取，不必把整個計畫載入記憶體。
+
+執行進度每 N 步以原子方式寫入 <計畫檔>.progress（寫入前先 fsync 涉及的目錄，記錄為已完成的
+重命名不會因斷電而遺失），中斷後可從上次的位置繼續。開始執行前與操作鏈的每個後續步驟前
+也會寫入進度：後續步驟會佔用前一步的來源（例如互換 a↔b），重新執行時無法由檔案是否存在
+判斷前一步是否已完成；
+失敗的步驟附加到 <計畫檔>.errors，不會累積在記憶體中。
+"""
+
+import os
+import json
+import time
+import errno
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from .executor import (DirectoryHandles, DirectorySync, Observer, order_chains, plan_moves,
+                           snapshot_directories)
+except ImportError:  # 以 src 目錄直接匯入時（test.py、main.py）
+    from executor import (DirectoryHandles, DirectorySync, Observer, order_chains, plan_moves,
+                          snapshot_directories)
+
+PLAN_FORMAT = "bulk_renamer_plan"
+PLAN_VERSION = 1
+
+
+def _relative(path: str, directory: str) -> str:
+    """同一目錄中的檔案只記錄名稱，其他位置記錄完整路徑"""
+    parent, name = os.path.split(path)
+    return name if parent == directory else path
+
+
+def write_plan(path: str, directory: str, moves: List[Tuple[str, str]],
+               locality: bool = False) -> Dict:
+    """
+    將重命名操作寫成計畫檔
+
+    Args:
+        path: 計畫檔路徑
+        directory: 計畫的目錄，步驟中的名稱相對於此目錄
+        moves: (來源路徑, 目標路徑) 列表
+        locality: 操作鏈依目錄與 inode 順序排列（見 executor.order_chains）
+
+    Returns:
+        Dict: 操作數、操作鏈數與步驟數
+    """
+    chains = plan_moves(moves)
+    if locality:
+        chains = order_chains(chains, snapshot_directories({directory}))
+    header = {
+        'format': PLAN_FORMAT,
+        'version': PLAN_VERSION,
+        'directory': directory,
+        'created': datetime.now().isoformat(),
+        'operations': sum(1 for chain in chains for step in chain if step[3]),
+        'chains': len(chains),
+        'steps': sum(len(chain) for chain in chains),
+    }
+
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(header, ensure_ascii=False) + "\n")
+        for number, chain in enumerate(chains):
+            for src, dst, index, final in chain:
+                step = [number, _relative(src, directory), _relative(dst, directory), final]
+                f.write(json.dumps(step, ensure_ascii=False) + "\n")
+    os.replace(temp_path, path)
+
+    return {key: header[key] for key in ('operations', 'chains', 'steps')}
+
+
+def read_plan_header(path: str) -> Dict:
+    """讀取計畫檔標頭"""
+    with open(path, 'rb') as f:
+        header = json.loads(f.readline())
+    if header.get('format') != PLAN_FORMAT:
+        raise ValueError(f"不是重命名計畫檔: {path}")
+    if header.get('version') != PLAN_VERSION:
+        raise ValueError(f"不支援的計畫檔版本: {header.get('version')}")
+    return header
+
+
+def load_progress(path: str) -> Optional[Dict]:
+    """讀取計畫的執行進度，尚未執行時返回 None"""
+    try:
+        with open(f"{path}.progress", 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _save_progress(path: str, progress: Dict):
+    progress_path = f"{path}.progress"
+    temp_path = f"{progress_path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(progress, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, progress_path)
+
+
+def execute_plan(path: str, checkpoint_every: int = 1000, no_clobber: bool = True,
+                 max_steps: Optional[int] = None,
+                 observer: Optional[Observer] = None) -> Dict:
+    """
+    逐行執行計畫檔，可中斷後繼續
+
+    上次的進度存在時從記錄的位置繼續。最後一次檢查點之後、中斷之前已執行的步驟
+    會再執行一次：來源已不存在而目標存在時視為已完成。只有單一步驟的操作鏈可以這樣判斷，
+    因此操作鏈的第二個步驟起，每個步驟執行前都先寫入進度，需要判斷的永遠只有一個步驟。
+
+    Args:
+        path: 計畫檔路徑
+        checkpoint_every: 每執行幾個步驟寫入一次進度
+        no_clobber: 不覆蓋已存在的目標（計畫可能在產生很久之後才執行，預設開啟）
+        max_steps: 本次最多執行的步驟數，None 表示執行到結束
+        observer: 每個步驟結束時呼叫 observer(步驟編號, 耗時秒數)
+
+    Returns:
+        Dict: 進度與統計（succeeded、failed、skipped、steps、completed、seconds）
+    """
+    header = read_plan_header(path)
+    directory = header['directory']
+
+    progress = load_progress(path)
+    resumed = progress is not None
+    if progress is None:
+        progress = {
+            'offset': 0,
+            'steps': 0,
+            'succeeded': 0,
+            'failed': 0,
+            'skipped': 0,
+            'chain': None,
+            'chain_failed': False,
+            'chain_position': 0,
+            'temp': None,
+            'completed': False,
+        }
+    if progress['completed']:
+        progress['seconds'] = 0.0
+        progress['total'] = header['steps']
+        return progress
+
+    # 上次中斷前可能已執行、但尚未記錄到進度中的步驟
+    replay = checkpoint_every if resumed else 0
+    executed = 0
+    since_checkpoint = 0
+    start_time = time.perf_counter()
+    sync = DirectorySync('batch', every=None)  # 只在檢查點 fsync
+
+    with open(path, 'rb') as f, \
+            open(f"{path}.errors", 'a', encoding='utf-8') as error_log, \
+            DirectoryHandles([directory]) as handles:
+        header_line = f.readline()
+        if progress['offset']:
+            f.seek(progress['offset'])
+        else:
+            progress['offset'] = len(header_line)
+
+        def fail(src: str, dst: str, message: str):
+            error_log.write(json.dumps({'src': src, 'dst': dst, 'error': message},
+                                       ensure_ascii=False) + "\n")
+
+        def checkpoint():
+            nonlocal since_checkpoint
+            since_checkpoint = 0
+            sync.flush(handles)
+            for message in sync.errors:
+                fail(None, None, f"同步目錄時發生錯誤: {message}")
+            sync.errors.clear()
+            error_log.flush()
+            _save_progress(path, progress)
+
+        if not resumed:
+            # 第一個檢查點之前中斷時，重新執行也要知道計畫已經開始
+            checkpoint()
+
+        try:
+            while max_steps is None or executed < max_steps:
+                line = f.readline()
+                if not line:
+                    progress['completed'] = True
+                    break
+
+                chain, src, dst, final = json.loads(line)
+                src = os.path.join(directory, src)
+                dst = os.path.join(directory, dst)
+
+                if chain != progress['chain']:
+                    progress['chain'] = chain
+                    progress['chain_failed'] = False
+                    progress['chain_position'] = 0
+                    progress['temp'] = None
+
+                start = time.perf_counter()
+                if progress['chain_failed']:
+                    # 同一條鏈上較早的步驟失敗，之後的步驟不能執行
+                    if final:
+                        progress['skipped'] += 1
+                        fail(src, dst, "相依的重命名失敗，已跳過")
+                else:
+                    if progress['chain_position'] > 0 and since_checkpoint > 0:
+                        # 這一步會佔用前一步的來源，執行前記錄進度；本次已執行過步驟，
+                        # 表示上次中斷時尚未執行到這裡，之後的步驟不需重播判斷
+                        checkpoint()
+                        replay = 0
+                    try:
+                        handles.move(src, dst, no_clobber)
+                        error = None
+                    except OSError as e:
+                        error = e
+                        if (replay > 0 and e.errno == errno.ENOENT and
+                                os.path.lexists(dst) and not os.path.lexists(src)):
+                            error = None  # 中斷前已完成
+
+                    if error is None:
+                        sync.touched(handles, src, dst)
+                        if final:
+                            progress['succeeded'] += 1
+                        else:
+                            progress['temp'] = [dst, src]
+                    else:
+                        progress['failed'] += 1
+                        progress['chain_failed'] = True
+                        fail(src, dst, str(error))
+                        temp = progress['temp']
+                        if temp is not None:
+                            # 只有在原位置尚未被佔用時才能把暫存檔移回去
+                            if progress['chain_position'] == 1:
+                                try:
+                                    handles.rename(temp[0], temp[1], no_clobber)
+                                except OSError as restore_error:
+                                    fail(temp[0], temp[1], f"無法還原暫存檔: {restore_error}")
+                            else:
+                                fail(temp[0], temp[1], f"相依的重命名失敗，檔案暫存於 {temp[0]}")
+
+                if observer is not None:
+                    observer(progress['steps'], time.perf_counter() - start)
+
+                progress['chain_position'] += 1
+                progress['offset'] += len(line)
+                progress['steps'] += 1
+                executed += 1
+                since_checkpoint += 1
+                replay -= 1
+                if since_checkpoint >= checkpoint_every:
+                    checkpoint()
+        finally:
+            # 正常結束或被中斷（例如 Ctrl+C）時都記錄確切的進度
+            checkpoint()
+
+    progress['seconds'] = time.perf_counter() - start_time
+    progress['total'] = header['steps']
+    return progress
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+檔案排序方式
+File sort orders
+"""
+
+import os
+import re
+from typing import Callable, Dict, List
+
+_DIGITS_PATTERN = re.compile(r'\d+')
+
+# 排序方式與顯示名稱
+SORT_ORDERS = {
+    'name': '檔名',
+    'natural': '自然排序',
+    'mtime': '修改時間',
+    'size': '檔案大小',
+    'extension': '副檔名',
+}
+
+
+def _encode_number(match) -> str:
+    digits = match.group().lstrip('0') or '0'
+    # 以三位數長度作為前綴，位數多的數字自然排在後面
+    return f"{len(digits):03d}{digits}"
+
+
+def natural_sort_key(name: str) -> str:
+    """
+    產生自然排序鍵，使 file2 排在 file10 之前
+
+    數字串會被改寫成「長度 + 數字」，因此排序鍵仍是單一字串，
+    比較時不需要逐一比對 tuple 元素。
+
+    Args:
+        name: 檔名
+
+    Returns:
+        str: 排序鍵
+    """
+    return _DIGITS_PATTERN.sub(_encode_number, name.casefold())
+
+
+def _name_key(file_info: Dict):
+    return file_info['original_name'].lower()
+
+
+def _natural_key(file_info: Dict):
+    return natural_sort_key(file_info['original_name'])
+
+
+def _mtime_key(file_info: Dict):
+    mtime = file_info.get('mtime_ns')
+    if mtime is None:
+        mtime = file_info['modified'].timestamp()
+    return (mtime, natural_sort_key(file_info['original_name']))
+
+
+def _size_key(file_info: Dict):
+    return (file_info['size'], natural_sort_key(file_info['original_name']))
+
+
+def _extension_key(file_info: Dict):
+    name = file_info['original_name']
+    return (os.path.splitext(name)[1].lower(), natural_sort_key(name))
+
+
+SORT_KEY_FUNCTIONS: Dict[str, Callable[[Dict], object]] = {
+    'name': _name_key,
+    'natural': _natural_key,
+    'mtime': _mtime_key,
+    'size': _size_key,
+    'extension': _extension_key,
+}
+
+
+def sort_files(files_list: List[Dict], order: str = 'name', reverse: bool = False):
+    """
+    就地排序掃描紀錄
+
+    排序鍵只計算一次並存放在紀錄的 sort_key:<排序方式> 欄位中，
+    之後以相同方式重新排序時直接重用。
+
+    Args:
+        files_list: 掃描紀錄列表
+        order: 排序方式（SORT_ORDERS 的鍵）
+        reverse: 是否反向排序
+    """
+    if order not in SORT_KEY_FUNCTIONS:
+        raise ValueError(f"未知的排序方式: {order}")
+
+    key_function = SORT_KEY_FUNCTIONS[order]
+    field = f"sort_key:{order}"
+
+    def cached_key(file_info):
+        key = file_info.get(field)
+        if key is None:
+            key = file_info[field] = key_function(file_info)
+        return key
+
+    files_list.sort(key=cached_key, reverse=reverse)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+狀態快照
+Immutable state snapshots for FileRenamer
+
+掃描結果、過濾條件、過濾後的檔案與規則鏈組成一個不可變的快照。修改時以目前的快照為基礎
+建立新的快照，再一次替換（copy-on-write）：
+
+- 讀取者（預覽、背景的即時預覽）在開始時取得快照，之後只使用它，不需要任何鎖，
+  也不會看到掃描或過濾到一半的狀態
+- 寫入者計算新快照時不持有鎖，只在替換時確認基礎快照仍是目前的快照，
+  期間已被其他寫入者替換時以新的快照重新計算
+- 每個快照有版本號，影響預覽的欄位改變時遞增，以較舊快照計算的結果可依版本號判斷並捨棄；
+  操作歷史與規則快取不影響預覽結果，更新時不遞增版本號
+
+快照中的檔案紀錄（dict）在掃描後不再修改，只會加上可重複計算的快取欄位
+（副檔名、排序鍵），不同快照之間可以共用。歷史記錄與規則快取同樣不再修改，
+變更時建立新的記錄。
+"""
+
+from typing import Optional, Tuple
+
+
+class RenameState:
+    """FileRenamer 的不可變狀態"""
+
+    __slots__ = ('generation', 'files', 'directory_names', 'scan_generation', 'scan_mtime_ns',
+                 'filters', 'include_paths', 'exclude_paths', 'filtered', 'files_generation',
+                 'rules', 'history', 'rule_cache')
+
+    def __init__(self, generation: int = 0, files: Tuple = (),
+                 directory_names: frozenset = frozenset(), scan_generation: int = 0,
+                 scan_mtime_ns: Optional[int] = None, filters: Tuple = (),
+                 include_paths: frozenset = frozenset(), exclude_paths: frozenset = frozenset(),
+                 filtered: Tuple = (), files_generation: int = 0, rules: Tuple = (),
+                 history: Tuple = (), rule_cache: Optional[Tuple] = None):
+        """
+        Args:
+            generation: 快照版本，影響預覽的欄位改變時遞增
+            files: 掃描結果（已排序）
+            directory_names: 掃描時目錄中的所有名稱（含子目錄）
+            scan_generation: 掃描版本，每次掃描遞增
+            scan_mtime_ns: 掃描前的目錄 mtime，用來判斷預覽是否過期
+            filters: 檔名過濾條件
+            include_paths, exclude_paths: 依完整路徑只處理或排除的檔案
+            filtered: 過濾後的檔案
+            files_generation: 過濾結果版本，用來判斷規則快取是否仍有效
+            rules: 規則鏈
+            history: 操作歷史
+            rule_cache: (files_generation, 規則簽章, 各規則套用後的 (主檔名, 副檔名) 欄位,
+                開頭不受檔案位置影響的規則數)
+        """
+        set_field = object.__setattr__
+        set_field(self, 'generation', generation)
+        set_field(self, 'files', files)
+        set_field(self, 'directory_names', directory_names)
+        set_field(self, 'scan_generation', scan_generation)
+        set_field(self, 'scan_mtime_ns', scan_mtime_ns)
+        set_field(self, 'filters', filters)
+        set_field(self, 'include_paths', include_paths)
+        set_field(self, 'exclude_paths', exclude_paths)
+        set_field(self, 'filtered', filtered)
+        set_field(self, 'files_generation', files_generation)
+        set_field(self, 'rules', rules)
+        set_field(self, 'history', history)
+        set_field(self, 'rule_cache', rule_cache)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("RenameState 是不可變的，請以 replace() 建立新的快照")
+
+    def replace(self, **changes) -> 'RenameState':
+        """返回修改了指定欄位的新快照"""
+        fields = {name: getattr(self, name) for name in self.__slots__}
+        fields.update(changes)
+        return RenameState(**fields)
+
+    def __repr__(self):
+        return (f"RenameState(generation={self.generation}, files={len(self.files)}, "
+                f"filtered={len(self.filtered)}, rules={len(self.rules)}, "
+                f"history={len(self.history)})")
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+I/O 節流
+Rate limiting and adaptive concurrency for rename execution
+
+在共用的 NAS 上大量重命名時，限制每秒操作數（令牌桶），並依觀察到的重命名延遲
+自動調整同時進行的操作數（延遲百分位數超過目標時減半，低於目標時加一）。
+"""
+
+import math
+import time
+import threading
+from typing import Callable, Dict, List, Optional
+
+
+class TokenBucket:
+    """
+    令牌桶：平均每秒 rate 個操作，最多累積 burst 個
+
+    令牌不足時預約下一個令牌並在鎖外等待，多個執行緒依取得順序排隊。
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        if rate <= 0:
+            raise ValueError("每秒操作數必須大於 0")
+        self.rate = float(rate)
+        # 預設最多累積 0.1 秒的令牌，閒置後不會瞬間湧入大量操作
+        self.capacity = float(burst) if burst is not None else max(1.0, self.rate / 10)
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = self.capacity
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """
+        取得一個令牌
+
+        Returns:
+            float: 等待的秒數
+        """
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+
+class AdaptiveConcurrency:
+    """
+    依延遲目標調整同時進行的操作數
+
+    每累積 window 個延遲樣本計算一次百分位數：超過目標時將上限乘以 decrease，
+    否則加一（AIMD）。從 min_limit 開始逐步增加。
+    """
+
+    def __init__(self, target_latency: float, percentile: float = 0.95,
+                 min_limit: int = 1, max_limit: int = 32, window: int = 50,
+                 decrease: float = 0.5):
+        """
+        Args:
+            target_latency: 延遲目標（秒）
+            percentile: 與目標比較的百分位數
+            min_limit, max_limit: 同時操作數的範圍
+            window: 每次調整所需的樣本數
+            decrease: 超過目標時上限的乘數
+        """
+        self.target_latency = target_latency
+        self.percentile = percentile
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.window = window
+        self.decrease = decrease
+        self.limit = min_limit
+        self.in_flight = 0
+        self.last_latency: Optional[float] = None
+        self.limits: List[int] = [min_limit]  # 每次調整後的上限
+        self._samples: List[float] = []
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """等待直到同時進行的操作數低於上限"""
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, seconds: float):
+        """操作結束，記錄其延遲"""
+        with self._condition:
+            self.in_flight -= 1
+            self._samples.append(seconds)
+            if len(self._samples) >= self.window:
+                self._adjust()
+            self._condition.notify_all()
+
+    def _adjust(self):
+        samples = sorted(self._samples)
+        self._samples = []
+        latency = samples[max(0, math.ceil(self.percentile * len(samples)) - 1)]
+        self.last_latency = latency
+
+        if latency > self.target_latency:
+            limit = max(self.min_limit, int(self.limit * self.decrease))
+        else:
+            limit = min(self.max_limit, self.limit + 1)
+        if limit != self.limit:
+            self.limit = limit
+            self.limits.append(limit)
+
+
+class Throttle:
+    """
+    重命名執行時的節流：令牌桶與自適應同時操作數可分別或同時使用
+
+    每個重命名步驟前呼叫 acquire()，結束後以實際耗時呼叫 release()。
+    """
+
+    def __init__(self, rate: Optional[float] = None, burst: Optional[float] = None,
+                 controller: Optional[AdaptiveConcurrency] = None):
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.controller = controller
+        self.operations = 0
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def max_workers(self) -> int:
+        """執行緒池需要的大小（沒有自適應控制時為 1）"""
+        return self.controller.max_limit if self.controller is not None else 1
+
+    def acquire(self):
+        waited = 0.0
+        if self.controller is not None:
+            start = time.perf_counter()
+            self.controller.acquire()
+            waited = time.perf_counter() - start
+        if self.bucket is not None:
+            waited += self.bucket.acquire()
+        with self._lock:
+            self.operations += 1
+            self.waited += waited
+
+    def release(self, seconds: float):
+        if self.controller is not None:
+            self.controller.release(seconds)
+
+    def stats(self) -> Dict:
+        """操作數、節流等待的總秒數，以及自適應控制的目前上限與最近一次的延遲百分位數"""
+        stats = {'operations': self.operations, 'waited_seconds': self.waited}
+        if self.controller is not None:
+            stats['limit'] = self.controller.limit
+            stats['latency'] = self.controller.last_latency
+            stats['adjustments'] = len(self.controller.limits) - 1
+        return stats
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+跨檔案系統移動
+Cross-device moves with in-kernel data transfer
+
+目標位於另一個檔案系統時 os.rename 會失敗（EXDEV），只能複製後刪除來源：
+1. 在目標目錄建立暫存檔，以 copy_file_range（不支援時 sendfile，最後才是 read/write）
+   在核心中複製資料，大檔案分段由多個執行緒同時複製
+2. 複製權限、時間戳記、擁有者與延伸屬性，fsync 後驗證大小與來源在複製期間未被修改
+3. 暫存檔改名為目標（不覆蓋已存在的檔案），fsync 目標目錄後才刪除來源
+任何一步失敗都會移除暫存檔，來源保持不變。
+"""
+
+import os
+import stat
+import errno
+import shutil
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+try:
+    from .hashing import hash_file
+except ImportError:  # 以 src 目錄直接匯入時（test.py、main.py）
+    from hashing import hash_file
+
+LARGE_FILE_SIZE = 64 * 1024 * 1024  # 超過此大小時分段平行複製
+CHUNK_SIZE = 16 * 1024 * 1024
+TRANSFER_WORKERS = 4
+
+# 這些錯誤表示此組合不支援該系統呼叫，改用下一種方式
+_UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EINVAL,
+                errno.EBADF, errno.EPERM}
+
+
+def _copy_range(src_fd: int, dst_fd: int, offset: int, length: int):
+    """以 copy_file_range 複製指定範圍，不支援時以 pread/pwrite 複製"""
+    end = offset + length
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while offset < end:
+                copied = os.copy_file_range(src_fd, dst_fd, end - offset, offset, offset)
+                if copied == 0:
+                    break  # 來源在複製期間變短，由驗證步驟處理
+                offset += copied
+            return
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED:
+                raise
+
+    while offset < end:
+        data = os.pread(src_fd, min(CHUNK_SIZE, end - offset), offset)
+        if not data:
+            break
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(dst_fd, view, offset)
+            offset += written
+            view = view[written:]
+
+
+def _copy_sequential(src_fd: int, dst_fd: int, size: int):
+    """整個檔案依序複製：copy_file_range → sendfile → read/write"""
+    if hasattr(os, 'copy_file_range'):
+        try:
+            offset = 0
+            while offset < size:
+                copied = os.copy_file_range(src_fd, dst_fd, size - offset)
+                if copied == 0:
+                    break
+                offset += copied
+            return
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED:
+                raise
+            os.lseek(src_fd, 0, os.SEEK_SET)
+            os.lseek(dst_fd, 0, os.SEEK_SET)
+            os.ftruncate(dst_fd, 0)
+
+    if hasattr(os, 'sendfile'):
+        try:
+            offset = 0
+            while offset < size:
+                sent = os.sendfile(dst_fd, src_fd, offset, size - offset)
+                if sent == 0:
+                    break
+                offset += sent
+            return
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED:
+                raise
+            os.lseek(dst_fd, 0, os.SEEK_SET)
+            os.ftruncate(dst_fd, 0)
+
+    _copy_range(src_fd, dst_fd, 0, size)
+
+
+def copy_file_data(src_fd: int, dst_fd: int, size: int, workers: int = TRANSFER_WORKERS):
+    """
+    複製檔案內容
+
+    大檔案先設定目標大小，再以多個執行緒各自複製不重疊的範圍（copy_file_range 與
+    pwrite 都指定位移，不共用檔案位置）。
+
+    Args:
+        src_fd, dst_fd: 已開啟的來源與目標檔案
+        size: 來源大小
+        workers: 大檔案平行複製的執行緒數
+    """
+    if size < LARGE_FILE_SIZE or workers <= 1:
+        _copy_sequential(src_fd, dst_fd, size)
+        return
+
+    os.ftruncate(dst_fd, size)
+    ranges = [(offset, min(CHUNK_SIZE, size - offset)) for offset in range(0, size, CHUNK_SIZE)]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in [executor.submit(_copy_range, src_fd, dst_fd, offset, length)
+                       for offset, length in ranges]:
+            future.result()
+
+
+def _copy_metadata(src: str, temp: str, src_stat: os.stat_result):
+    """複製權限、時間戳記、延伸屬性與擁有者（非 root 時擁有者可能無法保留）"""
+    shutil.copystat(src, temp)
+    if hasattr(os, 'chown'):
+        try:
+            os.chown(temp, src_stat.st_uid, src_stat.st_gid)
+        except PermissionError:
+            pass
+
+
+def _fsync_directory(directory: str):
+    if not hasattr(os, 'O_DIRECTORY'):
+        return  # Windows 無法開啟目錄
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def move_across_devices(src: str, dst: str, no_clobber: bool = True,
+                        workers: int = TRANSFER_WORKERS, verify_hash: bool = False):
+    """
+    將檔案移到另一個檔案系統
+
+    Args:
+        src, dst: 完整路徑
+        no_clobber: 目標已存在時失敗，而不是覆蓋
+        workers: 大檔案平行複製的執行緒數
+        verify_hash: 刪除來源前另外比對兩者的內容雜湊
+
+    Raises:
+        FileExistsError: no_clobber 且目標已存在
+        OSError: 複製、驗證或刪除來源失敗（來源保持不變）
+    """
+    try:
+        # executor 也匯入本模組，因此在使用時才匯入
+        from .executor import rename_noreplace
+    except ImportError:
+        from executor import rename_noreplace
+
+    src_stat = os.lstat(src)
+    if no_clobber and os.path.lexists(dst):
+        raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), dst)
+
+    directory, name = os.path.split(dst)
+    temp = os.path.join(directory, f".{name}.moving-{uuid.uuid4().hex[:8]}")
+
+    try:
+        if stat.S_ISLNK(src_stat.st_mode):
+            os.symlink(os.readlink(src), temp)
+        else:
+            with open(src, 'rb') as src_file:
+                fd = os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                try:
+                    copy_file_data(src_file.fileno(), fd, src_stat.st_size, workers)
+                    os.fsync(fd)
+                    copied_size = os.fstat(fd).st_size
+                finally:
+                    os.close(fd)
+            _copy_metadata(src, temp, src_stat)
+
+            # 驗證：大小相同，且來源在複製期間沒有被修改
+            current = os.lstat(src)
+            if (copied_size != src_stat.st_size or current.st_size != src_stat.st_size or
+                    current.st_mtime_ns != src_stat.st_mtime_ns):
+                raise OSError(errno.EIO, "複製後驗證失敗（來源在複製期間被修改）", src, None, dst)
+            if verify_hash and hash_file(src)[0] != hash_file(temp)[0]:
+                raise OSError(errno.EIO, "複製後內容雜湊不一致", src, None, dst)
+
+        if no_clobber:
+            rename_noreplace(temp, dst)
+        else:
+            os.rename(temp, dst)
+    except BaseException:
+        try:
+            os.unlink(temp)
+        except OSError:
+            pass
+        raise
+
+    try:
+        # 目標的目錄項目寫入磁碟後才刪除來源，斷電時至少有一份完整的檔案
+        _fsync_directory(directory)
+        os.unlink(src)
+    except OSError:
+        # 無法刪除來源時移除複本，避免同一個檔案同時存在兩處
+        os.unlink(dst)
+        raise
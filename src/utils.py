@@ -7,40 +7,35 @@ Utility Functions
 
 import os
 import re
+import gc
 import json
+import time
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 
-def is_valid_filename(filename: str) -> bool:
+try:
+    from .config import WINDOWS_RESERVED_NAMES, INVALID_FILENAME_CHARS
+    from .validation import get_validator
+except ImportError:  # 以 src 目錄直接匯入時（test.py、main.py）
+    from config import WINDOWS_RESERVED_NAMES, INVALID_FILENAME_CHARS
+    from validation import get_validator
+
+_SANITIZE_TABLE = str.maketrans({char: '_' for char in INVALID_FILENAME_CHARS})
+_RESERVED_NAMES = frozenset(WINDOWS_RESERVED_NAMES)
+
+def is_valid_filename(filename: str, profile: str = 'windows') -> bool:
     """
     檢查檔名是否有效
     
     Args:
         filename: 檔案名稱
+        profile: 檔名規則（windows, posix, smb）
         
     Returns:
         bool: 檔名是否有效
     """
-    from .config import WINDOWS_RESERVED_NAMES, INVALID_FILENAME_CHARS
-    
-    if not filename or filename in ['', '.', '..']:
-        return False
-    
-    # 檢查無效字元
-    for char in INVALID_FILENAME_CHARS:
-        if char in filename:
-            return False
-    
-    # 檢查保留名稱
-    name_without_ext = os.path.splitext(filename)[0].upper()
-    if name_without_ext in WINDOWS_RESERVED_NAMES:
-        return False
-    
-    # 檢查長度（Windows 限制）
-    if len(filename) > 255:
-        return False
-    
-    return True
+    return get_validator(profile).is_valid(filename)
 
 def format_file_size(size_bytes: int) -> str:
     """
@@ -78,19 +73,15 @@ def sanitize_filename(filename: str) -> str:
     Returns:
         str: 清理後的檔名
     """
-    from .config import INVALID_FILENAME_CHARS
-    
     # 替換無效字元
-    for char in INVALID_FILENAME_CHARS:
-        filename = filename.replace(char, '_')
+    filename = filename.translate(_SANITIZE_TABLE)
     
     # 移除前後空白
     filename = filename.strip()
     
     # 確保不是保留名稱
     name, ext = os.path.splitext(filename)
-    from .config import WINDOWS_RESERVED_NAMES
-    if name.upper() in WINDOWS_RESERVED_NAMES:
+    if name.upper() in _RESERVED_NAMES:
         filename = f"_{filename}"
     
     return filename
@@ -118,13 +109,88 @@ def parse_file_filters(filter_string: str) -> List[str]:
     
     return filters
 
-def backup_file(filepath: str, backup_dir: str = None) -> Optional[str]:
+BACKUP_METHODS = ['auto', 'hardlink', 'reflink', 'copy']
+
+_FICLONE = 0x40049409  # Linux ioctl: 讓目標與來源共用資料區塊（btrfs、XFS 等）
+
+
+def _reflink(src: str, dst: str) -> Tuple[str, int]:
+    """
+    以 FICLONE 或 copy_file_range 建立副本
+
+    Returns:
+        Tuple[str, int]: (reflink 或 copy_file_range, 實際複製的位元組數)
+    """
+    import fcntl  # 僅限 POSIX
+
+    with open(src, 'rb') as fsrc, open(dst, 'xb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+            return 'reflink', 0
+        except OSError:
+            pass
+
+        if not hasattr(os, 'copy_file_range'):
+            raise OSError("不支援 copy_file_range")
+
+        # copy_file_range 在核心內複製，支援的檔案系統也會共用資料區塊
+        size = os.fstat(fsrc.fileno()).st_size
+        copied = 0
+        while copied < size:
+            count = os.copy_file_range(fsrc.fileno(), fdst.fileno(), size - copied)
+            if count == 0:
+                break
+            copied += count
+        return 'copy_file_range', copied
+
+
+def _backup_with_fallback(src: str, dst: str, method: str = 'auto'):
+    """
+    依序嘗試硬連結、reflink、完整複製
+
+    Returns:
+        Tuple[str, int]: (使用的方式, 實際複製的位元組數)
+    """
+    import shutil
+
+    if method in ('auto', 'hardlink'):
+        try:
+            os.link(src, dst)
+            return 'hardlink', 0
+        except FileExistsError:
+            raise
+        except OSError:  # 跨檔案系統或不支援硬連結
+            if method == 'hardlink':
+                raise
+
+    if method in ('auto', 'reflink'):
+        try:
+            used, copied = _reflink(src, dst)
+            shutil.copystat(src, dst)
+            return used, copied
+        except FileExistsError:
+            raise
+        except (OSError, ImportError):
+            if os.path.lexists(dst):
+                os.unlink(dst)
+            if method == 'reflink':
+                raise
+
+    shutil.copy2(src, dst)
+    return 'copy', os.path.getsize(dst)
+
+
+def backup_file(filepath: str, backup_dir: str = None, method: str = 'auto') -> Optional[str]:
     """
     備份檔案
     
+    預設先嘗試硬連結（不複製任何資料），再嘗試 reflink，最後才完整複製。
+    硬連結與原檔共用內容，適合只重命名、不修改內容的情況。
+    
     Args:
         filepath: 要備份的檔案路徑
         backup_dir: 備份目錄，如果為 None 則在同目錄下創建備份
+        method: auto, hardlink, reflink 或 copy
         
     Returns:
         Optional[str]: 備份檔案路徑，失敗時返回 None
@@ -146,9 +212,7 @@ def backup_file(filepath: str, backup_dir: str = None) -> Optional[str]:
         backup_filename = f"{name}_backup_{timestamp}{ext}"
         backup_path = os.path.join(backup_dir, backup_filename)
         
-        # 複製檔案
-        import shutil
-        shutil.copy2(filepath, backup_path)
+        _backup_with_fallback(filepath, backup_path, method)
         
         return backup_path
         
@@ -156,6 +220,79 @@ def backup_file(filepath: str, backup_dir: str = None) -> Optional[str]:
         print(f"備份檔案時發生錯誤: {e}")
         return None
 
+def backup_files(filepaths: List[str], backup_dir: str, method: str = 'auto',
+                 max_workers: int = 4) -> Tuple[Dict[str, Optional[str]], Dict]:
+    """
+    以執行緒池將多個檔案以原檔名備份到同一個目錄（重命名前的快照）
+    
+    Args:
+        filepaths: 要備份的檔案路徑
+        backup_dir: 快照目錄，不存在時會建立
+        method: auto, hardlink, reflink 或 copy
+        max_workers: 執行緒數量
+        
+    Returns:
+        Tuple[Dict[str, Optional[str]], Dict]: (來源對應備份路徑，失敗為 None, 統計資料)
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    
+    start = time.perf_counter()
+    os.makedirs(backup_dir, exist_ok=True)
+    
+    def backup(src):
+        dst = os.path.join(backup_dir, os.path.basename(src))
+        try:
+            used, copied = _backup_with_fallback(src, dst, method)
+            return dst, used, copied, os.path.getsize(src), None
+        except Exception as e:
+            return None, None, 0, 0, f"{os.path.basename(src)}: {e}"
+    
+    if max_workers > 1 and len(filepaths) > 1:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(backup, filepaths))
+    else:
+        results = [backup(src) for src in filepaths]
+    
+    backups = {}
+    stats = {
+        'backup_dir': backup_dir,
+        'files': len(filepaths),
+        'backed_up': 0,
+        'methods': {},
+        'bytes_total': 0,
+        'bytes_copied': 0,
+        'errors': []
+    }
+    for src, (dst, used, copied, size, error) in zip(filepaths, results):
+        backups[src] = dst
+        if error is not None:
+            stats['errors'].append(error)
+            continue
+        stats['backed_up'] += 1
+        stats['methods'][used] = stats['methods'].get(used, 0) + 1
+        stats['bytes_total'] += size
+        stats['bytes_copied'] += copied
+    stats['seconds'] = time.perf_counter() - start
+    
+    return backups, stats
+
+def format_backup_stats(stats: Dict) -> str:
+    """
+    產生備份結果摘要
+    
+    Args:
+        stats: backup_files 返回的統計資料
+        
+    Returns:
+        str: 如 "已備份 120/120 個檔案（hardlink 120），實際複製 0 B / 共 4.2 GB"
+    """
+    methods = ", ".join(f"{method} {count}" for method, count in sorted(stats['methods'].items()))
+    summary = (f"已備份 {stats['backed_up']}/{stats['files']} 個檔案"
+               f"{f'（{methods}）' if methods else ''}，"
+               f"實際複製 {format_file_size(stats['bytes_copied'])} / "
+               f"共 {format_file_size(stats['bytes_total'])}")
+    return summary
+
 def load_json_file(filepath: str, default: Dict = None) -> Dict:
     """
     載入 JSON 檔案
@@ -250,38 +387,94 @@ def get_file_info(filepath: str) -> Optional[Dict]:
         print(f"獲取檔案資訊時發生錯誤: {e}")
         return None
 
-def create_unique_filename(filepath: str) -> str:
+class UniqueNameAllocator:
+    """
+    以名稱集合分配不重複的檔名
+    
+    目錄只掃描一次，之後每個基本檔名記住下一個可用的編號，
+    大量同名檔案去重時不需要反覆呼叫 os.path.exists。
+    """
+    
+    def __init__(self, names=()):
+        self.used = set(names)
+        self._next_counter: Dict[Tuple[str, str], int] = {}
+    
+    @classmethod
+    def from_directory(cls, directory: str) -> 'UniqueNameAllocator':
+        """以目錄中現有的名稱（含子目錄）建立分配器"""
+        try:
+            with os.scandir(directory) as entries:
+                return cls(entry.name for entry in entries)
+        except OSError:
+            return cls()
+    
+    def reserve(self, name: str) -> bool:
+        """標記名稱已使用，返回該名稱原本是否可用"""
+        if name in self.used:
+            return False
+        self.used.add(name)
+        return True
+    
+    def release(self, name: str):
+        """釋放名稱（例如檔案已被移走）"""
+        self.used.discard(name)
+    
+    def allocate(self, name: str) -> str:
+        """
+        分配不重複的檔名，重複時加上 _1、_2…
+        
+        Args:
+            name: 想要的檔名
+            
+        Returns:
+            str: 已標記為使用中的唯一檔名
+        """
+        if self.reserve(name):
+            return name
+        
+        base, ext = os.path.splitext(name)
+        key = (base, ext)
+        counter = self._next_counter.get(key, 1)
+        while f"{base}_{counter}{ext}" in self.used:
+            counter += 1
+        
+        unique_name = f"{base}_{counter}{ext}"
+        self.used.add(unique_name)
+        self._next_counter[key] = counter + 1
+        return unique_name
+
+def create_unique_filename(filepath: str, allocator: UniqueNameAllocator = None) -> str:
     """
     創建唯一檔名（如果檔案已存在）
     
     Args:
         filepath: 原始檔案路徑
+        allocator: 同一目錄重複使用的分配器，None 時掃描目錄建立
         
     Returns:
         str: 唯一檔案路徑
     """
-    if not os.path.exists(filepath):
-        return filepath
-    
     directory = os.path.dirname(filepath)
-    filename = os.path.basename(filepath)
-    name, ext = os.path.splitext(filename)
+    if allocator is None:
+        allocator = UniqueNameAllocator.from_directory(directory)
     
-    counter = 1
-    while True:
-        new_filename = f"{name}_{counter}{ext}"
-        new_filepath = os.path.join(directory, new_filename)
-        
-        if not os.path.exists(new_filepath):
-            return new_filepath
-        
-        counter += 1
-        
-        # 防止無限迴圈
-        if counter > 9999:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            new_filename = f"{name}_{timestamp}{ext}"
-            return os.path.join(directory, new_filename)
+    return os.path.join(directory, allocator.allocate(os.path.basename(filepath)))
+
+@contextmanager
+def gc_paused():
+    """
+    暫停循環垃圾回收
+    
+    預覽等迴圈會建立數十萬個不含循環參照的 dict 與 tuple，期間觸發的完整回收
+    會反覆走訪所有存活物件；暫停後引用計數仍會正常釋放物件。
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
 
 def log_operation(message: str, level: str = "INFO"):
     """
@@ -294,7 +487,8 @@ def log_operation(message: str, level: str = "INFO"):
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     print(f"[{timestamp}] [{level}] {message}")
 
-def get_available_filename(directory: str, base_name: str, extension: str) -> str:
+def get_available_filename(directory: str, base_name: str, extension: str,
+                           allocator: UniqueNameAllocator = None) -> str:
     """
     在指定目錄中獲取可用的檔名
     
@@ -302,30 +496,9 @@ def get_available_filename(directory: str, base_name: str, extension: str) -> st
         directory: 目錄路徑
         base_name: 基本檔名
         extension: 副檔名
+        allocator: 同一目錄重複使用的分配器，None 時掃描目錄建立
         
     Returns:
         str: 可用的完整檔案路徑
     """
-    filename = f"{base_name}{extension}"
-    filepath = os.path.join(directory, filename)
-    
-    if not os.path.exists(filepath):
-        return filepath
-    
-    counter = 1
-    while True:
-        filename = f"{base_name}_{counter}{extension}"
-        filepath = os.path.join(directory, filename)
-        
-        if not os.path.exists(filepath):
-            return filepath
-        
-        counter += 1
-        
-        if counter > 9999:
-            break
-    
-    # 使用時間戳作為後備方案
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"{base_name}_{timestamp}{extension}"
-    return os.path.join(directory, filename)
\ No newline at end of file
+    return create_unique_filename(os.path.join(directory, f"{base_name}{extension}"), allocator)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+檔名驗證
+Filename validation profiles
+"""
+
+import re
+from typing import Dict, Iterable, List, Optional
+
+try:
+    from .config import WINDOWS_RESERVED_NAMES, INVALID_FILENAME_CHARS
+except ImportError:  # 以 src 目錄直接匯入時（test.py、main.py）
+    from config import WINDOWS_RESERVED_NAMES, INVALID_FILENAME_CHARS
+
+# 控制字元（0x00-0x1F）在 Windows 與 SMB 上都不能出現在檔名中
+_CONTROL_CHARS = ''.join(chr(i) for i in range(32))
+
+# 各檔案系統的規則
+# invalid_chars: 不可出現的字元; reserved: 不分大小寫的保留名稱（第一個 . 之前的部分）
+# max_chars / max_bytes: 長度上限（字元數 / UTF-8 位元組數），None 表示不限制
+# trailing_dot_space: 是否禁止以 . 或空白結尾
+FILENAME_PROFILES: Dict[str, Dict] = {
+    'windows': {
+        'label': 'Windows',
+        'invalid_chars': ''.join(INVALID_FILENAME_CHARS) + _CONTROL_CHARS,
+        'reserved': frozenset(WINDOWS_RESERVED_NAMES),
+        'max_chars': 255,
+        'max_bytes': None,
+        'trailing_dot_space': True,
+    },
+    'posix': {
+        'label': 'POSIX',
+        'invalid_chars': '/\0',
+        'reserved': frozenset(),
+        'max_chars': None,
+        'max_bytes': 255,
+        'trailing_dot_space': False,
+    },
+    'smb': {
+        # Samba 分享：用戶端是 Windows，底層通常是 Linux 檔案系統
+        'label': 'SMB 分享',
+        'invalid_chars': ''.join(INVALID_FILENAME_CHARS) + _CONTROL_CHARS,
+        'reserved': frozenset(WINDOWS_RESERVED_NAMES),
+        'max_chars': 255,
+        'max_bytes': 255,
+        'trailing_dot_space': True,
+    },
+}
+
+
+class FilenameValidator:
+    """
+    預先編譯規則的檔名驗證器
+
+    無效字元以單一正規表示式字元集合檢查，保留名稱以 frozenset 查詢，
+    建立一次後可重複用於整批預覽結果。
+    """
+
+    def __init__(self, profile: str = 'windows', max_bytes: Optional[int] = None):
+        if profile not in FILENAME_PROFILES:
+            raise ValueError(f"未知的檔名規則: {profile}")
+
+        rules = FILENAME_PROFILES[profile]
+        self.profile = profile
+        self.reserved = rules['reserved']
+        self.max_chars = rules['max_chars']
+        self.max_bytes = max_bytes if max_bytes is not None else rules['max_bytes']
+        self.trailing_dot_space = rules['trailing_dot_space']
+        self._invalid_pattern = re.compile(f"[{re.escape(rules['invalid_chars'])}]")
+
+    def check(self, filename: str) -> Optional[str]:
+        """
+        驗證單一檔名
+
+        Args:
+            filename: 檔案名稱
+
+        Returns:
+            Optional[str]: 無效的原因，有效時為 None
+        """
+        if not filename or filename == '.' or filename == '..':
+            return "檔名為空"
+
+        if self._invalid_pattern.search(filename):
+            return "檔名包含無效字元"
+
+        if self.reserved:
+            stem = filename.partition('.')[0].rstrip(' ')
+            if len(stem) <= 4 and stem.upper() in self.reserved:
+                return "檔名為系統保留名稱"
+
+        if self.trailing_dot_space and filename[-1] in '. ':
+            return "檔名不可以句點或空白結尾"
+
+        if self.max_chars is not None and len(filename) > self.max_chars:
+            return "檔名過長"
+
+        # 每個字元最多 4 個位元組，短檔名不需要編碼
+        if self.max_bytes is not None and len(filename) * 4 > self.max_bytes:
+            if len(filename.encode('utf-8', 'surrogateescape')) > self.max_bytes:
+                return "檔名過長"
+
+        return None
+
+    def is_valid(self, filename: str) -> bool:
+        """檢查檔名是否有效"""
+        return self.check(filename) is None
+
+    def check_many(self, filenames: Iterable[str]) -> List[Optional[str]]:
+        """
+        驗證整批檔名
+
+        Args:
+            filenames: 檔名列表（例如預覽結果的新檔名欄）
+
+        Returns:
+            List[Optional[str]]: 與輸入對應的無效原因，有效時為 None
+        """
+        check = self.check
+        return [check(filename) for filename in filenames]
+
+
+_validators: Dict[tuple, FilenameValidator] = {}
+
+
+def get_validator(profile: str = 'windows', max_bytes: Optional[int] = None) -> FilenameValidator:
+    """取得共用的驗證器（每種設定只編譯一次）"""
+    key = (profile, max_bytes)
+    validator = _validators.get(key)
+    if validator is None:
+        validator = _validators[key] = FilenameValidator(profile, max_bytes)
+    return validator
@@ -9,12 +9,25 @@ import os
 import sys
 import tempfile
 import shutil
+import asyncio
+import threading
 from datetime import datetime
 
 # 添加源碼路徑
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
 from file_renamer import FileRenamer, RenameRule
+from hashing import HashCache
+from metadata import compile_template
+from metrics import RenameMetrics
+from executor import DirectorySync, order_chains, plan_moves, run_chain
+from validation import FilenameValidator
+from plan_file import execute_plan, write_plan
+from daemon import INVALID_PARAMS, DaemonClient, DaemonError, RenameDaemon
+from async_api import AsyncFileRenamer
+from throttle import AdaptiveConcurrency, TokenBucket
+from transfer import move_across_devices
+from instrumentation import OsCallCounter
 
 def create_test_files(test_dir, file_count=5):
     """創建測試檔案"""
@@ -89,7 +102,52 @@ def test_file_renamer():
             print("   復原成功!")
         else:
             print("   復原失敗!")
-        
+
+        # 循環重命名 a→b→c→a 後復原，內容應回到原檔名
+        cycle_dir = os.path.join(test_dir, "cycle")
+        os.mkdir(cycle_dir)
+        contents = {"a.txt": "A", "b.txt": "B", "c.txt": "C"}
+        for name, content in contents.items():
+            with open(os.path.join(cycle_dir, name), 'w', encoding='utf-8') as f:
+                f.write(content)
+
+        def read_contents():
+            result = {}
+            for name in sorted(os.listdir(cycle_dir)):
+                with open(os.path.join(cycle_dir, name), 'r', encoding='utf-8') as f:
+                    result[name] = f.read()
+            return result
+
+        def manual_preview(pairs):
+            return [{'original_name': old, 'new_name': new,
+                     'full_path': os.path.join(cycle_dir, old), 'conflict': False,
+                     'conflict_reason': "", 'size': 1, 'modified': datetime.now()}
+                    for old, new in pairs]
+
+        cycle_renamer = FileRenamer()
+        cycle_renamer.set_source_directory(cycle_dir)
+        cycle_renamer.execute_rename(manual_preview(
+            [("a.txt", "b.txt"), ("b.txt", "c.txt"), ("c.txt", "a.txt")]))
+        print(f"   循環重命名後: {read_contents() == {'b.txt': 'A', 'c.txt': 'B', 'a.txt': 'C'}}")
+        success_count, error_count, errors = cycle_renamer.undo_operation(len(cycle_renamer.history) - 1)
+        print(f"   循環復原 - 成功: {success_count}, 內容正確: {read_contents() == contents}")
+
+        # 部分復原失敗：失敗的操作保留在歷史中，修正後可重試
+        history_count = len(cycle_renamer.history)
+        cycle_renamer.execute_rename(manual_preview([("a.txt", "x.txt"), ("b.txt", "y.txt")]))
+        with open(os.path.join(cycle_dir, "b.txt"), 'w', encoding='utf-8') as f:
+            f.write("佔用")  # 佔用 y.txt 復原的目標
+        success_count, error_count, errors = cycle_renamer.undo_operation(len(cycle_renamer.history) - 1)
+        remaining = cycle_renamer.history[-1]['operations']
+        print(f"   部分復原 - 成功: {success_count}, 失敗: {error_count}, "
+              f"保留失敗的操作: {[op['new_name'] for op in remaining] == ['y.txt']}")
+        os.remove(os.path.join(cycle_dir, "b.txt"))
+        success_count, error_count, errors = cycle_renamer.undo_operation(len(cycle_renamer.history) - 1)
+        print(f"   重試 - 成功: {success_count}, 歷史已移除: {len(cycle_renamer.history) == history_count}, "
+              f"內容正確: {read_contents() == contents}")
+        shutil.rmtree(cycle_dir)
+        renamer.refresh_files_list()
+
         # 測試序列編號規則
         print("\n6. 測試序列編號規則...")
         renamer.clear_rename_rules()
@@ -138,6 +196,473 @@ def test_file_renamer():
         for result in preview[:3]:
             print(f"     {result['original_name']} → {result['new_name']}")
         
+        # 測試命名範本
+        print("\n9. 測試命名範本...")
+        renamer.clear_rename_rules()
+        
+        rule5 = RenameRule()
+        rule5.rule_type = "template"
+        rule5.template = "{mtime:%Y%m%d}_{size}_{seq}"
+        renamer.add_rename_rule(rule5)
+        
+        preview = renamer.preview_rename()
+        print("   命名範本預覽:")
+        for result in preview[:3]:
+            print(f"     {result['original_name']} → {result['new_name']}")
+        
+        # 修改範本後再預覽：規則欄位快取失效，檔案不變，應直接使用中繼資料快取
+        rule5.template = "{ctime:%Y%m%d}_{name}"
+        renamer.preview_rename()
+        hits, misses = renamer.metadata_cache.hits, renamer.metadata_cache.misses
+        rule5.template = "{ctime:%Y}_{name}"
+        renamer.preview_rename()
+        new_hits = renamer.metadata_cache.hits - hits
+        new_misses = renamer.metadata_cache.misses - misses
+        print(f"   中繼資料快取: 命中 {new_hits} 次, 重新讀取 {new_misses} 次")
+        print(f"   修改範本後使用中繼資料快取: {new_hits > 0 and new_misses == 0}")
+        
+        # 格式不適用於欄位型別時，在解析範本時就拒絕，而不是在預覽中引發例外
+        for template in ("{size:08d}_{mtime:%Y}", "{size:%Y}", "{name:d}"):
+            try:
+                compile_template(template)
+                print(f"   {template}: 有效")
+            except ValueError:
+                print(f"   {template}: 無效")
+        
+        # 測試內容雜湊
+        print("\n10. 測試內容雜湊...")
+        renamer.clear_rename_rules()
+        renamer.hash_cache = HashCache(os.path.join(tempfile.mkdtemp(), "hash_cache.json"))
+        
+        rule6 = RenameRule()
+        rule6.rule_type = "hash"
+        rule6.hash_algorithm = "sha256"
+        rule6.hash_length = 12
+        renamer.add_rename_rule(rule6)
+        
+        preview = renamer.preview_rename()
+        print("   內容雜湊預覽:")
+        for result in preview[:3]:
+            print(f"     {result['original_name']} → {result['new_name']}")
+        
+        # 清除記憶體快取後再預覽，應由磁碟快取取得
+        renamer.metadata_cache.clear()
+        renamer.preview_rename()
+        stats = renamer.last_preview_stats['hash:sha256']
+        print(f"   重新預覽: 計算 {stats['hashed']} 個, 快取命中率 {stats['cache_hit_rate']:.0%}")
+
+        # 變更未達門檻時不寫檔；重新掃描後移除已刪除檔案的項目
+        cache_file = renamer.hash_cache.cache_file
+        print(f"   變更未達門檻時不寫入快取檔: {not os.path.exists(cache_file)}")
+        renamer.hash_cache.save(force=True)
+        entries = len(renamer.hash_cache._entries)
+        hashed_file = renamer.filtered_files[0]['full_path']
+        with open(hashed_file, 'rb') as f:
+            hashed_content = f.read()
+        os.remove(hashed_file)
+        renamer.refresh_files_list()
+        print(f"   重新掃描後移除已刪除檔案的快取: "
+              f"{len(renamer.hash_cache._entries) == entries - 1}")
+        with open(hashed_file, 'wb') as f:
+            f.write(hashed_content)
+        renamer.refresh_files_list()
+
+        # 取消時不再計算其餘檔案
+        renamer.metadata_cache.clear()
+        renamer.hash_cache = HashCache(os.path.join(tempfile.mkdtemp(), "hash_cache.json"))
+        print(f"   取消時中止預覽: {renamer.preview_rename(should_cancel=lambda: True) is None}")
+        stats = renamer.prefetch_hashes(should_cancel=lambda: True)['hash:sha256']
+        print(f"   取消後計算 {stats['hashed']} 個")
+
+        # 測試拍攝日期
+        print("\n11. 測試拍攝日期...")
+        from benchmark import make_exif_jpeg
+        with open(os.path.join(test_dir, "photo.jpg"), 'wb') as f:
+            f.write(make_exif_jpeg(datetime(2024, 3, 15, 20, 48), 1024))
+        renamer.refresh_files_list()
+        renamer.clear_rename_rules()
+        
+        rule7 = RenameRule()
+        rule7.rule_type = "template"
+        rule7.template = "{media_date:%Y%m%d_%H%M}"
+        renamer.add_rename_rule(rule7)
+        renamer.set_file_filters(['.jpg'])
+        
+        preview = renamer.preview_rename()
+        stats = renamer.last_preview_stats['media_date']
+        for result in preview:
+            print(f"     {result['original_name']} → {result['new_name']}")
+        print(f"   每檔讀取 {stats['bytes_per_file']:.0f} 位元組")
+        
+        # mvhd 的建立時間超出 datetime 範圍時視為沒有日期，不中止預覽
+        import struct
+        mvhd = struct.pack('>I4sB3xQ', 20, b'mvhd', 1, 2**40)  # 約西元 36800 年
+        ftyp = struct.pack('>I4s4sI', 16, b'ftyp', b'isom', 0)
+        with open(os.path.join(test_dir, "broken.mp4"), 'wb') as f:
+            f.write(ftyp + struct.pack('>I4s', 8 + len(mvhd), b'moov') + mvhd)
+        renamer.refresh_files_list()
+        renamer.set_file_filters(['.jpg', '.mp4'])
+        preview = renamer.preview_rename()
+        print(f"   損壞的 MP4: {[result['new_name'] for result in preview if result['original_name'] == 'broken.mp4']}")
+        os.remove(os.path.join(test_dir, "broken.mp4"))
+        
+        # 測試排序方式
+        print("\n12. 測試自然排序...")
+        for name in ["file10.txt", "file2.txt", "file1.txt"]:
+            with open(os.path.join(test_dir, name), 'w', encoding='utf-8') as f:
+                f.write(name)
+        renamer.refresh_files_list()
+        renamer.set_file_filters(['.txt'])
+        renamer.set_sort_order('natural')
+        print(f"   自然排序: {[f['original_name'] for f in renamer.filtered_files if f['original_name'].startswith('file')]}")
+        renamer.set_sort_order('name')
+        
+        # 測試統計指標
+        print("\n13. 測試統計指標...")
+        renamer.metrics = RenameMetrics()
+        renamer.clear_rename_rules()
+        rule8 = RenameRule()
+        rule8.rule_type = "prefix"
+        rule8.prefix = "m_"
+        renamer.add_rename_rule(rule8)
+        renamer.execute_rename(renamer.preview_rename())
+        data = renamer.metrics.snapshot()
+        print(f"   嘗試 {data['attempted']}, 成功 {data['succeeded']}, "
+              f"位元組 {data['bytes']}, 延遲樣本 {data['latency_count']}")
+        metrics_file = os.path.join(test_dir, "metrics.prom")
+        renamer.metrics.export(metrics_file)
+        with open(metrics_file, 'r', encoding='utf-8') as f:
+            print(f"   匯出 {len(f.read().splitlines())} 行 Prometheus 指標")
+        renamer.metrics = None
+        
+        # 測試不覆蓋模式：規劃後才出現的目標檔案不會被覆蓋
+        print("\n14. 測試不覆蓋模式...")
+        source = os.path.join(test_dir, "race_source.txt")
+        target = os.path.join(test_dir, "race_target.txt")
+        with open(source, 'w', encoding='utf-8') as f:
+            f.write("source")
+        chains = plan_moves([(source, target)])
+        with open(target, 'w', encoding='utf-8') as f:
+            f.write("written by another process")
+        result = run_chain(chains[0], no_clobber=True)
+        with open(target, 'r', encoding='utf-8') as f:
+            print(f"   結果: {result[0]}")
+            print(f"   目標內容保留: {f.read() == 'written by another process'}")
+        # 不覆蓋模式的重命名不經過 os 模組，統計時仍要計入
+        os.remove(target)
+        with OsCallCounter() as counter:
+            run_chain(plan_moves([(source, target)])[0], no_clobber=True)
+        print(f"   計入不覆蓋模式的重命名: {counter.counts.get('renameat2', counter.counts.get('link', 0)) == 1}")
+        os.remove(target)
+        
+        # 測試重命名前快照備份
+        print("\n15. 測試快照備份...")
+        renamer.refresh_files_list()
+        renamer.backup_before_rename = True
+        renamer.execute_rename(renamer.preview_rename())
+        stats = renamer.last_backup_stats
+        print(f"   已備份 {stats['backed_up']}/{stats['files']} 個檔案, 方式 {stats['methods']}, "
+              f"實際複製 {stats['bytes_copied']} 位元組")
+        renamer.backup_before_rename = False
+        
+        # 測試自動解決衝突
+        print("\n16. 測試自動解決衝突...")
+        renamer.clear_rename_rules()
+        rule9 = RenameRule()
+        rule9.rule_type = "template"
+        rule9.template = "same"
+        renamer.add_rename_rule(rule9)
+        renamer.auto_resolve_conflicts = True
+        preview = renamer.preview_rename()
+        print(f"   新檔名: {[r['new_name'] for r in preview[:4]]}")
+        print(f"   衝突數量: {sum(r['conflict'] for r in preview)}")
+        renamer.auto_resolve_conflicts = False
+        
+        # 測試檔名驗證規則
+        print("\n17. 測試檔名驗證規則...")
+        names = ["ok.txt", "a:b.txt", "CON.txt", "trailing.", "長" * 100]
+        for profile in ["windows", "posix", "smb"]:
+            reasons = FilenameValidator(profile).check_many(names)
+            print(f"   {profile}: {[r or '有效' for r in reasons]}")
+        
+        # 測試即時預覽（暫定規則與取消）
+        print("\n18. 測試即時預覽...")
+        draft = RenameRule()
+        draft.rule_type = "prefix"
+        draft.prefix = "draft_"
+        preview = renamer.preview_rename([*renamer.rename_rules, draft])
+        print(f"   草稿規則預覽: {[r['new_name'] for r in preview[:2]]}")
+        print(f"   已套用的規則數: {len(renamer.rename_rules)}")
+        print(f"   取消時的結果: {renamer.preview_rename([draft], should_cancel=lambda: True)}")
+        
+        # 測試執行時重用預覽結果
+        print("\n19. 測試重用預覽計畫...")
+        preview = renamer.preview_rename()
+        print(f"   目錄未變動時重用: {renamer.get_execution_plan(preview) is preview}")
+        os.remove(preview[0]['full_path'])
+        plan = renamer.get_execution_plan(preview)
+        print(f"   目錄變動後重新驗證 {renamer.preview_plan['revalidated']} 個項目: "
+              f"{plan[0]['original_name']} → {plan[0]['conflict_reason']}")
+        
+        # 測試個別排除與只處理選取的檔案
+        print("\n20. 測試排除與選取範圍...")
+        renamer.set_file_filters([])
+        paths = [file_info['full_path'] for file_info in renamer.files_list]
+        renamer.exclude_files(paths[:2])
+        print(f"   排除 2 個後: {len(renamer.filtered_files)}/{len(renamer.files_list)}")
+        renamer.include_only(paths[2:4])
+        print(f"   只處理 2 個: {[f['original_name'] for f in renamer.filtered_files]}")
+        renamer.clear_path_filters()
+
+        # 排除檔案後規則快取仍有效，序列編號依剩下的檔案重新計算
+        saved_rules = renamer.rename_rules
+        prefix_rule = RenameRule()
+        prefix_rule.rule_type = "prefix"
+        prefix_rule.prefix = "keep_"
+        sequence_rule = RenameRule()
+        sequence_rule.rule_type = "sequence"
+        renamer.rename_rules = [prefix_rule, sequence_rule]
+        before = renamer.preview_rename()
+        renamer.exclude_files([before[0]['full_path']])
+        state = renamer.snapshot()
+        cached = renamer.compute_new_names(state=state)
+        fresh = renamer.compute_new_names(state=state.replace(rule_cache=None))
+        print(f"   排除後沿用規則快取: {state.rule_cache is not None and state.rule_cache[0] == state.files_generation}, "
+              f"與重新計算相同: {cached == fresh and len(cached) == len(before) - 1}")
+        renamer.clear_path_filters()
+        renamer.rename_rules = saved_rules
+        preview = renamer.preview_rename()
+        success_count, error_count, errors = renamer.execute_rename(preview[:1])
+        print(f"   只執行選取的 1 個項目 - 成功: {success_count}, 失敗: {error_count}")
+        
+        # 測試計畫檔：寫出後分兩次執行（模擬中斷後繼續）
+        print("\n21. 測試計畫檔...")
+        renamer.clear_rename_rules()
+        rule = RenameRule()
+        rule.rule_type = "prefix"
+        rule.prefix = "plan_"
+        renamer.add_rename_rule(rule)
+        plan_path = os.path.join(tempfile.gettempdir(), "bulk_renamer_test_plan.jsonl")
+        stats = renamer.export_plan(plan_path)
+        print(f"   寫入計畫: {stats['operations']} 個操作, {stats['steps']} 個步驟")
+        progress = execute_plan(plan_path, checkpoint_every=1, max_steps=2)
+        print(f"   中斷於第 {progress['steps']}/{progress['total']} 個步驟")
+        progress = execute_plan(plan_path, checkpoint_every=1)
+        print(f"   繼續執行 - 完成: {progress['completed']}, 成功: {progress['succeeded']}, "
+              f"失敗: {progress['failed']}")
+        print(f"   結果: {sorted(os.listdir(test_dir))[:2]}")
+        for suffix in ("", ".progress", ".errors"):
+            os.remove(plan_path + suffix)
+        
+        # 在每個步驟後強制結束行程（不寫入進度），再繼續執行：互換與連鎖重命名都不能被重做或復原
+        if hasattr(os, 'fork'):
+            crash_dir = tempfile.mkdtemp()
+            names = {"a": "A", "b": "B", "x": "X", "y": "Y"}
+            moves = [("a", "b"), ("b", "a"), ("x", "y"), ("y", "z")]
+            moves = [(os.path.join(crash_dir, src), os.path.join(crash_dir, dst)) for src, dst in moves]
+            expected = {"a": "B", "b": "A", "y": "X", "z": "Y"}
+            steps = write_plan(plan_path, crash_dir, moves)['steps']
+            resumed_correctly = []
+            for crash_after in range(steps + 1):
+                for name in os.listdir(crash_dir):
+                    os.remove(os.path.join(crash_dir, name))
+                for name, content in names.items():
+                    with open(os.path.join(crash_dir, name), 'w') as f:
+                        f.write(content)
+                for suffix in (".progress", ".errors"):
+                    if os.path.exists(plan_path + suffix):
+                        os.remove(plan_path + suffix)
+                
+                def crash(step, seconds, crash_after=crash_after):
+                    if step == crash_after:
+                        os._exit(0)
+                pid = os.fork()
+                if pid == 0:
+                    execute_plan(plan_path, checkpoint_every=1000, observer=crash)
+                    os._exit(0)
+                os.waitpid(pid, 0)
+                progress = execute_plan(plan_path, checkpoint_every=1000)
+                contents = {}
+                for name in os.listdir(crash_dir):
+                    with open(os.path.join(crash_dir, name)) as f:
+                        contents[name] = f.read()
+                resumed_correctly.append(contents == expected and progress['failed'] == 0)
+            print(f"   {steps} 個步驟的每個中斷點續跑後結果皆正確: {all(resumed_correctly)}")
+            shutil.rmtree(crash_dir)
+            for suffix in ("", ".progress", ".errors"):
+                if os.path.exists(plan_path + suffix):
+                    os.remove(plan_path + suffix)
+        
+        # 測試常駐服務（本機 Unix socket）
+        print("\n22. 測試常駐服務...")
+        socket_path = os.path.join(tempfile.mkdtemp(), "renamer.sock")
+        daemon = RenameDaemon(socket_path)
+        threading.Thread(target=daemon.serve_forever, daemon=True).start()
+        params = {'directory': test_dir, 'rules': [{'rule_type': 'suffix', 'suffix': '_d'}]}
+        with DaemonClient(socket_path, timeout=10) as client:
+            first = client.call('preview', limit=1, **params)
+            client.call('preview', limit=1, **params)
+            print(f"   預覽: {first['results'][0]['new_name']}, 將變更 {first['changed']} 個")
+            print(f"   常駐的目錄: {client.call('status')['directories'][test_dir]}")
+            result = client.call('execute', **params)
+            print(f"   執行 - 成功: {result['succeeded']}, 失敗: {result['failed']}")
+            undo = client.call('undo', directory=test_dir)
+            print(f"   復原 - 成功: {undo['succeeded']}")
+            # 就地改寫檔案不改變目錄 mtime，仍應以新的大小預覽
+            size_rules = [{'rule_type': 'template', 'template': '{size}_{name}'}]
+            rewritten = client.call('preview', directory=test_dir, rules=size_rules)['results'][0]
+            with open(os.path.join(test_dir, rewritten['original_name']), 'w', encoding='utf-8') as f:
+                f.write("x" * 12345)
+            results = client.call('preview', directory=test_dir, rules=size_rules)['results']
+            new_name = next(result['new_name'] for result in results
+                            if result['original_name'] == rewritten['original_name'])
+            print(f"   就地改寫後使用新的大小: {new_name == '12345_' + rewritten['original_name']}")
+            try:
+                client.call('preview', directory=test_dir,
+                            rules=[{'rule_type': 'hash', 'hash_algorithm': 'md6'}])
+            except DaemonError as e:
+                print(f"   不支援的雜湊演算法視為無效參數: {e.code == INVALID_PARAMS}")
+            client.call('shutdown')
+        daemon.server_close()
+        shutil.rmtree(os.path.dirname(socket_path))
+        
+        # 測試非同步介面
+        print("\n23. 測試非同步介面...")
+        
+        async def run_async():
+            async_renamer = AsyncFileRenamer(renamer, max_blocking=2)
+            await async_renamer.scan()
+            chunks = [len(chunk) async for chunk in async_renamer.preview(chunk_size=8)]
+            print(f"   分段預覽: {chunks}")
+            
+            # 第一段在整個預覽完成（記錄預覽計畫）之前就送達；提前結束時預覽中止
+            version = async_renamer.renamer.preview_version
+            stream = async_renamer.preview(chunk_size=4, max_pending=1)
+            await stream.__anext__()
+            print(f"   第一段在預覽完成前送達: {async_renamer.renamer.preview_version == version}")
+            await stream.aclose()
+            print(f"   提前結束後預覽中止: {async_renamer.renamer.preview_version == version}")
+            
+            task = asyncio.create_task(async_renamer.preview_all())
+            await asyncio.sleep(0)
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                print("   預覽已取消")
+            
+            success_count, error_count, errors = await async_renamer.execute()
+            print(f"   執行 - 成功: {success_count}, 失敗: {error_count}")
+        
+        asyncio.run(run_async())
+        
+        # 測試節流（以模擬的時鐘與延遲，不實際等待）
+        print("\n24. 測試節流...")
+        now = [0.0]
+        waits = []
+        bucket = TokenBucket(100, burst=5, clock=lambda: now[0], sleep=waits.append)
+        for _ in range(10):
+            bucket.acquire()
+        print(f"   令牌桶: 前 5 個不等待, 之後等待 {[round(w * 1000) for w in waits]} ms")
+        controller = AdaptiveConcurrency(target_latency=0.005, window=10, max_limit=32)
+        for _ in range(40):
+            # 模擬容量為 4 的儲存裝置：同時操作數超過 4 時延遲等比例增加
+            for _ in range(10):
+                controller.acquire()
+                controller.release(0.002 * max(1.0, controller.limit / 4))
+        print(f"   自適應同時操作數: {controller.limits[:8]}… 最後為 {controller.limit}")
+        
+        # 測試移動模式（/dev/shm 通常是另一個檔案系統）
+        print("\n25. 測試移動到其他目錄...")
+        target_dir = tempfile.mkdtemp(dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+        renamer.clear_rename_rules()
+        renamer.set_target_directory(target_dir)
+        print(f"   跨檔案系統: {renamer.is_cross_device()}")
+        preview = renamer.preview_rename()
+        success_count, error_count, errors = renamer.execute_rename(preview[:3])
+        print(f"   移動 - 成功: {success_count}, 失敗: {error_count}, 目標: {sorted(os.listdir(target_dir))}")
+        success_count, error_count, errors = renamer.undo_operation(len(renamer.history) - 1)
+        print(f"   復原 - 成功: {success_count}, 目標目錄剩餘: {os.listdir(target_dir)}")
+        renamer.set_target_directory(None)
+        
+        copy_source = os.path.join(test_dir, renamer.files_list[0]['original_name'])
+        copy_target = os.path.join(target_dir, "copied.bin")
+        move_across_devices(copy_source, copy_target, verify_hash=True)
+        print(f"   複製後刪除來源: {os.path.exists(copy_target)} / {os.path.exists(copy_source)}")
+        move_across_devices(copy_target, copy_source)
+        shutil.rmtree(target_dir)
+        
+        # 測試依 inode 順序排列操作鏈（鏈內的相依順序不變）
+        print("\n26. 測試依 inode 順序執行...")
+        moves = [("/d/c", "/d/x"), ("/d/a", "/d/b"), ("/d/b", "/d/a"), ("/e/z", "/e/y")]
+        snapshot = {"/d": {"a": 30, "b": 20, "c": 10}, "/e": {"z": 5}}
+        ordered = order_chains(plan_moves(moves), snapshot)
+        print(f"   各操作鏈的第一個來源: {[os.path.basename(chain[0][0]) for chain in ordered]}")
+        print(f"   循環內的步驟數: {[len(chain) for chain in ordered]}")
+        
+        # 測試耐久性模式：batch 每 sync_every 個操作 fsync 一次目錄，strict 每個操作都 fsync
+        print("\n27. 測試耐久性模式...")
+        for mode in ('batch', 'strict'):
+            renamer.durability = mode
+            renamer.sync_every = 2
+            rule = RenameRule()
+            rule.rule_type = "prefix"
+            rule.prefix = f"{mode}_"
+            renamer.add_rename_rule(rule)
+            success_count, error_count, errors = renamer.execute_rename(renamer.preview_rename()[:3])
+            print(f"   {mode} - 成功: {success_count}, fsync 次數: {renamer.last_sync_stats['syncs']}, "
+                  f"已寫入磁碟: {renamer.history[-1]['committed']}")
+            renamer.undo_operation(len(renamer.history) - 1)
+            renamer.clear_rename_rules()
+        renamer.durability = 'none'
+        print(f"   未同步時 committed: {DirectorySync('none').committed}")
+        
+        # 測試狀態快照：背景預覽使用開始時的快照，不受之後修改規則與過濾條件影響
+        print("\n28. 測試狀態快照...")
+        rule = RenameRule()
+        rule.rule_type = "prefix"
+        rule.prefix = "snap_"
+        renamer.add_rename_rule(rule)
+        state = renamer.snapshot()
+        renamer.set_file_filters(['.txt'])
+        renamer.clear_rename_rules()
+        current = renamer.preview_rename()
+        stale = renamer.preview_rename(state=state)
+        print(f"   舊快照: {len(stale)} 個檔案, 皆加上前綴: "
+              f"{all(result['new_name'].startswith('snap_') for result in stale)}")
+        print(f"   目前: {len(current)} 個檔案, 已前進 {renamer.snapshot().generation - state.generation} 個版本")
+        print(f"   最近一次預覽仍是較新快照的結果: {renamer.preview_plan['results'] is current}")
+        try:
+            state.rules = ()
+        except AttributeError:
+            print("   快照不可修改")
+        # 歷史與規則快取也在快照中，更新時不使進行中的預覽過期
+        generation = renamer.snapshot().generation
+        history = renamer.history
+        renamer.history = history + ({'timestamp': datetime.now(), 'operations': [],
+                                      'directory': test_dir},)
+        renamer.preview_rename()
+        print(f"   更新歷史與規則快取不改變版本: {renamer.snapshot().generation == generation}")
+        print(f"   舊快照的歷史不變: {state.history == history != renamer.history}")
+        renamer.history = history
+        
+        def preview_loop(stop, sizes):
+            while not stop.is_set():
+                snapshot = renamer.snapshot()
+                preview = renamer.preview_rename(state=snapshot)
+                sizes.append(len(preview) == len(snapshot.filtered))
+        stop, sizes = threading.Event(), []
+        worker = threading.Thread(target=preview_loop, args=(stop, sizes))
+        worker.start()
+        for i in range(50):
+            renamer.add_rename_rule(rule)
+            renamer.set_file_filters(['.txt'] if i % 2 else [])
+            renamer.clear_rename_rules()
+        stop.set()
+        worker.join()
+        print(f"   同時修改時的背景預覽皆一致: {all(sizes)}")
+        renamer.set_file_filters([])
+        
         print("\n✅ 所有功能測試完成!")
         
     except Exception as e: